@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import hmac
+import time
+import logging
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+from pyftpdlib.authorizers import AuthenticationFailed, DummyAuthorizer
+
+# 密码哈希格式:
+#   pbkdf2_sha256$<迭代次数>$<盐(base64)>$<哈希(base64)>
+#   scrypt$<n>$<r>$<p>$<盐(base64)>$<哈希(base64)>
+# 不带以上前缀的密码视为旧版本users.json中的明文密码
+PBKDF2_SCHEME = "pbkdf2_sha256"
+SCRYPT_SCHEME = "scrypt"
+PBKDF2_ITERATIONS = 100000
+SCRYPT_PARAMS = (16384, 8, 1)
+SALT_SIZE = 16
+
+
+def _b64encode(data):
+    return base64.b64encode(data).decode("ascii")
+
+
+def _b64decode(text):
+    return base64.b64decode(text.encode("ascii"))
+
+
+def hash_password(password, scheme=PBKDF2_SCHEME, iterations=PBKDF2_ITERATIONS):
+    """生成带随机盐的密码哈希字符串"""
+    salt = os.urandom(SALT_SIZE)
+    if scheme == PBKDF2_SCHEME:
+        digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+        return f"{PBKDF2_SCHEME}${iterations}${_b64encode(salt)}${_b64encode(digest)}"
+    if scheme == SCRYPT_SCHEME:
+        n, r, p = SCRYPT_PARAMS
+        digest = hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p)
+        return f"{SCRYPT_SCHEME}${n}${r}${p}${_b64encode(salt)}${_b64encode(digest)}"
+    raise ValueError(f"不支持的密码哈希算法: {scheme}")
+
+
+def is_password_hash(value):
+    """判断字符串是否为本模块生成的密码哈希"""
+    return isinstance(value, str) and value.startswith((PBKDF2_SCHEME + "$", SCRYPT_SCHEME + "$"))
+
+
+def parse_password_hash(value):
+    """解析密码哈希字符串，返回 (算法, 参数元组, 盐, 哈希)，格式无效时抛出ValueError"""
+    parts = value.split("$")
+    if parts[0] == PBKDF2_SCHEME and len(parts) == 4:
+        params = (int(parts[1]),)
+    elif parts[0] == SCRYPT_SCHEME and len(parts) == 6:
+        params = (int(parts[1]), int(parts[2]), int(parts[3]))
+        if params[0] < 2 or params[0] & (params[0] - 1):
+            raise ValueError("scrypt的n必须是大于1的2的幂")
+    else:
+        raise ValueError("无法识别的密码哈希格式")
+    if min(params) < 1:
+        raise ValueError("密码哈希参数必须是正整数")
+    salt, digest = _b64decode(parts[-2]), _b64decode(parts[-1])
+    if not salt or not digest:
+        raise ValueError("密码哈希的盐和哈希值不能为空")
+    return parts[0], params, salt, digest
+
+
+def verify_password(password, stored):
+    """校验密码是否与存储的哈希（或旧版明文密码）匹配"""
+    if not is_password_hash(stored):
+        # 兼容旧版本的明文密码
+        return hmac.compare_digest(str(stored).encode("utf-8"), password.encode("utf-8"))
+    try:
+        scheme, params, salt, expected = parse_password_hash(stored)
+        if scheme == PBKDF2_SCHEME:
+            digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, params[0])
+        else:
+            n, r, p = params
+            digest = hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+                                    dklen=len(expected))
+    except ValueError:
+        return False
+    return hmac.compare_digest(digest, expected)
+
+
+class HashedAuthorizer(DummyAuthorizer):
+    """支持加盐哈希密码的认证器
+
+    用户以用户名为键保存在字典索引中，可在服务器运行期间增删改。
+    成功的验证结果保存在一个LRU缓存里，同一客户端频繁重连时
+    无需再次计算代价较高的密码哈希。
+    """
+
+    def __init__(self, cache_size=1024):
+        DummyAuthorizer.__init__(self)
+        self.cache_size = cache_size
+        self._lock = threading.RLock()
+        self._verified = OrderedDict()
+        # 缓存键使用进程内随机密钥做HMAC，内存中不保留明文密码
+        self._cache_key = os.urandom(32)
+
+    def add_user(self, username, password, homedir, perm="elr",
+                 msg_login="Login successful.", msg_quit="Goodbye."):
+        """添加用户，password可以是哈希字符串或旧版明文密码"""
+        with self._lock:
+            DummyAuthorizer.add_user(self, username, password, homedir, perm,
+                                     msg_login, msg_quit)
+
+    def update_user(self, username, password=None, homedir=None, perm=None):
+        """更新已存在用户的密码、主目录或权限"""
+        with self._lock:
+            if not self.has_user(username):
+                raise ValueError(f"用户不存在: {username}")
+            entry = dict(self.user_table[username])
+            if password is not None:
+                entry["pwd"] = str(password)
+            if homedir is not None:
+                if not os.path.isdir(homedir):
+                    raise ValueError(f"目录不存在: {homedir}")
+                entry["home"] = os.path.realpath(homedir)
+            if perm is not None:
+                self._check_permissions(username, perm)
+                entry["perm"] = perm
+            # 整体替换条目，其他线程不会读到更新了一半的数据
+            self.user_table[username] = entry
+            self._forget(username)
+
+    def remove_user(self, username):
+        """删除用户"""
+        with self._lock:
+            DummyAuthorizer.remove_user(self, username)
+            self._forget(username)
+
+    def validate_authentication(self, username, password, handler):
+        """校验用户名和密码，失败时抛出AuthenticationFailed"""
+        entry = self.user_table.get(username)
+        if entry is None:
+            if username == "anonymous":
+                raise AuthenticationFailed("Anonymous access not allowed.")
+            raise AuthenticationFailed("Authentication failed.")
+        if username == "anonymous":
+            return
+
+        stored = entry["pwd"]
+        key = (username, hmac.new(self._cache_key, password.encode("utf-8"), hashlib.sha256).digest())
+        with self._lock:
+            if self._verified.get(key) == stored:
+                self._verified.move_to_end(key)
+                return
+
+        if not verify_password(password, stored):
+            raise AuthenticationFailed("Authentication failed.")
+
+        with self._lock:
+            self._verified[key] = stored
+            self._verified.move_to_end(key)
+            while len(self._verified) > self.cache_size:
+                self._verified.popitem(last=False)
+
+    def has_perm(self, username, perm, path=None):
+        """用户在会话期间被删除时视为没有任何权限"""
+        if not self.has_user(username):
+            return False
+        return DummyAuthorizer.has_perm(self, username, perm, path)
+
+    def forget_user(self, username=None):
+        """用户在外部存储中被修改后调用，丢弃缓存的用户信息和验证结果
+
+        username为None时丢弃全部缓存。
+        """
+        with self._lock:
+            if isinstance(self.user_table, LazyUserTable):
+                self.user_table.invalidate(username)
+            if username is None:
+                self._verified.clear()
+            else:
+                self._forget(username)
+
+    def _forget(self, username):
+        """清除某个用户的验证缓存"""
+        for key in [k for k in self._verified if k[0] == username]:
+            del self._verified[key]
+
+
+def user_entry(user):
+    """把用户存储中的用户字典转换为认证器用户表中的条目"""
+    return {
+        "pwd": str(user["password"]),
+        "home": os.path.realpath(user["directory"]),
+        "perm": user.get("permissions", "elradfmwMT"),
+        "operms": {},
+        "msg_login": "Login successful.",
+        "msg_quit": "Goodbye.",
+    }
+
+
+class LazyUserTable(MutableMapping):
+    """按需从用户存储读取的认证器用户表
+
+    用户第一次登录（或被查询）时才通过loader读取，读取结果缓存ttl秒，
+    缓存最多保留cache_size个用户。多进程引擎下其他进程对用户的修改最迟ttl秒后生效。
+    迭代和len()只包括当前缓存中的用户。
+
+    参数:
+        loader: loader(username) 返回用户字典，不存在时返回None
+    """
+
+    def __init__(self, loader, cache_size=10000, ttl=60):
+        self.loader = loader
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+
+    def __getitem__(self, username):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(username)
+            if cached is not None and now - cached[1] < self.ttl:
+                self._cache.move_to_end(username)
+                return cached[0]
+        try:
+            user = self.loader(username)
+        except Exception as e:
+            # 存储不可用时按用户不存在处理，登录失败而不是断开连接
+            logging.getLogger("FTPServer.Auth").error(f"读取用户 {username} 失败: {str(e)}")
+            raise KeyError(username)
+        if user is None:
+            with self._lock:
+                self._cache.pop(username, None)
+            raise KeyError(username)
+        entry = user_entry(user)
+        self[username] = entry
+        return entry
+
+    def __setitem__(self, username, entry):
+        with self._lock:
+            self._cache[username] = (entry, time.monotonic())
+            self._cache.move_to_end(username)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def __delitem__(self, username):
+        with self._lock:
+            del self._cache[username]
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._cache))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._cache)
+
+    def invalidate(self, username=None):
+        """丢弃缓存的用户，username为None时丢弃全部"""
+        with self._lock:
+            if username is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(username, None)
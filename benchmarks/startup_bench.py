@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+启动时间基准测试：比较无界面入口 (python -m ftpserver serve) 和图形界面入口的启动开销
+
+    python benchmarks/startup_bench.py --runs 5
+
+每一项都在全新的Python子进程中测量，结果以JSON格式输出:
+  - import_headless: 导入 cli 模块（服务器 + 命令行）所需时间
+  - import_gui:      导入 main 模块（tkinter + gui + 服务器）所需时间
+  - serve_ready:     启动 `python -m ftpserver serve` 到可以收到220欢迎信息的时间
+  - gui_ready:       创建主窗口并完成第一次绘制的时间（需要图形显示环境）
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+IMPORT_SNIPPET = (
+    "import sys, time; t = time.perf_counter(); import {module}; "
+    "print(time.perf_counter() - t); "
+    "print(int('tkinter' in sys.modules))"
+)
+
+GUI_SNIPPET = (
+    "import time; t = time.perf_counter(); import tkinter as tk; "
+    "from gui import FTPServerGUI; root = tk.Tk(); app = FTPServerGUI(root); "
+    "root.update(); print(time.perf_counter() - t); root.destroy()"
+)
+
+
+def _env():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = PROJECT_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _make_workdir(port):
+    """创建带有临时配置的工作目录"""
+    workdir = tempfile.mkdtemp(prefix="ftpbench-")
+    os.makedirs(os.path.join(workdir, "config"))
+    home = os.path.join(workdir, "home")
+    os.makedirs(home)
+    with open(os.path.join(workdir, "config", "settings.json"), "w") as f:
+        json.dump({
+            "port": port,
+            "max_connections": 256,
+            "max_conn_per_ip": 5,
+            "address": "127.0.0.1",
+            "passive_ports": "60000-60100"
+        }, f)
+    with open(os.path.join(workdir, "config", "users.json"), "w") as f:
+        json.dump([{"username": "bench", "password": "bench",
+                    "directory": home, "permissions": "elr"}], f)
+    return workdir
+
+
+def measure_import(module):
+    """在子进程中测量导入模块的耗时，返回 (秒, 是否导入了tkinter)"""
+    out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET.format(module=module)],
+                         cwd=PROJECT_DIR, env=_env(), capture_output=True, text=True, check=True)
+    elapsed, has_tk = out.stdout.split()
+    return float(elapsed), bool(int(has_tk))
+
+
+def measure_serve_ready(timeout=30):
+    """测量从启动无界面进程到服务器返回220欢迎信息的时间"""
+    port = _free_port()
+    workdir = _make_workdir(port)
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "ftpserver", "serve"], cwd=workdir,
+                            env=_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with socket.create_connection(("127.0.0.1", port), timeout=1) as s:
+                    if s.recv(64).startswith(b"220"):
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.005)
+        raise RuntimeError("服务器在超时时间内没有就绪")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def measure_gui_ready():
+    """测量创建GUI主窗口的时间，没有图形显示环境时返回None"""
+    workdir = _make_workdir(_free_port())
+    try:
+        out = subprocess.run([sys.executable, "-c", GUI_SNIPPET], cwd=workdir, env=_env(),
+                             capture_output=True, text=True)
+        if out.returncode != 0:
+            return None
+        return float(out.stdout.split()[-1])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def summarize(samples):
+    samples = [s for s in samples if s is not None]
+    if not samples:
+        return None
+    return {
+        "median_ms": round(statistics.median(samples) * 1000, 2),
+        "min_ms": round(min(samples) * 1000, 2),
+        "max_ms": round(max(samples) * 1000, 2),
+        "runs": len(samples)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="FTP服务器启动时间基准测试")
+    parser.add_argument("--runs", type=int, default=5, help="每项测量的重复次数")
+    args = parser.parse_args(argv)
+
+    headless, gui = [], []
+    headless_tk = gui_tk = False
+    for _ in range(args.runs):
+        elapsed, headless_tk = measure_import("cli")
+        headless.append(elapsed)
+        elapsed, gui_tk = measure_import("main")
+        gui.append(elapsed)
+
+    result = {
+        "python": sys.version.split()[0],
+        "import_headless": dict(summarize(headless), imports_tkinter=headless_tk),
+        "import_gui": dict(summarize(gui), imports_tkinter=gui_tk),
+        "serve_ready": summarize([measure_serve_ready() for _ in range(args.runs)]),
+        "gui_ready": summarize([measure_gui_ready() for _ in range(args.runs)])
+    }
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,471 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+传输性能基准测试：在回环地址上启动 FTPServerManager，用多个并发ftplib客户端测量
+不同服务配置下的吞吐量、延迟和服务器CPU开销
+
+    python benchmarks/transfer_bench.py --clients 8 --sizes 64K,1M,16M
+    python benchmarks/transfer_bench.py --configs async,sendfile --output result.json
+
+服务器运行在单独的子进程中（使用临时配置目录），这样客户端线程不会影响服务器的CPU统计；
+多进程引擎下工作进程的CPU时间在被回收后计入 children_user / children_system。
+
+测试项目:
+  - retr_<大小> / stor_<大小>: 每个客户端在已登录的会话上重复下载/上传指定大小的文件
+  - list:  对包含大量文件的目录执行LIST
+  - login: 登录风暴，每次都新建连接、登录并退出（tls配置下包括完整的TLS握手）
+  - data_conn: 在已登录的会话上反复打开数据连接下载一个空文件，测量建立数据连接的开销；
+    tls配置下数据连接恢复控制连接的TLS会话，data_conn_full 则每次都做完整握手
+
+每一项报告吞吐量、p50/p99延迟，以及服务器每MB（或每次操作）消耗的CPU时间，结果以JSON格式输出。
+同时运行了 async 和 tls 配置时，tls_cost 列出TLS相对明文的延迟、吞吐量和CPU开销倍数。
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import ftplib
+import socket
+import ssl
+import argparse
+import tempfile
+import threading
+import subprocess
+
+PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, PROJECT_DIR)
+
+# 参与比较的服务配置: 名称 -> settings.json 中需要覆盖的项
+CONFIGS = {
+    "async": {"engine": "async", "transfer": {"use_sendfile": False}},
+    "sendfile": {"engine": "async", "transfer": {"use_sendfile": True}},
+    "threaded": {"engine": "threaded", "transfer": {"use_sendfile": True}},
+    "multiprocess": {"engine": "multiprocess", "transfer": {"use_sendfile": True}},
+    # FTPS: 控制和数据连接都加密（PROT P），证书在临时配置目录中生成
+    "tls": {"engine": "async", "transfer": {"use_sendfile": True}, "tls": {"enabled": True}},
+}
+
+USERNAME = "bench"
+PASSWORD = "bench"
+
+
+def parse_size(text):
+    """把 64K / 1M / 1G 这样的大小转换为字节数"""
+    text = text.strip().upper()
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def size_label(size):
+    for unit, factor in (("G", 1024 ** 3), ("M", 1024 ** 2), ("K", 1024)):
+        if size >= factor and size % factor == 0:
+            return f"{size // factor}{unit}"
+    return str(size)
+
+
+def percentile(samples, pct):
+    """最近秩法计算百分位数"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# --- 服务器子进程
+
+def make_workdir(port, overrides, sizes, list_files):
+    """创建临时配置、用户目录和测试文件"""
+    from authorizer import hash_password
+
+    workdir = tempfile.mkdtemp(prefix="ftpbench-")
+    config_dir = os.path.join(workdir, "config")
+    home = os.path.join(workdir, "home")
+    os.makedirs(config_dir)
+    os.makedirs(os.path.join(home, "upload"))
+    os.makedirs(os.path.join(home, "listing"))
+
+    settings = {
+        "port": port,
+        "max_connections": 4096,
+        "max_conn_per_ip": 4096,
+        "address": "127.0.0.1",
+        "snapshot_interval": 0.1,
+        "log_level": "WARNING",
+    }
+    settings.update(overrides)
+    if settings.get("tls", {}).get("enabled"):
+        try:
+            from ftps import generate_self_signed_cert
+            generate_self_signed_cert(os.path.join(config_dir, "cert.pem"),
+                                      os.path.join(config_dir, "key.pem"), "127.0.0.1")
+        except ImportError as e:
+            shutil.rmtree(workdir, ignore_errors=True)
+            raise RuntimeError(f"FTPS需要安装pyOpenSSL: {str(e)}")
+        settings["tls"] = dict(settings["tls"], certfile=os.path.join(config_dir, "cert.pem"),
+                               keyfile=os.path.join(config_dir, "key.pem"))
+    with open(os.path.join(config_dir, "settings.json"), "w") as f:
+        json.dump(settings, f)
+    with open(os.path.join(config_dir, "users.json"), "w") as f:
+        json.dump([{"username": USERNAME, "password": hash_password(PASSWORD),
+                    "directory": home, "permissions": "elradfmwMT"}], f)
+
+    chunk = os.urandom(1024 * 1024)
+    for size in sizes:
+        with open(os.path.join(home, f"file_{size}.bin"), "wb") as f:
+            remaining = size
+            while remaining > 0:
+                f.write(chunk[:min(remaining, len(chunk))])
+                remaining -= len(chunk)
+    listing = os.path.join(home, "listing")
+    for i in range(list_files):
+        open(os.path.join(listing, f"entry_{i:06d}.txt"), "w").close()
+    open(os.path.join(home, "empty.bin"), "w").close()
+    return workdir
+
+
+def serve(workdir):
+    """子进程入口: 启动服务器，然后按标准输入的指令报告CPU时间或退出"""
+    import logging
+    logging.basicConfig(level=logging.WARNING)
+    os.chdir(workdir)
+    from server import FTPServerManager
+
+    manager = FTPServerManager("config/settings.json", "config/users.json")
+    ok, message = manager.start_server()
+    if not ok:
+        print(json.dumps({"error": message}), flush=True)
+        return 1
+    print(json.dumps({"ready": True}), flush=True)
+
+    # 多进程引擎在fork时会关闭子进程的sys.stdin，如果主线程正阻塞在sys.stdin上读取，
+    # 子进程会卡在已被持有的缓冲区锁上，所以从复制出的文件描述符读取指令
+    commands = os.fdopen(os.dup(sys.stdin.fileno()), "r")
+    for line in commands:
+        command = line.strip()
+        if command == "cpu":
+            # 等所有会话结束，多进程引擎下工作进程被回收后才能统计到它们的CPU时间
+            deadline = time.monotonic() + 10
+            while manager.get_server_status()["connections"] and time.monotonic() < deadline:
+                time.sleep(0.05)
+            t = os.times()
+            print(json.dumps({"cpu": t.user + t.system + t.children_user + t.children_system}),
+                  flush=True)
+        elif command == "quit":
+            break
+    manager.stop_server()
+    return 0
+
+
+class ServerProcess:
+    """在子进程中运行的被测服务器"""
+
+    def __init__(self, name, overrides, sizes, list_files):
+        self.name = name
+        self.port = _free_port()
+        self.workdir = make_workdir(self.port, overrides, sizes, list_files)
+        self.secure = bool(overrides.get("tls", {}).get("enabled"))
+        env = dict(os.environ)
+        env["PYTHONPATH"] = PROJECT_DIR + os.pathsep + env.get("PYTHONPATH", "")
+        self.proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", self.workdir],
+                                     stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env, text=True)
+        reply = self._read()
+        if not reply.get("ready"):
+            self.close()
+            raise RuntimeError(f"{name}: 服务器启动失败: {reply.get('error')}")
+
+    def _read(self):
+        line = self.proc.stdout.readline()
+        if not line:
+            raise RuntimeError(f"{self.name}: 服务器进程意外退出")
+        return json.loads(line)
+
+    def connect(self, reuse_session=True):
+        """建立一个已登录的客户端会话，tls配置下加密控制连接和数据连接"""
+        if not self.secure:
+            return connect(self.port)
+        context = ssl.create_default_context(cafile=os.path.join(self.workdir, "config", "cert.pem"))
+        ftp = ReusingFTP_TLS(context=context) if reuse_session else ftplib.FTP_TLS(context=context)
+        ftp.connect("127.0.0.1", self.port, timeout=60)
+        ftp.login(USERNAME, PASSWORD)
+        ftp.prot_p()
+        return ftp
+
+    def cpu_time(self):
+        self.proc.stdin.write("cpu\n")
+        self.proc.stdin.flush()
+        return self._read()["cpu"]
+
+    def close(self):
+        try:
+            if self.proc.poll() is None:
+                self.proc.stdin.write("quit\n")
+                self.proc.stdin.flush()
+                self.proc.wait(timeout=15)
+        except (OSError, subprocess.TimeoutExpired):
+            self.proc.kill()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+# --- 客户端
+
+def connect(port):
+    ftp = ftplib.FTP()
+    ftp.connect("127.0.0.1", port, timeout=60)
+    ftp.login(USERNAME, PASSWORD)
+    return ftp
+
+
+class ReusingFTP_TLS(ftplib.FTP_TLS):
+    """数据连接恢复控制连接TLS会话的客户端（ftplib默认每个数据连接都做完整握手）"""
+
+    def ntransfercmd(self, cmd, rest=None):
+        conn, size = ftplib.FTP.ntransfercmd(self, cmd, rest)
+        if self._prot_p:
+            conn = self.context.wrap_socket(conn, server_hostname=self.host,
+                                            session=self.sock.session)
+        return conn, size
+
+
+def run_clients(clients, operation, iterations, connect_session, login=True):
+    """启动多个客户端线程并发执行operation，返回 (每次操作的耗时列表, 墙钟时间, 错误数)
+
+    operation(ftp, client_index, iteration) 在 connect_session() 返回的已登录会话上执行一次操作；
+    login为False时operation自己建立连接，ftp参数为None。
+    """
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(clients + 1)
+
+    def worker(index):
+        ftp = None
+        local = []
+        try:
+            if login:
+                ftp = connect_session()
+        except (OSError, ftplib.Error) as e:
+            errors.append(str(e))
+        try:
+            barrier.wait()
+        except threading.BrokenBarrierError:
+            return
+        try:
+            if login and ftp is None:
+                return
+            for i in range(iterations):
+                started = time.perf_counter()
+                try:
+                    operation(ftp, index, i)
+                except (OSError, ftplib.Error, EOFError) as e:
+                    errors.append(str(e))
+                    continue
+                local.append(time.perf_counter() - started)
+        finally:
+            if ftp is not None:
+                try:
+                    ftp.quit()
+                except (OSError, ftplib.Error, EOFError):
+                    ftp.close()
+            with lock:
+                latencies.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for t in threads:
+        t.join()
+    return latencies, time.perf_counter() - started, len(errors)
+
+
+def summarize(latencies, wall, errors, cpu, total_bytes=None):
+    result = {
+        "ops": len(latencies),
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "ops_per_s": round(len(latencies) / wall, 1) if wall else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+        "server_cpu_s": round(cpu, 3),
+    }
+    if total_bytes is not None:
+        mb = total_bytes / (1024 * 1024)
+        result["throughput_mb_s"] = round(mb / wall, 1) if wall else None
+        result["cpu_ms_per_mb"] = round(cpu * 1000 / mb, 3) if mb else None
+    else:
+        result["cpu_ms_per_op"] = round(cpu * 1000 / len(latencies), 3) if latencies else None
+    return result
+
+
+def measure(server, clients, operation, iterations, total_bytes_per_op=None, login=True,
+            reuse_session=True):
+    """执行一个测试项目并统计服务器CPU时间"""
+    cpu_before = server.cpu_time()
+    latencies, wall, errors = run_clients(clients, operation, iterations,
+                                          lambda: server.connect(reuse_session), login)
+    cpu = server.cpu_time() - cpu_before
+    total_bytes = None if total_bytes_per_op is None else total_bytes_per_op * len(latencies)
+    return summarize(latencies, wall, errors, cpu, total_bytes)
+
+
+def bench_config(name, overrides, args, sizes):
+    """对一种服务配置执行全部测试项目"""
+    server = ServerProcess(name, overrides, sizes, args.list_files)
+    results = {}
+    try:
+        for size in sizes:
+            iterations = max(1, min(args.iterations, (args.max_bytes // size) // args.clients))
+            label = size_label(size)
+
+            def retr(ftp, index, i, size=size):
+                ftp.retrbinary(f"RETR file_{size}.bin", _discard, blocksize=65536)
+
+            payload = os.urandom(min(size, 1024 * 1024))
+
+            def stor(ftp, index, i, size=size):
+                source = _RepeatingReader(payload, size)
+                ftp.storbinary(f"STOR upload/c{index}_{i % 2}.bin", source, blocksize=65536)
+
+            results[f"retr_{label}"] = measure(server, args.clients, retr, iterations, size)
+            results[f"stor_{label}"] = measure(server, args.clients, stor, iterations, size)
+
+        def list_dir(ftp, index, i):
+            ftp.retrlines("LIST listing", lambda line: None)
+
+        results["list"] = measure(server, args.clients, list_dir, args.list_iterations)
+
+        def open_data_connection(ftp, index, i):
+            ftp.retrbinary("RETR empty.bin", _discard)
+
+        results["data_conn"] = measure(server, args.clients, open_data_connection,
+                                       args.list_iterations * 10)
+        if server.secure:
+            results["data_conn_full"] = measure(server, args.clients, open_data_connection,
+                                                args.list_iterations * 10, reuse_session=False)
+
+        def login_storm(ftp, index, i):
+            session = server.connect()
+            session.quit()
+
+        per_client = max(1, args.logins // args.clients)
+        results["login"] = measure(server, args.clients, login_storm, per_client, login=False)
+    finally:
+        server.close()
+    return results
+
+
+def _discard(data):
+    pass
+
+
+class _RepeatingReader(io.RawIOBase):
+    """重复给定数据直到达到指定长度的只读流，上传大文件时不必占用同样大小的内存"""
+
+    def __init__(self, data, size):
+        self.data = data
+        self.remaining = size
+
+    def readable(self):
+        return True
+
+    def read(self, n=-1):
+        if self.remaining <= 0:
+            return b""
+        n = self.remaining if n is None or n < 0 else min(n, self.remaining)
+        n = min(n, len(self.data))
+        self.remaining -= n
+        return self.data[:n]
+
+
+def compare(results):
+    """按测试项目汇总各配置的吞吐量（文件传输）或每秒操作数（LIST/登录）"""
+    comparison = {}
+    for config, items in results.items():
+        if "error" in items:
+            continue
+        for item, data in items.items():
+            key = "throughput_mb_s" if "throughput_mb_s" in data else "ops_per_s"
+            comparison.setdefault(item, {})[config] = data[key]
+    return comparison
+
+
+def tls_cost(results, plain="async", secure="tls"):
+    """TLS相对明文的开销倍数: 延迟(p50)、吞吐量和服务器CPU时间"""
+    if "error" in results.get(plain, {"error": None}) or "error" in results.get(secure, {"error": None}):
+        return {}
+    cost = {}
+    for item, tls_data in results[secure].items():
+        plain_data = results[plain].get(item.replace("data_conn_full", "data_conn"))
+        if plain_data is None:
+            continue
+        entry = {}
+        for key in ("p50_ms", "throughput_mb_s", "cpu_ms_per_mb", "cpu_ms_per_op"):
+            if tls_data.get(key) and plain_data.get(key):
+                entry[key] = round(tls_data[key] / plain_data[key], 2)
+        cost[item] = entry
+    return cost
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="FTP服务器传输性能基准测试")
+    parser.add_argument("--clients", type=int, default=8, help="并发客户端数")
+    parser.add_argument("--sizes", default="64K,1M,16M", help="RETR/STOR的文件大小，逗号分隔")
+    parser.add_argument("--iterations", type=int, default=20, help="每个客户端每项的最多重复次数")
+    parser.add_argument("--max-bytes", type=parse_size, default=parse_size("512M"),
+                        help="每个传输项目最多传输的总字节数，用于限制大文件的重复次数")
+    parser.add_argument("--list-files", type=int, default=5000, help="LIST测试目录中的文件数")
+    parser.add_argument("--list-iterations", type=int, default=5, help="每个客户端的LIST次数")
+    parser.add_argument("--logins", type=int, default=400, help="登录风暴的总登录次数")
+    parser.add_argument("--configs", default=",".join(CONFIGS),
+                        help=f"参与比较的服务配置，可选: {', '.join(CONFIGS)}")
+    parser.add_argument("--output", help="把JSON结果同时写入文件")
+    parser.add_argument("--serve", metavar="WORKDIR", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        return serve(args.serve)
+
+    sizes = [parse_size(s) for s in args.sizes.split(",") if s.strip()]
+    results = {}
+    for name in [c.strip() for c in args.configs.split(",") if c.strip()]:
+        if name not in CONFIGS:
+            parser.error(f"未知的服务配置: {name}")
+        try:
+            results[name] = bench_config(name, CONFIGS[name], args, sizes)
+        except RuntimeError as e:
+            # 例如在Windows上没有多进程引擎
+            results[name] = {"error": str(e)}
+
+    report = {
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "cpu_count": os.cpu_count(),
+        "clients": args.clients,
+        "results": results,
+        "comparison": compare(results),
+        "tls_cost": tls_cost(results),
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,430 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+带缓存的文件系统
+pyftpdlib 默认的 LIST/MLSD 每次都先用 os.listdir() 读出全部文件名，再对每个条目调用一次stat。
+CachedFS 改为用 os.scandir() 一次读出文件名和stat结果，记入所有会话共享的目录缓存，
+下次列出同一目录时直接使用缓存。目录项默认按名称排序，与NLST和pyftpdlib的默认行为一致；
+sort 为False时不排序，边扫描边按文件系统返回的顺序输出，大目录不必等待全部读完。
+
+缓存失效:
+  - 目录的mtime或inode变化时（新建、删除、重命名条目）
+  - Linux上可用inotify时，目录中的文件被修改、属性变化时立即失效
+  - 没有inotify时，缓存超过 ttl 秒后重新读取（目录mtime无法反映文件内容的修改）
+  - 通过本服务器进行的上传、删除、重命名等操作会立即使相关目录失效
+缓存按最近最少使用的顺序淘汰，总大小（估算）不超过 max_bytes。
+"""
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import logging
+import threading
+from collections import OrderedDict
+
+from pyftpdlib.filesystems import AbstractedFS
+
+# 每个缓存条目的估算开销（stat结果、字典和列表槽位），再加上文件名长度
+ENTRY_OVERHEAD = 300
+# 目录在扫描前这么短的时间内被修改过时，mtime可能无法反映扫描期间的后续修改（粗粒度时间戳），不缓存
+RACY_WINDOW_NS = 1000000000
+
+
+class _Listing:
+    """一个目录的缓存内容: 文件名（排序时按名称，否则按os.scandir()的顺序）及其lstat结果"""
+
+    __slots__ = ("path", "mtime_ns", "ino", "scanned_at", "names", "stats", "size",
+                 "complete", "watch")
+
+    def __init__(self, path, st):
+        self.path = path
+        self.mtime_ns = st.st_mtime_ns
+        self.ino = st.st_ino
+        self.scanned_at = time.monotonic()
+        self.names = []
+        self.stats = {}
+        self.size = ENTRY_OVERHEAD
+        self.complete = False
+        self.watch = None
+
+
+class DirectoryListing:
+    """listdir()返回的可迭代对象
+
+    不是list，所以pyftpdlib不会先整体排序再格式化；格式化时通过 lstat_for()
+    直接取得扫描时得到的stat结果，不再逐个调用lstat。
+    """
+
+    def __init__(self, path, names, stats, scanner=None):
+        self.path = path
+        self.stats = stats
+        self._names = names
+        self._scanner = scanner
+
+    def __iter__(self):
+        if self._scanner is not None:
+            scanner, self._scanner = self._scanner, None
+            return scanner
+        return iter(self._names)
+
+    def lstat_for(self, path):
+        """返回扫描时得到的lstat结果，不属于本目录或没有记录时返回None"""
+        dirname, name = os.path.split(path)
+        if dirname != self.path:
+            return None
+        return self.stats.get(name)
+
+
+class ListingCache:
+    """所有会话共享的目录缓存（线程安全）
+
+    max_bytes 为缓存的最大估算内存，ttl 为没有inotify监视时缓存的最长有效时间（秒），0表示只按mtime判断，
+    sort 为True时目录项按名称排序。
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=30, use_inotify=True, sort=True):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sort = sort
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.logger = logging.getLogger("FTPServer.Cache")
+        self._inotify = None
+        if use_inotify:
+            self._inotify = InotifyWatcher.create(self._on_change)
+
+    @property
+    def inotify_active(self):
+        """inotify是否在当前进程中可用（多进程引擎的子进程中没有监视线程）"""
+        return self._inotify is not None and self._inotify.active
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            for path in list(self._entries):
+                self._discard(path)
+
+    def stats(self):
+        """返回缓存的统计信息"""
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.size, "hits": self.hits,
+                    "misses": self.misses, "inotify": self.inotify_active}
+
+    def listdir(self, path):
+        """返回目录的 DirectoryListing，缓存有效时直接使用缓存，否则扫描并缓存
+
+        不排序时边扫描边输出，排序时先读完整个目录。
+
+        目录不存在或无法读取时立即抛出OSError。
+        """
+        st = os.stat(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and self._is_valid(entry, st):
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return DirectoryListing(path, entry.names, entry.stats)
+            if entry is not None:
+                self._discard(path)
+            self.misses += 1
+
+        entry = _Listing(path, st)
+        scanner = self._scan(entry, os.scandir(path))
+        if self.sort:
+            # 目录太大放不进缓存时 entry.names 会被清空，这里保留完整的文件名
+            return DirectoryListing(path, sorted(scanner), entry.stats)
+        return DirectoryListing(path, entry.names, entry.stats, scanner)
+
+    def invalidate(self, path):
+        """使目录的缓存失效"""
+        with self._lock:
+            self._discard(path)
+
+    def invalidate_parent(self, path):
+        """文件或子目录被修改时，使其所在目录的缓存失效"""
+        self.invalidate(os.path.dirname(path))
+
+    def _is_valid(self, entry, st):
+        if not entry.complete or entry.mtime_ns != st.st_mtime_ns or entry.ino != st.st_ino:
+            return False
+        watched = entry.watch is not None and self.inotify_active
+        if not watched and self.ttl and time.monotonic() - entry.scanned_at > self.ttl:
+            return False
+        return True
+
+    def _scan(self, entry, iterator):
+        """逐个产生文件名，同时记录stat结果；完整扫描且大小不超过上限时存入缓存"""
+        budget = self.max_bytes
+        cacheable = True
+        with iterator:
+            for dirent in iterator:
+                try:
+                    st = dirent.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                name = dirent.name
+                entry.names.append(name)
+                entry.stats[name] = st
+                entry.size += ENTRY_OVERHEAD + len(name)
+                yield name
+                if cacheable and entry.size > budget:
+                    # 目录太大，放不进缓存: 继续输出，但不再保留已扫描的条目
+                    cacheable = False
+                if not cacheable:
+                    entry.names.clear()
+                    entry.stats.clear()
+                    entry.size = ENTRY_OVERHEAD
+        if cacheable:
+            self._store(entry)
+
+    def _store(self, entry):
+        try:
+            st = os.stat(entry.path)
+        except OSError:
+            return
+        # 扫描期间目录被修改，或修改时间距扫描开始太近，mtime不足以判断之后的变化
+        if st.st_mtime_ns != entry.mtime_ns or time.time_ns() - st.st_mtime_ns < RACY_WINDOW_NS:
+            return
+        entry.complete = True
+        if self.sort:
+            entry.names.sort()
+        with self._lock:
+            # 先移除旧条目: 同一目录重复添加监视时inotify返回相同的watch描述符
+            self._discard(entry.path)
+            if self.inotify_active:
+                entry.watch = self._inotify.add(entry.path)
+            self._entries[entry.path] = entry
+            self.size += entry.size
+            while self.size > self.max_bytes and self._entries:
+                self._discard(next(iter(self._entries)))
+
+    def _discard(self, path):
+        """在持有锁的情况下移除一个条目"""
+        entry = self._entries.pop(path, None)
+        if entry is None:
+            return
+        self.size -= entry.size
+        if entry.watch is not None and self.inotify_active:
+            self._inotify.remove(entry.watch)
+
+    def _on_change(self, path):
+        """inotify回调: path为None表示事件队列溢出，需要清空全部缓存"""
+        if path is None:
+            self.clear()
+        else:
+            self.invalidate(path)
+
+
+class InotifyWatcher:
+    """基于ctypes的最小inotify封装，目录内容或其中文件发生变化时回调"""
+
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_ONLYDIR = 0x01000000
+    IN_CLOEXEC = 0o2000000
+    IN_NONBLOCK = 0o4000
+
+    MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+            | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+    EVENT = struct.Struct("iIII")
+
+    @classmethod
+    def create(cls, callback):
+        """创建监视器，当前平台不支持inotify时返回None"""
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            import ctypes
+            libc = ctypes.CDLL(None, use_errno=True)
+            libc.inotify_init1
+        except (OSError, AttributeError):
+            return None
+        fd = libc.inotify_init1(cls.IN_CLOEXEC | cls.IN_NONBLOCK)
+        if fd < 0:
+            return None
+        return cls(libc, fd, callback)
+
+    def __init__(self, libc, fd, callback):
+        self._libc = libc
+        self._fd = fd
+        self._callback = callback
+        self._lock = threading.Lock()
+        self._paths = {}
+        self._pid = os.getpid()
+        self._stopping = False
+        self.logger = logging.getLogger("FTPServer.Cache")
+        self._thread = threading.Thread(target=self._run, name="listing-cache-inotify")
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def active(self):
+        return not self._stopping and os.getpid() == self._pid
+
+    def add(self, path):
+        """监视目录，返回watch描述符，失败（例如超出系统监视数量限制）时返回None"""
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), self.MASK)
+        if wd < 0:
+            return None
+        with self._lock:
+            self._paths[wd] = path
+        return wd
+
+    def remove(self, wd):
+        with self._lock:
+            if self._paths.pop(wd, None) is None:
+                return
+        self._libc.inotify_rm_watch(self._fd, wd)
+
+    def close(self):
+        self._stopping = True
+        self._thread.join(timeout=2)
+        os.close(self._fd)
+
+    def _run(self):
+        while not self._stopping:
+            try:
+                ready, _, _ = select.select([self._fd], [], [], 0.5)
+                if not ready:
+                    continue
+                data = os.read(self._fd, 64 * 1024)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EINTR):
+                    continue
+                self.logger.error(f"读取inotify事件失败: {str(e)}")
+                return
+            self._dispatch(data)
+
+    def _dispatch(self, data):
+        changed = set()
+        offset = 0
+        while offset + self.EVENT.size <= len(data):
+            wd, mask, _, length = self.EVENT.unpack_from(data, offset)
+            offset += self.EVENT.size + length
+            if mask & self.IN_Q_OVERFLOW:
+                changed = {None}
+                break
+            with self._lock:
+                path = self._paths.get(wd)
+            if path is not None:
+                changed.add(path)
+        for path in changed:
+            try:
+                self._callback(path)
+            except Exception as e:
+                self.logger.error(f"处理目录变化失败: {str(e)}")
+
+
+class _ListingView:
+    """格式化目录列表时使用的文件系统视图: 优先使用扫描时得到的stat结果"""
+
+    def __init__(self, fs, listing):
+        self._fs = fs
+        self._listing = listing
+
+    def __getattr__(self, name):
+        return getattr(self._fs, name)
+
+    def lstat(self, path):
+        st = self._listing.lstat_for(path)
+        return st if st is not None else self._fs.lstat(path)
+
+    def stat(self, path):
+        # MLSD需要跟随符号链接，只有非链接条目可以直接使用lstat结果
+        st = self._listing.lstat_for(path)
+        if st is not None and (st.st_mode & 0o170000) != 0o120000:
+            return st
+        return self._fs.stat(path)
+
+
+class CachedFS(AbstractedFS):
+    """使用共享目录缓存的AbstractedFS
+
+    cache 为 ListingCache，由 FTPServerManager 在启动时通过派生子类设置；
+    为None时行为与AbstractedFS相同。
+    """
+
+    cache = None
+
+    def listdir(self, path):
+        if self.cache is None:
+            return AbstractedFS.listdir(self, path)
+        return self.cache.listdir(path)
+
+    def format_list(self, basedir, listing, ignore_err=True):
+        if not isinstance(listing, DirectoryListing):
+            return AbstractedFS.format_list(self, basedir, listing, ignore_err)
+        return AbstractedFS.format_list(_ListingView(self, listing), basedir, listing, ignore_err)
+
+    def format_mlsx(self, basedir, listing, perms, facts, ignore_err=True):
+        if not isinstance(listing, DirectoryListing):
+            return AbstractedFS.format_mlsx(self, basedir, listing, perms, facts, ignore_err)
+        return AbstractedFS.format_mlsx(_ListingView(self, listing), basedir, listing, perms,
+                                        facts, ignore_err)
+
+    # --- 修改文件系统的操作: 使所在目录的缓存失效
+
+    def invalidate(self, path):
+        """path（文件或目录）发生了变化"""
+        if self.cache is not None:
+            self.cache.invalidate_parent(path)
+
+    def open(self, filename, mode):
+        if "r" not in mode or "+" in mode:
+            self.invalidate(filename)
+        return AbstractedFS.open(self, filename, mode)
+
+    def mkstemp(self, suffix='', prefix='', dir=None, mode='wb'):
+        fd = AbstractedFS.mkstemp(self, suffix, prefix, dir, mode)
+        self.invalidate(fd.name)
+        return fd
+
+    def mkdir(self, path):
+        AbstractedFS.mkdir(self, path)
+        self.invalidate(path)
+
+    def rmdir(self, path):
+        AbstractedFS.rmdir(self, path)
+        self.invalidate(path)
+        if self.cache is not None:
+            self.cache.invalidate(path)
+
+    def remove(self, path):
+        AbstractedFS.remove(self, path)
+        self.invalidate(path)
+
+    def rename(self, src, dst):
+        AbstractedFS.rename(self, src, dst)
+        self.invalidate(src)
+        self.invalidate(dst)
+        if self.cache is not None:
+            self.cache.invalidate(src)
+
+    def chmod(self, path, mode):
+        AbstractedFS.chmod(self, path, mode)
+        self.invalidate(path)
+
+    def utime(self, path, timeval):
+        result = AbstractedFS.utime(self, path, timeval)
+        self.invalidate(path)
+        return result
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+FTP服务器命令行入口
+不导入gui.py和tkinter，可以在没有图形界面的Linux服务器上以守护进程方式运行。
+"""
+
+import sys
+import json
+import signal
+import argparse
+import threading
+
+from server import FTPServerManager
+
+
+def build_parser():
+    """创建命令行参数解析器"""
+    parser = argparse.ArgumentParser(prog="ftpserver", description="Python FTP服务器")
+    subparsers = parser.add_subparsers(dest="command")
+
+    subparsers.add_parser("gui", help="启动图形界面（默认）")
+
+    serve = subparsers.add_parser("serve", help="以无界面的守护进程方式运行服务器")
+    serve.add_argument("--config", default="config/settings.json", help="服务器配置文件路径")
+    serve.add_argument("--users", default="config/users.json", help="用户文件路径")
+    serve.add_argument("--takeover", action="store_true",
+                       help="从正在运行的旧进程接手监听套接字（零停机重启，需要设置handover_socket）")
+
+    import_parser = subparsers.add_parser("import-users", help="从CSV或JSON Lines文件批量导入用户")
+    import_parser.add_argument("file", help="输入文件路径，- 表示标准输入")
+    import_parser.add_argument("--format", choices=("csv", "jsonl"), help="文件格式（默认按扩展名判断）")
+    import_parser.add_argument("--home-root", help="没有指定目录的用户使用 <home-root>/<用户名>")
+    import_parser.add_argument("--update", action="store_true", help="替换已存在的同名用户（默认跳过）")
+    import_parser.add_argument("--dry-run", action="store_true", help="只校验输入，不写入用户")
+    import_parser.add_argument("--batch-size", type=int, default=1000, help="每次提交的用户数")
+    import_parser.add_argument("--workers", type=int, default=8, help="创建目录和计算密码哈希的线程数")
+    import_parser.add_argument("--iterations", type=int,
+                               help="明文密码的pbkdf2迭代次数（默认使用配置中的password_iterations）")
+
+    export_parser = subparsers.add_parser("export-users", help="把用户导出为CSV或JSON Lines文件")
+    export_parser.add_argument("file", help="输出文件路径，- 表示标准输出")
+    export_parser.add_argument("--format", choices=("csv", "jsonl"), help="文件格式（默认按扩展名判断）")
+
+    for sub in (import_parser, export_parser):
+        sub.add_argument("--config", default="config/settings.json", help="服务器配置文件路径")
+        sub.add_argument("--users", default="config/users.json", help="用户文件路径")
+    return parser
+
+
+def serve(args):
+    """无界面运行FTP服务器，直到收到SIGTERM/SIGINT
+
+    收到SIGTERM/SIGINT后排空停止: 不再接受新连接，等正在进行的传输结束（最多
+    drain_timeout 秒）；排空期间再次收到信号时立即停止。
+    SIGHUP会重新加载配置文件和用户文件，不中断已有连接。
+    --takeover 时从旧进程接手监听套接字启动；本进程的监听套接字被新进程接手后，
+    同样排空后退出。
+    """
+    manager = FTPServerManager(args.config, args.users)
+    logger = manager.logger
+
+    if args.takeover:
+        result, error_msg = manager.take_over()
+    else:
+        result, error_msg = manager.start_server()
+    if not result:
+        logger.error(f"启动FTP服务器失败: {error_msg}")
+        return 1
+
+    stop_event = threading.Event()
+    reload_event = threading.Event()
+
+    def handle_stop(signum, frame):
+        logger.info(f"收到信号 {signum}，正在停止服务器")
+        stop_event.set()
+
+    def handle_reload(signum, frame):
+        logger.info("收到SIGHUP，正在重新加载配置")
+        reload_event.set()
+
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
+    if hasattr(signal, "SIGHUP"):  # Windows没有SIGHUP
+        signal.signal(signal.SIGHUP, handle_reload)
+
+    # 主线程只负责处理信号，服务器在后台线程中运行
+    while not stop_event.wait(0.5):
+        if manager.handed_over:
+            break
+        if reload_event.is_set():
+            reload_event.clear()
+            manager.load_config()
+            manager.reload_users()
+        if not manager.server_thread.is_alive():
+            logger.error("服务器线程意外退出")
+            manager.running = False
+            return 1
+
+    last_transfers = [0]
+
+    def report(progress):
+        # 进度每秒报告多次，只在剩余传输数变化时记录
+        if progress.transfers and progress.transfers != last_transfers[0]:
+            logger.info(f"等待 {progress.transfers} 个传输完成，剩余 {progress.remaining:.0f} 秒")
+        last_transfers[0] = progress.transfers
+
+    if manager.handed_over:
+        # 排空已经由交接开始
+        result, error_msg = True, None
+    else:
+        stop_event.clear()
+        result, error_msg = manager.drain_server(progress=report)
+    if result:
+        while manager.draining:
+            if stop_event.wait(0.5):
+                logger.info("再次收到停止信号，立即停止服务器")
+                manager.stop_server()
+                stop_event.clear()
+        result, error_msg = manager.drain_result or (False, "停止服务器失败")
+    if not result:
+        logger.error(f"停止FTP服务器失败: {error_msg}")
+        return 1
+    return 0
+
+
+def import_users(args):
+    """批量导入用户，输出每批的进度和最终的行数/秒，有无效行时返回1"""
+    import usersio
+
+    if args.batch_size < 1 or args.workers < 1:
+        print("--batch-size 和 --workers 必须大于0", file=sys.stderr)
+        return 2
+    if args.iterations is not None and args.iterations < 1000:
+        print("--iterations 不能小于1000", file=sys.stderr)
+        return 2
+    try:
+        fmt = usersio.detect_format(args.file, args.format or ("csv" if args.file == "-" else None))
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+
+    def progress(report):
+        print(f"已处理 {report.rows} 行，{report.rate:.0f} 行/秒", file=sys.stderr)
+
+    manager = FTPServerManager(args.config, args.users)
+    iterations = args.iterations or manager.config.get("password_iterations", usersio.PBKDF2_ITERATIONS)
+    stream = sys.stdin if args.file == "-" else open(args.file, "r", encoding="utf-8-sig", newline="")
+    try:
+        report = usersio.import_users(manager, stream, fmt, home_root=args.home_root, update=args.update,
+                                      dry_run=args.dry_run, batch_size=args.batch_size,
+                                      workers=args.workers, iterations=iterations, progress=progress)
+    except (OSError, ValueError) as e:
+        print(f"导入失败: {str(e)}", file=sys.stderr)
+        return 1
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+        manager.user_store.close()
+
+    for line_no, message in report.errors:
+        print(f"第 {line_no} 行: {message}", file=sys.stderr)
+    summary = report.to_dict()
+    if args.dry_run:
+        summary["dry_run"] = True
+    print(json.dumps(summary, ensure_ascii=False))
+    return 1 if report.failed else 0
+
+
+def export_users(args):
+    """导出全部用户"""
+    import usersio
+
+    try:
+        fmt = usersio.detect_format(args.file, args.format or ("jsonl" if args.file == "-" else None))
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    manager = FTPServerManager(args.config, args.users)
+    try:
+        if args.file == "-":
+            count = usersio.export_users(manager, sys.stdout, fmt)
+        else:
+            with open(args.file, "w", encoding="utf-8", newline="") as f:
+                count = usersio.export_users(manager, f, fmt)
+    except OSError as e:
+        print(f"导出失败: {str(e)}", file=sys.stderr)
+        return 1
+    finally:
+        manager.user_store.close()
+    print(f"已导出 {count} 个用户", file=sys.stderr)
+    return 0
+
+
+def main(argv=None):
+    """命令行入口函数，返回进程退出码"""
+    args = build_parser().parse_args(argv)
+    if args.command == "serve":
+        return serve(args)
+    if args.command == "import-users":
+        return import_users(args)
+    if args.command == "export-users":
+        return export_users(args)
+
+    # 默认启动图形界面，仅在这里才导入tkinter
+    from main import main as gui_main
+    gui_main()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
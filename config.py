@@ -4,6 +4,73 @@
 import os
 import json
 import logging
+import tempfile
+from contextlib import contextmanager
+
+from authorizer import PBKDF2_ITERATIONS, hash_password
+
+# 传输调优的默认值，对应 settings.json 中的 "transfer" 部分
+DEFAULT_TRANSFER_CONFIG = {
+    "use_sendfile": True,      # 下载时使用sendfile(2)零拷贝发送
+    "read_size": 65536,        # 数据通道每次recv()的字节数
+    "write_size": 65536,       # 数据通道每次send()/sendfile()的字节数
+    "so_sndbuf": 0,            # 数据套接字SO_SNDBUF，0表示使用系统默认值
+    "so_rcvbuf": 0,            # 数据套接字SO_RCVBUF，0表示使用系统默认值
+    "read_limit": 0,           # 全局上传（服务器接收）限速，字节/秒，0表示不限速
+    "write_limit": 0           # 全局下载（服务器发送）限速，字节/秒，0表示不限速
+}
+
+# 目录列表缓存的默认值，对应 settings.json 中的 "listing_cache" 部分
+DEFAULT_LISTING_CACHE_CONFIG = {
+    "enabled": True,           # 缓存LIST/MLSD/NLST读取的目录内容和文件属性
+    "max_bytes": 67108864,     # 缓存的最大估算内存（字节）
+    "ttl": 30,                 # 没有inotify时缓存的最长有效时间（秒），0表示只按目录mtime判断
+    "inotify": True,           # Linux上使用inotify在文件变化时立即失效
+    "sorted": True             # 目录项按名称排序；false时按文件系统顺序边读边发送
+}
+
+# 上传后处理管线的默认值，对应 settings.json 中的 "ingest" 部分
+DEFAULT_INGEST_CONFIG = {
+    "enabled": False,          # 上传完成后交给后处理管线
+    "stages": ["checksum"],    # 依次执行的阶段: checksum、shard、compress
+    "executor": "thread",      # thread（线程池）或 process（进程池，适合压缩等CPU密集的阶段）
+    "workers": 2,              # 池中的工作线程/进程数
+    "max_pending": 64,         # 待处理文件数达到此值时暂时拒绝新的上传
+    "shard_dir": "",           # 分片目录，相对于用户目录
+    "shard_depth": 2,          # 分片目录层数，每层使用两个十六进制字符
+    "compress_level": 6        # gzip压缩级别
+}
+
+# 断点续传的默认值，对应 settings.json 中的 "resume" 部分
+DEFAULT_RESUME_CONFIG = {
+    "enabled": False,          # 记录中断的上传，REST/APPE续传时继续计算校验和
+    "index_path": "",          # 续传索引文件，为空时保存在配置目录下的 partial_uploads.jsonl
+    "max_age": 0,              # 超过这么多秒没有续传的部分文件被删除，0表示从不删除
+    "janitor_interval": 3600   # 清理检查间隔（秒）
+}
+
+# 用户存储后端，对应 settings.json 中的 "user_store" 部分
+DEFAULT_USER_STORE_CONFIG = {
+    "backend": "json",         # json（users.json）或 sqlite
+    "path": ""                 # SQLite数据库文件，为空时保存在配置目录下的 users.db
+}
+
+# FTPS（显式TLS）的默认值，对应 settings.json 中的 "tls" 部分
+DEFAULT_TLS_CONFIG = {
+    "enabled": False,          # 启用 AUTH TLS / PBSZ / PROT（需要pyOpenSSL）
+    "certfile": "",            # PEM格式的证书（可以包含证书链）
+    "keyfile": "",             # PEM格式的私钥，为空时从certfile读取
+    "control_required": False, # 登录前必须先用AUTH TLS加密控制连接
+    "data_required": False,    # 数据连接必须加密（PROT P）
+    "min_version": "TLSv1.2",  # 允许的最低TLS版本: TLSv1.2 或 TLSv1.3
+    # TLS 1.2的密码套件，优先使用AES-GCM和ChaCha20-Poly1305
+    "ciphers": "ECDHE+AESGCM:ECDHE+CHACHA20:DHE+AESGCM:DHE+CHACHA20:!aNULL:!MD5:!DSS",
+    # TLS 1.3的密码套件
+    "ciphersuites": "TLS_AES_128_GCM_SHA256:TLS_CHACHA20_POLY1305_SHA256:TLS_AES_256_GCM_SHA384",
+    "session_timeout": 300,    # TLS会话在服务器缓存中的有效时间（秒）
+    "session_tickets": True,   # 发送会话票据，客户端可以不依赖服务器缓存恢复会话
+    "require_session_reuse": False  # 数据连接必须恢复控制连接的TLS会话
+}
 
 class ConfigManager:
     """配置管理类，处理配置文件的加载、保存和验证"""
@@ -14,10 +81,20 @@ class ConfigManager:
         self.users_path = users_path
         self.config = {}
         self.users = []
+        # 用户名 -> 用户字典，与 users 列表中的对象相同
+        self._user_index = {}
+        # 批量修改的嵌套层数，以及期间是否有未保存的修改
+        self._batch_depth = 0
+        self._batch_dirty = False
         self.logger = logging.getLogger("FTPServer.Config")
         
-    def load_config(self):
-        """加载服务器配置"""
+    def load_config(self, keep_on_error=False):
+        """加载服务器配置
+        
+        参数:
+            keep_on_error: 为True时，文件无法读取则保留当前配置而不是回退到默认值
+                           （用于热加载，避免读到编辑了一半的文件）
+        """
         try:
             with open(self.config_path, 'r') as f:
                 self.config = json.load(f)
@@ -30,28 +107,44 @@ class ConfigManager:
                 
         except Exception as e:
             self.logger.error(f"加载配置文件失败: {str(e)}")
+            if keep_on_error and self.config:
+                return self.config
             self.config = {
                 "port": 2121,
                 "max_connections": 256,
                 "max_conn_per_ip": 5,
                 "address": "0.0.0.0",
-                "passive_ports": "60000-60100"
+                "passive_ports": "60000-60100",
+                "engine": "async"
             }
         
         return self.config
         
-    def load_users(self):
-        """加载用户信息"""
+    def load_users(self, keep_on_error=False):
+        """加载用户信息
+        
+        参数:
+            keep_on_error: 为True时，文件无法读取则保留当前用户列表
+        """
         try:
-            with open(self.users_path, 'r') as f:
-                self.users = json.load(f)
-            self.logger.info("用户信息加载成功")
+            with open(self.users_path, 'rb') as f:
+                users = json.loads(f.read())
+            if not isinstance(users, list):
+                raise ValueError("用户文件的内容必须是列表")
+            self.users = users
+            self._rebuild_index()
+            self.logger.info(f"用户信息加载成功，共 {len(users)} 个用户")
         except Exception as e:
             self.logger.error(f"加载用户文件失败: {str(e)}")
-            self.users = []
+            if not keep_on_error:
+                self.users = []
+                self._rebuild_index()
             
         return self.users
         
+    def _rebuild_index(self):
+        self._user_index = {user["username"]: user for user in self.users}
+        
     def save_config(self):
         """保存服务器配置到文件"""
         # 验证配置
@@ -61,13 +154,7 @@ class ConfigManager:
             return False
             
         try:
-            # 确保目录存在
-            config_dir = os.path.dirname(self.config_path)
-            if not os.path.exists(config_dir):
-                os.makedirs(config_dir)
-                
-            with open(self.config_path, 'w') as f:
-                json.dump(self.config, f, indent=4)
+            self._write_json(self.config_path, self.config, compact=False)
             self.logger.info("配置保存成功")
             return True
         except Exception as e:
@@ -75,20 +162,117 @@ class ConfigManager:
             return False
             
     def save_users(self):
-        """保存用户信息到文件"""
+        """保存用户信息到文件
+        
+        在 batch() 中调用时只标记有修改，退出批量修改时统一保存一次。
+        """
+        if self._batch_depth:
+            self._batch_dirty = True
+            return True
         try:
-            # 确保目录存在
-            config_dir = os.path.dirname(self.users_path)
-            if not os.path.exists(config_dir):
-                os.makedirs(config_dir)
-                
-            with open(self.users_path, 'w') as f:
-                json.dump(self.users, f, indent=4)
-            self.logger.info("用户信息保存成功")
+            self._write_json(self.users_path, self.users,
+                             compact=self.config.get("users_file_compact", False))
+            self.logger.debug("用户信息保存成功")
             return True
         except Exception as e:
             self.logger.error(f"保存用户信息失败: {str(e)}")
             return False
+            
+    @staticmethod
+    def _write_json(path, data, compact=False):
+        """原子地写入JSON文件: 先写入同目录下的临时文件，再重命名替换原文件
+        
+        写入过程中崩溃或磁盘已满时原文件保持不变。compact为True时不缩进，
+        写入更快、文件更小（可以使用C实现的JSON编码器）。
+        """
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                         dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                if compact:
+                    # json.dump 总是使用纯Python的逐块编码，一次性编码才会使用C编码器
+                    f.write(json.dumps(data, separators=(",", ":")))
+                else:
+                    json.dump(data, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            try:
+                os.chmod(temp_path, os.stat(path).st_mode & 0o777)
+            except OSError:
+                pass
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+            
+    @contextmanager
+    def batch(self):
+        """批量修改用户，退出时只保存一次用户文件
+        
+        块内发生异常时回滚块内的全部修改，不写入文件；保存失败时同样回滚并抛出OSError。
+        可以嵌套，只有最外层负责保存或回滚。
+        
+        用法:
+            with config_manager.batch():
+                for ...:
+                    config_manager.add_user(...)
+        """
+        if self._batch_depth:
+            self._batch_depth += 1
+            try:
+                yield self
+            finally:
+                self._batch_depth -= 1
+            return
+        snapshot = [dict(user) for user in self.users]
+        self._batch_depth = 1
+        self._batch_dirty = False
+        try:
+            yield self
+        except BaseException:
+            self._batch_depth = 0
+            self._restore_users(snapshot)
+            raise
+        self._batch_depth = 0
+        if self._batch_dirty and not self.save_users():
+            self._restore_users(snapshot)
+            raise OSError("保存用户信息失败，批量修改已回滚")
+            
+    def _restore_users(self, snapshot):
+        # 原地恢复，FTPServerManager 持有同一个列表对象
+        self.users[:] = snapshot
+        self._rebuild_index()
+        
+    def get_user(self, username):
+        """按用户名查找用户（字典索引），不存在时返回None"""
+        return self._user_index.get(username)
+        
+    def put_user(self, user):
+        """添加用户，或替换同名用户的信息，不保存文件"""
+        existing = self._user_index.get(user["username"])
+        if existing is None:
+            self.users.append(user)
+        elif existing is not user:
+            existing.clear()
+            existing.update(user)
+            user = existing
+        self._user_index[user["username"]] = user
+        return user
+        
+    def delete_user(self, username):
+        """从用户列表中删除用户，不保存文件，返回被删除的用户字典"""
+        user = self._user_index.pop(username, None)
+        if user is not None:
+            for i, candidate in enumerate(self.users):
+                if candidate is user:
+                    del self.users[i]
+                    break
+        return user
     
     def validate_config(self):
         """验证配置是否合法"""
@@ -125,19 +309,211 @@ class ConfigManager:
             except ValueError:
                 errors.append("被动端口必须是数字")
                 
+        # 验证传输调优参数
+        transfer = self.config.get("transfer", {})
+        if not isinstance(transfer, dict):
+            errors.append("传输设置(transfer)必须是对象")
+        else:
+            if not isinstance(transfer.get("use_sendfile", True), bool):
+                errors.append("use_sendfile必须是true或false")
+            for key in ("read_size", "write_size"):
+                value = transfer.get(key, DEFAULT_TRANSFER_CONFIG[key])
+                if not isinstance(value, int) or value < 512:
+                    errors.append(f"{key}必须是不小于512的整数")
+            for key in ("so_sndbuf", "so_rcvbuf", "read_limit", "write_limit"):
+                value = transfer.get(key, 0)
+                if not isinstance(value, int) or value < 0:
+                    errors.append(f"{key}必须是非负整数")
+                
+        # 验证目录列表缓存参数
+        listing_cache = self.config.get("listing_cache", {})
+        if not isinstance(listing_cache, dict):
+            errors.append("目录缓存设置(listing_cache)必须是对象")
+        else:
+            for key in ("enabled", "inotify", "sorted"):
+                if not isinstance(listing_cache.get(key, True), bool):
+                    errors.append(f"listing_cache.{key}必须是true或false")
+            for key in ("max_bytes", "ttl"):
+                value = listing_cache.get(key, DEFAULT_LISTING_CACHE_CONFIG[key])
+                if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+                    errors.append(f"listing_cache.{key}必须是非负整数")
+                
+        # 验证上传后处理管线参数
+        ingest = self.config.get("ingest", {})
+        if not isinstance(ingest, dict):
+            errors.append("上传处理设置(ingest)必须是对象")
+        else:
+            if not isinstance(ingest.get("enabled", False), bool):
+                errors.append("ingest.enabled必须是true或false")
+            stages = ingest.get("stages", DEFAULT_INGEST_CONFIG["stages"])
+            if not isinstance(stages, list) or any(
+                    stage not in ("checksum", "shard", "compress") for stage in stages):
+                errors.append("ingest.stages只能包含 checksum、shard、compress")
+            if ingest.get("executor", "thread") not in ("thread", "process"):
+                errors.append("ingest.executor必须是 thread 或 process")
+            for key in ("workers", "max_pending", "shard_depth"):
+                value = ingest.get(key, DEFAULT_INGEST_CONFIG[key])
+                if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+                    errors.append(f"ingest.{key}必须是正整数")
+            level = ingest.get("compress_level", 6)
+            if isinstance(level, bool) or not isinstance(level, int) or not 1 <= level <= 9:
+                errors.append("ingest.compress_level必须是1-9之间的整数")
+            shard_dir = ingest.get("shard_dir", "")
+            if not isinstance(shard_dir, str) or os.path.isabs(shard_dir) or ".." in shard_dir.split("/"):
+                errors.append("ingest.shard_dir必须是用户目录下的相对路径")
+                
+        # 验证断点续传参数
+        resume = self.config.get("resume", {})
+        if not isinstance(resume, dict):
+            errors.append("断点续传设置(resume)必须是对象")
+        else:
+            if not isinstance(resume.get("enabled", False), bool):
+                errors.append("resume.enabled必须是true或false")
+            if not isinstance(resume.get("index_path", ""), str):
+                errors.append("resume.index_path必须是字符串")
+            max_age = resume.get("max_age", DEFAULT_RESUME_CONFIG["max_age"])
+            if isinstance(max_age, bool) or not isinstance(max_age, (int, float)) or max_age < 0:
+                errors.append("resume.max_age必须是非负数")
+            interval = resume.get("janitor_interval", DEFAULT_RESUME_CONFIG["janitor_interval"])
+            if isinstance(interval, bool) or not isinstance(interval, (int, float)) or interval <= 0:
+                errors.append("resume.janitor_interval必须是正数")
+                
+        # 验证用户存储后端
+        user_store = self.config.get("user_store", {})
+        if not isinstance(user_store, dict):
+            errors.append("用户存储设置(user_store)必须是对象")
+        else:
+            if user_store.get("backend", "json") not in ("json", "sqlite"):
+                errors.append("user_store.backend必须是 json 或 sqlite")
+            if not isinstance(user_store.get("path", ""), str):
+                errors.append("user_store.path必须是字符串")
+                
+        # 验证FTPS参数
+        tls = self.config.get("tls", {})
+        if not isinstance(tls, dict):
+            errors.append("FTPS设置(tls)必须是对象")
+        else:
+            for key in ("enabled", "control_required", "data_required", "session_tickets",
+                        "require_session_reuse"):
+                if not isinstance(tls.get(key, DEFAULT_TLS_CONFIG[key]), bool):
+                    errors.append(f"tls.{key}必须是true或false")
+            for key in ("certfile", "keyfile", "ciphers", "ciphersuites"):
+                if not isinstance(tls.get(key, DEFAULT_TLS_CONFIG[key]), str):
+                    errors.append(f"tls.{key}必须是字符串")
+            if tls.get("min_version", "TLSv1.2") not in ("TLSv1.2", "TLSv1.3"):
+                errors.append("tls.min_version必须是 TLSv1.2 或 TLSv1.3")
+            timeout = tls.get("session_timeout", DEFAULT_TLS_CONFIG["session_timeout"])
+            if isinstance(timeout, bool) or not isinstance(timeout, int) or timeout < 1:
+                errors.append("tls.session_timeout必须是正整数")
+            if tls.get("enabled", False) and not tls.get("certfile"):
+                errors.append("启用FTPS时必须设置证书文件 tls.certfile")
+                
+        # 验证用户文件格式
+        if not isinstance(self.config.get("users_file_compact", False), bool):
+            errors.append("users_file_compact必须是true或false")
+                
+        # 验证日志参数
+        for key in ("log_max_bytes", "log_backup_count", "log_rotate_interval"):
+            if key in self.config and (not isinstance(self.config[key], int) or self.config[key] < 0):
+                errors.append(f"{key}必须是非负整数")
+        if "log_queue_size" in self.config and (
+                not isinstance(self.config["log_queue_size"], int) or self.config["log_queue_size"] < 1):
+            errors.append("log_queue_size必须是正整数")
+                
+        # 验证服务引擎
+        engine = self.config.get("engine", "async")
+        if engine not in ("async", "threaded", "multiprocess", "reuseport"):
+            errors.append("服务引擎必须是 async、threaded、multiprocess 或 reuseport 之一")
+            
+        # 验证工作进程数（0表示与CPU核数相同，只用于reuseport引擎）
+        workers = self.config.get("workers", 0)
+        if isinstance(workers, bool) or not isinstance(workers, int) or workers < 0:
+            errors.append("workers必须是非负整数")
+            
+        # 验证附加的监听地址
+        extra = self.config.get("bind_addresses", [])
+        if not isinstance(extra, list) or not all(isinstance(a, str) and a for a in extra):
+            errors.append("bind_addresses必须是IP地址字符串的列表")
+        elif extra and engine in ("threaded", "multiprocess"):
+            errors.append("多个监听地址只支持 async 和 reuseport 引擎")
+            
+        # 验证指标端点端口（0表示不启用）
+        metrics_port = self.config.get("metrics_port", 0)
+        if isinstance(metrics_port, bool) or not isinstance(metrics_port, int) or not 0 <= metrics_port <= 65535:
+            errors.append("metrics_port必须是0-65535之间的整数")
+            
+        # 验证排空停止的最长等待时间
+        drain_timeout = self.config.get("drain_timeout", 30)
+        if isinstance(drain_timeout, bool) or not isinstance(drain_timeout, (int, float)) or drain_timeout < 0:
+            errors.append("drain_timeout必须是非负数")
+            
+        # 验证新密码哈希的PBKDF2迭代次数
+        iterations = self.config.get("password_iterations", PBKDF2_ITERATIONS)
+        if isinstance(iterations, bool) or not isinstance(iterations, int) or iterations < 1000:
+            errors.append("password_iterations必须是不小于1000的整数")
+            
+        # 验证交接套接字路径（空字符串表示不启用）
+        if not isinstance(self.config.get("handover_socket", ""), str):
+            errors.append("handover_socket必须是文件路径字符串")
+            
+        # 验证连接快照发布间隔
+        interval = self.config.get("snapshot_interval", 1.0)
+        if isinstance(interval, bool) or not isinstance(interval, (int, float)) or interval <= 0:
+            errors.append("snapshot_interval必须是正数")
+                
         return errors
         
+    def get_transfer_config(self):
+        """获取传输调优配置，未设置的项使用默认值"""
+        transfer = dict(DEFAULT_TRANSFER_CONFIG)
+        transfer.update(self.config.get("transfer") or {})
+        return transfer
+        
+    def get_listing_cache_config(self):
+        """获取目录列表缓存配置，未设置的项使用默认值"""
+        listing_cache = dict(DEFAULT_LISTING_CACHE_CONFIG)
+        listing_cache.update(self.config.get("listing_cache") or {})
+        return listing_cache
+        
+    def get_ingest_config(self):
+        """获取上传后处理管线配置，未设置的项使用默认值"""
+        ingest = dict(DEFAULT_INGEST_CONFIG)
+        ingest.update(self.config.get("ingest") or {})
+        return ingest
+        
+    def get_resume_config(self):
+        """获取断点续传配置，未设置的项使用默认值，索引路径为空时放在配置目录下"""
+        resume = dict(DEFAULT_RESUME_CONFIG)
+        resume.update(self.config.get("resume") or {})
+        if not resume["index_path"]:
+            resume["index_path"] = os.path.join(os.path.dirname(self.config_path), "partial_uploads.jsonl")
+        return resume
+        
+    def get_user_store_config(self):
+        """获取用户存储后端配置，数据库路径为空时放在配置目录下"""
+        user_store = dict(DEFAULT_USER_STORE_CONFIG)
+        user_store.update(self.config.get("user_store") or {})
+        if not user_store["path"]:
+            user_store["path"] = os.path.join(os.path.dirname(self.config_path), "users.db")
+        return user_store
+        
+    def get_tls_config(self):
+        """获取FTPS配置，未设置的项使用默认值"""
+        tls = dict(DEFAULT_TLS_CONFIG)
+        tls.update(self.config.get("tls") or {})
+        return tls
+        
     def add_user(self, username, password, directory, permissions="elradfmwMT"):
         """添加新用户"""
         # 检查用户是否已存在
-        for user in self.users:
-            if user["username"] == username:
-                return False
+        if username in self._user_index:
+            return False
                 
         # 添加新用户
-        self.users.append({
+        self.put_user({
             "username": username,
-            "password": password,
+            "password": hash_password(password, iterations=self.config.get("password_iterations",
+                                                                          PBKDF2_ITERATIONS)),
             "directory": directory,
             "permissions": permissions
         })
@@ -147,11 +523,9 @@ class ConfigManager:
         
     def remove_user(self, username):
         """删除用户"""
-        for i, user in enumerate(self.users):
-            if user["username"] == username:
-                del self.users[i]
-                return self.save_users()
-        return False
+        if self.delete_user(username) is None:
+            return False
+        return self.save_users()
         
     def update_config(self, new_config):
         """更新配置"""
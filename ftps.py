@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+FTPS（显式TLS，RFC 4217）支持
+基于pyftpdlib的 TLS_FTPHandler / TLS_DTPHandler，需要安装可选依赖pyOpenSSL。
+
+- 所有连接共用一个 SSL.Context，其中启用了服务器端会话缓存并设置了固定的会话ID上下文，
+  客户端打开数据连接时可以恢复控制连接的TLS会话（简短握手，不再做证书签名和密钥交换）；
+  启用会话票据时TLS 1.3/1.2的恢复也可以不占用服务器的缓存
+- 默认只允许TLS 1.2及以上版本，TLS 1.2的密码套件只选用ECDHE/DHE前向保密的AES-GCM和
+  ChaCha20-Poly1305，并按服务器的顺序选择（有AES-NI的机器上AES-GCM最快）
+- require_session_reuse 为true时，数据连接必须恢复控制连接的会话（与vsftpd的
+  require_ssl_reuse相同），防止他人抢先连上被动端口窃取数据；不支持会话恢复的客户端
+  （例如Python的ftplib）会收到 522 回复
+"""
+
+import os
+import logging
+
+from handlers import ManagedFTPHandler, TunedDTPHandler
+
+try:
+    from OpenSSL import SSL
+    from pyftpdlib.handlers import TLS_DTPHandler, TLS_FTPHandler
+except ImportError:
+    SSL = None
+
+# TLS 1.2的密码套件（OpenSSL格式），只用前向保密的AEAD套件
+DEFAULT_CIPHERS = "ECDHE+AESGCM:ECDHE+CHACHA20:DHE+AESGCM:DHE+CHACHA20:!aNULL:!MD5:!DSS"
+# TLS 1.3的密码套件
+DEFAULT_CIPHERSUITES = "TLS_AES_128_GCM_SHA256:TLS_CHACHA20_POLY1305_SHA256:TLS_AES_256_GCM_SHA384"
+# 会话缓存的ID上下文，恢复会话时客户端和服务器的上下文必须相同
+SESSION_ID_CONTEXT = b"ftpserver"
+MIN_VERSIONS = ("TLSv1.2", "TLSv1.3")
+
+
+def is_available():
+    """是否安装了pyOpenSSL"""
+    return SSL is not None
+
+
+def create_ssl_context(certfile, keyfile="", ciphers=DEFAULT_CIPHERS,
+                       ciphersuites=DEFAULT_CIPHERSUITES, min_version="TLSv1.2",
+                       session_timeout=300, session_tickets=True):
+    """创建服务器使用的 SSL.Context
+
+    参数:
+        certfile: PEM格式的证书（可以包含证书链和私钥）
+        keyfile: PEM格式的私钥，为空时从certfile读取
+        session_timeout: 会话在缓存中的有效时间（秒）
+        session_tickets: 是否发送会话票据，为False时只用服务器端缓存恢复会话
+
+    证书或私钥无效、密码套件无法识别时抛出ValueError。
+    """
+    if SSL is None:
+        raise ValueError("FTPS需要安装pyOpenSSL: pip install pyOpenSSL")
+    if min_version not in MIN_VERSIONS:
+        raise ValueError(f"不支持的TLS最低版本: {min_version}（可选: {', '.join(MIN_VERSIONS)}）")
+    context = SSL.Context(SSL.TLS_SERVER_METHOD)
+    try:
+        context.set_min_proto_version(SSL.TLS1_3_VERSION if min_version == "TLSv1.3"
+                                      else SSL.TLS1_2_VERSION)
+        context.use_certificate_chain_file(certfile)
+        context.use_privatekey_file(keyfile or certfile)
+        context.check_privatekey()
+    except SSL.Error as e:
+        raise ValueError(f"无法加载证书或私钥 {certfile}: {_ssl_error(e)}")
+    options = SSL.OP_NO_COMPRESSION | SSL.OP_CIPHER_SERVER_PREFERENCE
+    if not session_tickets:
+        options |= SSL.OP_NO_TICKET
+    context.set_options(options)
+    try:
+        context.set_cipher_list(ciphers.encode("ascii"))
+        if ciphersuites and hasattr(context, "set_tls13_ciphersuites"):
+            context.set_tls13_ciphersuites(ciphersuites.encode("ascii"))
+    except SSL.Error as e:
+        raise ValueError(f"无效的密码套件: {_ssl_error(e)}")
+    # 控制连接和数据连接的会话保存在同一个服务器端缓存中
+    context.set_session_id(SESSION_ID_CONTEXT)
+    context.set_session_cache_mode(SSL.SESS_CACHE_SERVER)
+    context.set_timeout(int(session_timeout))
+    return context
+
+
+def _ssl_error(error):
+    """把OpenSSL的错误列表转换成简短的说明"""
+    reasons = [item[2] for item in error.args[0] if len(item) == 3] \
+        if error.args and isinstance(error.args[0], list) else []
+    return ", ".join(reasons) or str(error)
+
+
+def session_reused(connection):
+    """TLS连接是否恢复了之前的会话，无法判断时返回None
+
+    pyOpenSSL没有公开 SSL_session_reused()，这里通过其cffi绑定调用。
+    """
+    lib = getattr(SSL, "_lib", None)
+    func = getattr(lib, "SSL_session_reused", None)
+    ssl = getattr(connection, "_ssl", None)
+    if func is None or ssl is None:
+        return None
+    return bool(func(ssl))
+
+
+def generate_self_signed_cert(certfile, keyfile, common_name="localhost", days=365):
+    """生成自签名证书和私钥（用于测试和内网部署），使用pyOpenSSL依赖的cryptography"""
+    import datetime
+    import ipaddress
+    from cryptography import x509
+    from cryptography.x509.oid import NameOID
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+    alt_names = [x509.DNSName(common_name)]
+    try:
+        alt_names.append(x509.IPAddress(ipaddress.ip_address(common_name)))
+    except ValueError:
+        alt_names.append(x509.IPAddress(ipaddress.ip_address("127.0.0.1")))
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (x509.CertificateBuilder()
+            .subject_name(name)
+            .issuer_name(name)
+            .public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(minutes=5))
+            .not_valid_after(now + datetime.timedelta(days=days))
+            .add_extension(x509.SubjectAlternativeName(alt_names), critical=False)
+            .sign(key, hashes.SHA256()))
+    for path in (certfile, keyfile):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+    with open(certfile, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(keyfile, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM,
+                                  serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()))
+    if hasattr(os, "chmod"):
+        os.chmod(keyfile, 0o600)
+
+
+if SSL is not None:
+
+    class SecureDTPHandler(TunedDTPHandler, TLS_DTPHandler):
+        """加密的数据通道处理器（限速、缓冲区调优与 TunedDTPHandler 相同）
+
+        TLS连接不能使用sendfile，下载总是经过用户态加密后发送。
+        """
+
+        def handle_ssl_established(self):
+            reused = session_reused(self.socket)
+            metrics = getattr(self.cmd_channel, "metrics", None)
+            if metrics is not None:
+                metrics.tls_handshake("data", reused)
+            if reused is False and self.cmd_channel.require_session_reuse:
+                msg = "TLS session of data connection was not reused."
+                self.cmd_channel.respond("522 " + msg)
+                self.cmd_channel.log_cmd("PROT", "P", 522, msg)
+                self.close()
+                return
+            super().handle_ssl_established()
+
+        def _do_ssl_shutdown(self):
+            # 关闭通知发送完之后套接字才真正关闭，这时再归还端口、记录上传的续传状态
+            super()._do_ssl_shutdown()
+            if self._closed:
+                self._after_close()
+
+    class SecureFTPHandler(ManagedFTPHandler, TLS_FTPHandler):
+        """支持 AUTH TLS / PBSZ / PROT 的控制连接处理器
+
+        ssl_context 由 create_ssl_context() 创建，启动服务器时作为类属性设置。
+        """
+
+        dtp_handler = SecureDTPHandler
+        require_session_reuse = False
+
+        def handle_ssl_established(self):
+            if self.metrics is not None:
+                self.metrics.tls_handshake("control", session_reused(self.socket))
+            super().handle_ssl_established()
+
+
+def build_handlers(tls_config):
+    """按TLS配置派生本次启动使用的控制连接和数据通道处理器类
+
+    返回 (handler, dtp_handler)，handler.dtp_handler 已经指向 dtp_handler；
+    tls_config["enabled"] 为False时返回普通的处理器。需要FTPS但没有安装pyOpenSSL、
+    证书无效时抛出ValueError。
+    """
+    if not tls_config.get("enabled"):
+        handler = type("FTPHandler", (ManagedFTPHandler,), {})
+        handler.dtp_handler = type("DTPHandler", (TunedDTPHandler,), {})
+        return handler, handler.dtp_handler
+    if SSL is None:
+        raise ValueError("启用FTPS需要安装pyOpenSSL: pip install pyOpenSSL")
+    if not tls_config.get("certfile"):
+        raise ValueError("启用FTPS需要设置证书文件 tls.certfile")
+    context = create_ssl_context(tls_config["certfile"], tls_config["keyfile"],
+                                 tls_config["ciphers"], tls_config["ciphersuites"],
+                                 tls_config["min_version"], tls_config["session_timeout"],
+                                 tls_config["session_tickets"])
+    handler = type("FTPHandler", (SecureFTPHandler,), {
+        "ssl_context": context,
+        "tls_control_required": tls_config["control_required"],
+        "tls_data_required": tls_config["data_required"],
+        "require_session_reuse": tls_config["require_session_reuse"],
+    })
+    handler.dtp_handler = type("DTPHandler", (SecureDTPHandler,), {})
+    logging.getLogger("FTPServer.TLS").info(
+        f"已启用FTPS，最低版本 {tls_config['min_version']}，"
+        f"会话票据{'开启' if tls_config['session_tickets'] else '关闭'}")
+    return handler, handler.dtp_handler
@@ -3,7 +3,9 @@
 
 """
 FTP服务器管理程序
-这个文件作为向后兼容性入口点，导入并执行main.py中的程序。
+这个文件作为向后兼容性入口点:
+    python ftpserver.py                 启动图形界面
+    python -m ftpserver serve           无界面运行服务器（不导入tkinter）
 """
 
 import sys
@@ -14,11 +16,17 @@ if sys.version_info < (3, 6):
     print("错误: 需要 Python 3.6 或更高版本")
     sys.exit(1)
 
-# 导入并执行主程序
+# 导入服务器管理器和命令行入口（均不依赖tkinter）
+# FTPServerManager 是为兼容旧代码保留的导出，例如 from ftpserver import FTPServerManager
 try:
-    from main import main
-    main()
+    from server import FTPServerManager
+    from cli import main
 except ImportError as e:
     print(f"错误: 无法导入主程序: {e}")
-    print("请确保所有必要的模块文件 (main.py, gui.py, server.py, config.py, utils.py) 都在同一目录下。")
+    print("请确保所有必要的模块文件 (main.py, gui.py, server.py, config.py, utils.py, cli.py) 都在同一目录下。")
     sys.exit(1)
+
+__all__ = ["FTPServerManager", "main"]
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,29 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import os
-import re
+import time
 import tkinter as tk
+from collections import deque
 from tkinter import ttk, scrolledtext, messagebox, filedialog
 
 from server import FTPServerManager
-from utils import ToolTip, debounce
+from logpipeline import LOG_FILE
+from logtail import LogTailer
+from logsearch import LogIndex, highlight_segments, parse_time_bound
+from userindex import UserIndex
+from utils import ToolTip, debounce, format_bytes
 
 class FTPServerGUI:
     """FTP服务器图形界面类"""
+    
+    # 日志索引中最多保存的条数、日志区域每页最多显示的条数和刷新间隔（毫秒）
+    LOG_INDEX_SIZE = 1000000
+    LOG_DISPLAY_LIMIT = 500
+    LOG_REFRESH_MS = 2000
+    # 用户列表的搜索字段和输入搜索内容后延迟查询的时间（毫秒）
+    USER_SEARCH_FIELDS = {"用户名": "username", "主目录": "directory"}
+    USER_SEARCH_DELAY_MS = 200
+    
     def __init__(self, root):
         self.root = root
         self.root.title("FTP服务器管理器")
@@ -98,7 +111,14 @@ class FTPServerGUI:
         """更新状态栏信息"""
         status = self.server_manager.get_server_status()
         
-        if status["running"]:
+        if status["running"] and status["draining"]:
+            self.status_indicator.config(foreground="orange")
+            progress = self.server_manager.drain_progress
+            if progress is not None:
+                self.status_info.config(text=f"正在停止 - 等待 {progress.transfers} 个传输完成，"
+                                             f"剩余 {progress.remaining:.0f} 秒")
+            self.conn_info.config(text=f"连接数: {status['connections']}")
+        elif status["running"]:
             self.status_indicator.config(foreground="green")
             self.status_info.config(text=f"服务器运行中 - {status['address']}:{status['port']}")
             self.conn_info.config(text=f"连接数: {status['connections']}")
@@ -215,21 +235,30 @@ class FTPServerGUI:
         self.port_count_label.grid(row=0, column=3, padx=10)
         
         # 添加端口数量更新函数
+        # 每个连接同时最多占用一个被动端口，端口数少于最大连接数时PASV可能因端口用完被拒绝
         def update_port_count(*args):
             try:
                 start = self.start_port_var.get()
                 end = self.end_port_var.get()
                 if start <= end:
                     count = end - start + 1
-                    self.port_count_label.config(text=f"共 {count} 个端口")
+                    max_conn = self.max_conn_var.get()
+                    if count < max_conn:
+                        self.port_count_label.config(
+                            text=f"共 {count} 个端口，少于最大连接数 {max_conn}", foreground="orange")
+                    else:
+                        self.port_count_label.config(text=f"共 {count} 个端口", foreground="")
                 else:
-                    self.port_count_label.config(text="无效范围")
+                    self.port_count_label.config(text="无效范围", foreground="red")
             except tk.TclError:
-                self.port_count_label.config(text="输入错误")
+                self.port_count_label.config(text="输入错误", foreground="red")
         
-        # 当端口值改变时更新端口数量
+        # 当端口值或最大连接数改变时更新端口数量
         self.start_port_var.trace_add("write", update_port_count)
         self.end_port_var.trace_add("write", update_port_count)
+        self.max_conn_var.trace_add("write", update_port_count)
+        update_port_count()
+        ToolTip(self.port_count_label, "每个连接同时最多占用一个被动端口，端口数应不少于最大连接数")
         
         # 保存配置按钮
         save_button = ttk.Button(frame_config, text="保存配置", command=self.save_config)
@@ -242,7 +271,7 @@ class FTPServerGUI:
         connection_frame.rowconfigure(0, weight=1)
         
         # 连接列表视图
-        columns = ("ip", "port", "user", "time", "status", "file", "bytes")
+        columns = ("ip", "port", "user", "time", "status", "file", "bytes", "rate")
         self.conn_tree = ttk.Treeview(connection_frame, columns=columns, show="headings", height=6)
         
         # 设置列标题
@@ -253,6 +282,7 @@ class FTPServerGUI:
         self.conn_tree.heading("status", text="状态")
         self.conn_tree.heading("file", text="文件")
         self.conn_tree.heading("bytes", text="已传输")
+        self.conn_tree.heading("rate", text="速率")
         
         # 设置列宽
         self.conn_tree.column("ip", width=100)
@@ -262,6 +292,7 @@ class FTPServerGUI:
         self.conn_tree.column("status", width=80)
         self.conn_tree.column("file", width=150)
         self.conn_tree.column("bytes", width=80)
+        self.conn_tree.column("rate", width=80)
         
         # 添加滚动条
         conn_scrollbar = ttk.Scrollbar(connection_frame, orient=tk.VERTICAL, command=self.conn_tree.yview)
@@ -271,6 +302,10 @@ class FTPServerGUI:
         conn_scrollbar.grid(row=0, column=1, sticky=tk.NS)
         self.conn_tree.grid(row=0, column=0, sticky=tk.NSEW)
         
+        # 连接ID -> 当前显示的行内容，以及用于计算速率的 (时间, 已传输字节数)
+        self._conn_rows = {}
+        self._conn_samples = {}
+        
         # 开始定时更新连接信息
         self._update_connections()
 
@@ -278,26 +313,60 @@ class FTPServerGUI:
         self._setup_auto_save()
         
     def _update_connections(self):
-        """更新连接列表"""
-        # 清空现有项目
-        for item in self.conn_tree.get_children():
-            self.conn_tree.delete(item)
-            
-        # 获取当前连接信息并添加到视图
+        """更新连接列表: 按连接ID原地更新行，只插入新连接、删除已关闭的连接"""
         connections = self.server_manager.get_connections()
+        now = time.monotonic()
+        seen = set()
+        
         for conn in connections:
-            self.conn_tree.insert("", tk.END, values=(
+            conn_id = str(conn.get('id', f"{conn.get('ip', '')}:{conn.get('port', '')}"))
+            seen.add(conn_id)
+            transferred = conn.get('bytes_transferred')
+            # 会话累计字节数单调递增（包括正在进行的传输），用它计算速率不受新传输重置的影响
+            total = None
+            if conn.get('bytes_in') is not None:
+                total = conn['bytes_in'] + conn['bytes_out']
+            values = (
                 conn.get('ip', ''),
                 conn.get('port', ''),
                 conn.get('user', '匿名'),
                 conn.get('time_connected', ''),
                 conn.get('status', 'IDLE'),
                 conn.get('file', ''),
-                conn.get('bytes_transferred', '')
-            ))
+                format_bytes(transferred) if transferred is not None else '',
+                self._transfer_rate(conn_id, total if total is not None else transferred, now)
+            )
             
-        # 每2秒更新一次连接信息
-        self.root.after(2000, self._update_connections)
+            if conn_id not in self._conn_rows:
+                self.conn_tree.insert("", tk.END, iid=conn_id, values=values)
+            elif self._conn_rows[conn_id] != values:
+                self.conn_tree.item(conn_id, values=values)
+            self._conn_rows[conn_id] = values
+            
+        # 删除已关闭的连接
+        for conn_id in [c for c in self._conn_rows if c not in seen]:
+            self.conn_tree.delete(conn_id)
+            del self._conn_rows[conn_id]
+            self._conn_samples.pop(conn_id, None)
+            
+        # 刷新间隔随连接数增加: 少量连接时每秒刷新，连接很多时最慢5秒刷新一次
+        interval = min(5000, 1000 + 10 * len(connections))
+        self.root.after(interval, self._update_connections)
+        
+    def _transfer_rate(self, conn_id, transferred, now):
+        """根据两次刷新之间已传输字节数的变化计算传输速率"""
+        if transferred is None:
+            self._conn_samples.pop(conn_id, None)
+            return ''
+        previous = self._conn_samples.get(conn_id)
+        self._conn_samples[conn_id] = (now, transferred)
+        if previous is None or now <= previous[0]:
+            return ''
+        delta = transferred - previous[1]
+        if delta < 0:
+            # 开始了新的传输，计数器已重置
+            return ''
+        return f"{format_bytes(delta / (now - previous[0]))}/s"
     
     def _create_users_tab(self):
         """创建用户管理选项卡"""
@@ -311,48 +380,69 @@ class FTPServerGUI:
         frame_users = ttk.LabelFrame(users_frame, text="用户列表")
         frame_users.grid(row=0, column=0, sticky=tk.NSEW, padx=10, pady=10)
         frame_users.columnconfigure(0, weight=1)
-        frame_users.rowconfigure(0, weight=1)
+        frame_users.rowconfigure(1, weight=1)
         
-        # 用户列表视图
-        #columns = ("username", "directory", "permissions")
-        columns = ("username", "directory")
-        self.user_tree = ttk.Treeview(frame_users, columns=columns, show="headings")
+        # 搜索控件: 按用户名或主目录前缀过滤
+        search_frame = ttk.Frame(frame_users)
+        search_frame.grid(row=0, column=0, columnspan=2, sticky=tk.EW, pady=(5, 0))
+        search_frame.columnconfigure(2, weight=1)
         
-        # 设置列标题
-        self.user_tree.heading("username", text="用户名")
-        self.user_tree.heading("directory", text="主目录")
-        #self.user_tree.heading("permissions", text="权限")
+        ttk.Label(search_frame, text="搜索:").grid(row=0, column=0, padx=(5, 5))
+        self.user_search_field = tk.StringVar(value="用户名")
+        field_combo = ttk.Combobox(search_frame, textvariable=self.user_search_field,
+                                   values=list(self.USER_SEARCH_FIELDS), width=8, state="readonly")
+        field_combo.grid(row=0, column=1, padx=5)
+        field_combo.bind("<<ComboboxSelected>>", lambda e: self._schedule_user_search())
         
-        # 设置列宽
-        self.user_tree.column("username", width=100)
-        self.user_tree.column("directory", width=300)
-        #self.user_tree.column("permissions", width=100)
-        
-        # 添加滚动条
-        scrollbar = ttk.Scrollbar(frame_users, orient=tk.VERTICAL, command=self.user_tree.yview)
-        self.user_tree.configure(yscroll=scrollbar.set)
-        scrollbar.grid(row=0, column=1, sticky=tk.NS)
-        self.user_tree.grid(row=0, column=0, sticky=tk.NSEW)
-        
-        # 分页控件
-        page_frame = ttk.Frame(frame_users)
-        page_frame.grid(row=1, column=0, columnspan=2, sticky=tk.EW, pady=5)
+        self.user_search_var = tk.StringVar()
+        search_entry = ttk.Entry(search_frame, textvariable=self.user_search_var)
+        search_entry.grid(row=0, column=2, padx=5, sticky=tk.EW)
+        self.user_search_var.trace_add("write", lambda *args: self._schedule_user_search())
         
-        self.prev_button = ttk.Button(page_frame, text="上一页", command=lambda: self._change_page(-1))
-        self.prev_button.pack(side=tk.LEFT, padx=5)
+        ttk.Button(search_frame, text="清除", command=lambda: self.user_search_var.set("")).grid(
+            row=0, column=3, padx=5)
         
-        self.page_info = ttk.Label(page_frame, text="第 1/1 页")
-        self.page_info.pack(side=tk.LEFT, padx=10)
+        # 用户列表视图: 只创建可见的行，滚动时替换行的内容（虚拟列表）
+        columns = ("username", "directory")
+        self.user_tree = ttk.Treeview(frame_users, columns=columns, show="headings", selectmode="browse")
         
-        self.next_button = ttk.Button(page_frame, text="下一页", command=lambda: self._change_page(1))
-        self.next_button.pack(side=tk.LEFT, padx=5)
+        # 设置列标题（点击排序）和列宽
+        self.user_tree.heading("username", command=lambda: self._sort_users("username"))
+        self.user_tree.heading("directory", command=lambda: self._sort_users("directory"))
+        self.user_tree.column("username", width=100)
+        self.user_tree.column("directory", width=300)
         
-        # 存储当前页码
-        self.current_page = 1
-        self.page_size = 100
+        # 滚动条的位置由 _render_users 根据查询结果计算
+        self.user_scrollbar = ttk.Scrollbar(frame_users, orient=tk.VERTICAL, command=self._on_user_scroll)
+        self.user_scrollbar.grid(row=1, column=1, sticky=tk.NS)
+        self.user_tree.grid(row=1, column=0, sticky=tk.NSEW)
+        
+        self.user_count_label = ttk.Label(frame_users, text="")
+        self.user_count_label.grid(row=2, column=0, columnspan=2, sticky=tk.W, padx=5, pady=5)
+        
+        # 虚拟列表的状态
+        self.user_index = UserIndex()
+        self._user_query = None
+        self._user_sort = ("username", False)
+        self._user_first = 0
+        self._user_visible_rows = 20
+        self._user_row_height = None
+        self._user_row_names = {}  # 行id -> 用户名
+        self._selected_username = None
+        self._user_search_job = None
+        
+        self.user_tree.bind("<Configure>", self._on_user_tree_resize)
+        self.user_tree.bind("<<TreeviewSelect>>", self._on_user_select)
+        self.user_tree.bind("<MouseWheel>", lambda e: self._scroll_users(-3 if e.delta > 0 else 3))
+        self.user_tree.bind("<Button-4>", lambda e: self._scroll_users(-3))
+        self.user_tree.bind("<Button-5>", lambda e: self._scroll_users(3))
+        self.user_tree.bind("<Up>", lambda e: self._move_user_selection(-1))
+        self.user_tree.bind("<Down>", lambda e: self._move_user_selection(1))
+        self.user_tree.bind("<Prior>", lambda e: self._scroll_users(-1, "pages"))
+        self.user_tree.bind("<Next>", lambda e: self._scroll_users(1, "pages"))
         
         # 加载用户数据
-        self._load_users(self.current_page, self.page_size)
+        self._load_users()
         
         # 用户操作框架
         frame_actions = ttk.Frame(users_frame)
@@ -370,34 +460,144 @@ class FTPServerGUI:
         # 添加双击编辑功能
         self.user_tree.bind("<Double-1>", lambda e: self.edit_user())
     
-    def _change_page(self, delta):
-        """更改用户列表页码"""
-        self.current_page += delta
-        self._load_users(self.current_page, self.page_size)
-
-    def _load_users(self, page=1, page_size=100):
-        """分页加载用户列表"""
-        # 清空现有项目
-        for item in self.user_tree.get_children():
-            self.user_tree.delete(item)
-            
-        # 获取当前页的用户
-        start = (page - 1) * page_size
-        end = start + page_size
-        page_users = self.server_manager.users[start:end]
-        
-        # 添加用户
-        for user in page_users:
-            self.user_tree.insert("", tk.END, values=(user["username"], user["directory"], user["permissions"]))
-        
-        # 更新分页信息
-        total_pages = max(1, (len(self.server_manager.users) + page_size - 1) // page_size)
-        self.page_info.config(text=f"第 {page}/{total_pages} 页")
-        
-        # 更新按钮状态
-        self.prev_button.config(state=tk.NORMAL if page > 1 else tk.DISABLED)
-        self.next_button.config(state=tk.NORMAL if page < total_pages else tk.DISABLED)
+    def _load_users(self):
+        """从用户存储重新建立用户列表索引并刷新显示"""
+        self.user_index.rebuild(self.server_manager.user_store)
+        self._query_users()
+        
+    def _refresh_user(self, username):
+        """用户增删改后只更新索引中的这一个用户"""
+        user = self.server_manager.get_user(username)
+        if user is None:
+            self.user_index.remove(username)
+            if self._selected_username == username:
+                self._selected_username = None
+        else:
+            self.user_index.put(user)
+        self._query_users(keep_position=True)
+        
+    def _schedule_user_search(self):
+        """输入搜索内容时延迟查询，连续输入只查询一次"""
+        if self._user_search_job is not None:
+            self.root.after_cancel(self._user_search_job)
+        self._user_search_job = self.root.after(self.USER_SEARCH_DELAY_MS, self._run_user_search)
+        
+    def _run_user_search(self):
+        self._user_search_job = None
+        self._query_users()
+        
+    def _sort_users(self, column):
+        """点击列标题: 按该列排序，再次点击切换升序/降序"""
+        sort, descending = self._user_sort
+        self._user_sort = (column, not descending if sort == column else False)
+        self._query_users()
+        
+    def _query_users(self, keep_position=False):
+        """按当前的搜索条件和排序查询索引，并显示第一屏"""
+        field = self.USER_SEARCH_FIELDS.get(self.user_search_field.get(), "username")
+        sort, descending = self._user_sort
+        self._user_query = self.user_index.query(self.user_search_var.get().strip(), field, sort, descending)
+        if not keep_position:
+            self._user_first = 0
+        for column, title in (("username", "用户名"), ("directory", "主目录")):
+            arrow = (" ▼" if descending else " ▲") if column == sort else ""
+            self.user_tree.heading(column, text=title + arrow)
+        total = len(self.user_index)
+        matched = len(self._user_query)
+        if matched == total:
+            self.user_count_label.config(text=f"共 {total} 个用户")
+        else:
+            self.user_count_label.config(text=f"匹配 {matched} / 共 {total} 个用户")
+        self._render_users()
         
+    def _render_users(self):
+        """只显示从 _user_first 开始的可见行，复用已有的行"""
+        query = self._user_query
+        if query is None:
+            return
+        visible = self._user_visible_rows
+        self._user_first = max(0, min(self._user_first, len(query) - visible))
+        rows = query.rows(self._user_first, visible)
+        items = self.user_tree.get_children()
+        selected = None
+        self._user_row_names = {}
+        for i, row in enumerate(rows):
+            if i < len(items):
+                iid = items[i]
+                self.user_tree.item(iid, values=row[:2])
+            else:
+                iid = self.user_tree.insert("", tk.END, values=row[:2])
+            self._user_row_names[iid] = row[0]
+            if row[0] == self._selected_username:
+                selected = iid
+        if len(items) > len(rows):
+            self.user_tree.delete(*items[len(rows):])
+        if selected is not None:
+            self.user_tree.selection_set(selected)
+        elif self.user_tree.selection():
+            self.user_tree.selection_remove(*self.user_tree.selection())
+        
+        total = len(query)
+        if total <= visible:
+            self.user_scrollbar.set(0.0, 1.0)
+        else:
+            self.user_scrollbar.set(self._user_first / total, (self._user_first + len(rows)) / total)
+            
+    def _on_user_scroll(self, action, *args):
+        """滚动条回调: ("moveto", 比例) 或 ("scroll", 数量, "units"/"pages")"""
+        if self._user_query is None:
+            return
+        if action == "moveto":
+            self._user_first = int(float(args[0]) * len(self._user_query))
+            self._render_users()
+        elif action == "scroll":
+            self._scroll_users(int(args[0]), args[1])
+            
+    def _scroll_users(self, amount, what="units"):
+        step = max(1, self._user_visible_rows - 1) if what == "pages" else 1
+        self._user_first += amount * step
+        self._render_users()
+        return "break"
+        
+    def _move_user_selection(self, delta):
+        """方向键移动选中的行，到达可见区域边缘时滚动"""
+        items = self.user_tree.get_children()
+        if not items:
+            return "break"
+        selection = self.user_tree.selection()
+        position = items.index(selection[0]) + delta if selection else 0
+        if position < 0:
+            self._scroll_users(-1)
+            position = 0
+        elif position >= len(items):
+            self._scroll_users(1)
+            position = len(items) - 1
+        items = self.user_tree.get_children()
+        if items:
+            iid = items[min(position, len(items) - 1)]
+            self._selected_username = self._user_row_names.get(iid)
+            self.user_tree.selection_set(iid)
+            self.user_tree.focus(iid)
+        return "break"
+        
+    def _on_user_select(self, event=None):
+        # 滚动时选中的行可能不在可见区域内，用户名单独保存
+        selection = self.user_tree.selection()
+        if selection and selection[0] in self._user_row_names:
+            self._selected_username = self._user_row_names[selection[0]]
+            
+    def _on_user_tree_resize(self, event):
+        """窗口大小改变时重新计算可见的行数"""
+        items = self.user_tree.get_children()
+        bbox = self.user_tree.bbox(items[0]) if items else None
+        if bbox:
+            self._user_row_height = (bbox[1], bbox[3])
+        header, row_height = self._user_row_height or (25, 20)
+        visible = max(1, (event.height - header) // row_height)
+        if visible != self._user_visible_rows:
+            self._user_visible_rows = visible
+            self._render_users()
+            
     def _create_logs_tab(self):
         """创建日志选项卡"""
         # 日志框架
@@ -409,7 +609,7 @@ class FTPServerGUI:
         # 添加搜索和过滤控件
         filter_frame = ttk.Frame(logs_frame)
         filter_frame.grid(row=0, column=0, sticky=tk.EW, padx=10, pady=5)
-        filter_frame.columnconfigure(1, weight=1)  # 搜索框可以扩展
+        filter_frame.columnconfigure(3, weight=1)  # 搜索框可以扩展
         
         # 日志级别过滤
         ttk.Label(filter_frame, text="级别:").grid(row=0, column=0, padx=(0, 5))
@@ -431,10 +631,32 @@ class FTPServerGUI:
         search_button.grid(row=0, column=4, padx=5)
         
         # 清除按钮
-        clear_button = ttk.Button(filter_frame, text="清除", 
-                               command=lambda: [self.search_var.set(""), self.level_var.set("ALL"), self._filter_logs()])
+        clear_button = ttk.Button(filter_frame, text="清除", command=self._clear_log_filter)
         clear_button.grid(row=0, column=5, padx=5)
         
+        # 时间范围（YYYY-MM-DD HH:MM:SS 或 HH:MM，可以只填一端）
+        time_frame = ttk.Frame(filter_frame)
+        time_frame.grid(row=1, column=0, columnspan=6, sticky=tk.EW, pady=(5, 0))
+        ttk.Label(time_frame, text="时间从:").pack(side=tk.LEFT, padx=(0, 5))
+        self.log_since_var = tk.StringVar()
+        since_entry = ttk.Entry(time_frame, textvariable=self.log_since_var, width=20)
+        since_entry.pack(side=tk.LEFT, padx=5)
+        since_entry.bind("<Return>", lambda e: self._filter_logs())
+        ttk.Label(time_frame, text="到:").pack(side=tk.LEFT, padx=5)
+        self.log_until_var = tk.StringVar()
+        until_entry = ttk.Entry(time_frame, textvariable=self.log_until_var, width=20)
+        until_entry.pack(side=tk.LEFT, padx=5)
+        until_entry.bind("<Return>", lambda e: self._filter_logs())
+        ToolTip(since_entry, "格式: YYYY-MM-DD HH:MM:SS、YYYY-MM-DD 或 HH:MM（今天）")
+        
+        # 分页: 结果从新到旧，每页最多 LOG_DISPLAY_LIMIT 条
+        self.log_newer_button = ttk.Button(time_frame, text="较新", command=self._newer_logs)
+        self.log_newer_button.pack(side=tk.RIGHT, padx=5)
+        self.log_older_button = ttk.Button(time_frame, text="较早", command=self._older_logs)
+        self.log_older_button.pack(side=tk.RIGHT, padx=5)
+        self.log_page_info = ttk.Label(time_frame, text="")
+        self.log_page_info.pack(side=tk.RIGHT, padx=10)
+        
         # 日志显示区域
         self.log_text = scrolledtext.ScrolledText(logs_frame, wrap=tk.WORD)
         self.log_text.grid(row=1, column=0, sticky=tk.NSEW, padx=10, pady=(0, 10))
@@ -446,112 +668,150 @@ class FTPServerGUI:
         self.log_text.tag_configure("ERROR", foreground="red")
         self.log_text.tag_configure("CRITICAL", foreground="red", background="yellow")
         self.log_text.tag_configure("HIGHLIGHT", background="yellow")
-        
-        # 存储原始日志内容
-        self.log_entries = []
-        
-        # 加载日志
-        self._load_logs()
+        # 高亮标签优先于级别标签
+        self.log_text.tag_raise("HIGHLIGHT")
+        
+        # 增量读取日志文件，解析后的日志加入倒排索引
+        self.log_tailer = LogTailer(LOG_FILE)
+        self.log_index = LogIndex(self.LOG_INDEX_SIZE)
+        # 当前的搜索条件、每一页的起点（before编号，第一页为None）
+        self._log_query = ("", "ALL", None, None)
+        self._log_pages = [None]
+        self._log_has_older = False
+        # 第一页实时追加新日志时，上次搜索到的最大编号
+        self._log_after = -1
+        # 当前显示的每条日志的 (编号, 行数)，用于从顶部删除最旧的日志
+        self._displayed_log_lines = deque()
+        
+        # 加载日志（首次读取文件末尾的一部分）
+        try:
+            new_entries, _ = self.log_tailer.poll()
+            self.log_index.add(new_entries)
+        except Exception as e:
+            messagebox.showerror("错误", f"无法加载日志文件: {str(e)}")
+        self._filter_logs()
         
         # 自动刷新日志
-        self.root.after(5000, self._refresh_logs)
+        self.root.after(self.LOG_REFRESH_MS, self._refresh_logs)
     
     def _load_logs(self):
-        """加载日志内容"""
+        """增量加载日志内容: 只解析和索引新追加的行，并只把匹配的新行追加到显示区域"""
         try:
-            if os.path.exists("logs/ftp_server.log"):
-                with open("logs/ftp_server.log", "r") as f:
-                    log_content = f.read()
-                
-                # 清空当前记录
-                self.log_entries = []
-                
-                # 使用正则表达式匹配日志级别
-                log_pattern = r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}) - (\w+) - (\w+) - (.*?)(?=\d{4}-\d{2}-\d{2}|\Z)'
-                matches = re.findall(log_pattern, log_content, re.DOTALL)
-                
-                # 存储解析后的日志条目
-                for timestamp, logger, level, message in matches:
-                    self.log_entries.append({
-                        "timestamp": timestamp,
-                        "logger": logger,
-                        "level": level,
-                        "message": message.strip(),
-                        "text": f"{timestamp} - {logger} - {level} - {message.strip()}\n"
-                    })
-                
-                # 应用过滤并显示
-                self._filter_logs()
+            new_entries, reset = self.log_tailer.poll()
         except Exception as e:
             messagebox.showerror("错误", f"无法加载日志文件: {str(e)}")
+            return
+        # 没有新日志时也要调用，上一条日志可能追加了续行
+        self.log_index.add(new_entries)
+            
+        if reset:
+            # 日志文件被轮转或截断，重新显示
+            self._show_log_page()
+        elif new_entries:
+            self._append_logs()
+
+    def _clear_log_filter(self):
+        self.search_var.set("")
+        self.level_var.set("ALL")
+        self.log_since_var.set("")
+        self.log_until_var.set("")
+        self._filter_logs()
 
     def _filter_logs(self):
-        """根据过滤条件显示日志"""
-        # 获取过滤条件
-        level = self.level_var.get()
-        search_text = self.search_var.get().lower()
+        """根据过滤条件从第一页（最新的日志）开始显示"""
+        try:
+            since = parse_time_bound(self.log_since_var.get())
+            until = parse_time_bound(self.log_until_var.get(), end=True)
+        except ValueError as e:
+            messagebox.showerror("错误", str(e))
+            return
+        self._log_query = (self.search_var.get(), self.level_var.get(), since, until)
+        self._log_pages = [None]
+        self._show_log_page()
+        
+    def _older_logs(self):
+        """显示更早的一页匹配日志"""
+        if self._displayed_log_lines:
+            self._log_pages.append(self._displayed_log_lines[0][0])
+            self._show_log_page()
+            
+    def _newer_logs(self):
+        """返回较新的一页"""
+        if len(self._log_pages) > 1:
+            self._log_pages.pop()
+            self._show_log_page()
+
+    def _show_log_page(self):
+        """显示当前页的匹配日志"""
+        search_text, level, since, until = self._log_query
+        page = self.log_index.search(search_text, level, since, until,
+                                     before=self._log_pages[-1], limit=self.LOG_DISPLAY_LIMIT)
+        self._log_after = self.log_index.next_id - 1
+        self._log_has_older = page.has_more
         
         # 清空现有内容
         self.log_text.delete(1.0, tk.END)
+        self._displayed_log_lines.clear()
         
-        # 应用过滤条件
-        filtered_entries = []
-        for entry in self.log_entries:
-            # 级别过滤
-            if level != "ALL" and entry["level"] != level:
-                continue
-                
-            # 搜索文本过滤
-            if search_text and search_text not in entry["text"].lower():
-                continue
-                
-            filtered_entries.append(entry)
-        
-        # 如果过滤后条目过多，只显示最近的500条以避免性能问题
-        MAX_ENTRIES = 500
-        if len(filtered_entries) > MAX_ENTRIES:
-            filtered_entries = filtered_entries[-MAX_ENTRIES:]
-            self.log_text.insert(tk.END, f"[注意: 仅显示最近 {MAX_ENTRIES} 条匹配日志]\n\n", "WARNING")
-        
-        # 显示过滤后的日志
-        for entry in filtered_entries:
-            log_level = entry["level"]
-            text = entry["text"]
-            
-            # 插入带有适当标签的文本
-            self.log_text.insert(tk.END, text, log_level)
-            
-            # 如果有搜索文本，高亮它
-            if search_text:
-                self._highlight_text(search_text)
+        # 显示匹配的日志，插入时直接标出高亮的部分
+        for entry_id, entry_level, text in page.entries:
+            self._insert_log_entry(entry_id, entry_level, text, search_text)
+        self._update_log_page_info()
         
         # 滚动到末尾
         self.log_text.see(tk.END)
-    
-    def _highlight_text(self, search_text):
-        """高亮显示搜索的文本"""
-        search_text = search_text.lower()
-        start_pos = "1.0"
-        
-        while True:
-            # 查找下一个匹配位置
-            start_pos = self.log_text.search(search_text, start_pos, tk.END, nocase=True)
-            if not start_pos:
-                break
-                
-            # 计算结束位置
-            end_pos = f"{start_pos}+{len(search_text)}c"
+
+    def _append_logs(self):
+        """在第一页时把匹配的新日志追加到显示区域末尾，超出显示上限时删除最旧的行"""
+        if len(self._log_pages) > 1:
+            # 正在查看更早的日志
+            return
+        search_text, level, since, until = self._log_query
+        page = self.log_index.search(search_text, level, since, until, after=self._log_after,
+                                     limit=self.LOG_DISPLAY_LIMIT)
+        self._log_after = self.log_index.next_id - 1
+        if not page.entries:
+            return
+        if page.has_more:
+            # 新日志已超过显示上限，直接重新显示
+            self._show_log_page()
+            return
             
-            # 添加高亮标签
-            self.log_text.tag_add("HIGHLIGHT", start_pos, end_pos)
+        # 用户正在查看历史日志时不自动滚动
+        at_bottom = self.log_text.yview()[1] >= 0.999
+        for entry_id, entry_level, text in page.entries:
+            self._insert_log_entry(entry_id, entry_level, text, search_text)
             
-            # 更新开始位置
-            start_pos = end_pos
+        # 删除超出显示上限的最旧日志
+        excess = len(self._displayed_log_lines) - self.LOG_DISPLAY_LIMIT
+        if excess > 0:
+            removed_lines = sum(self._displayed_log_lines.popleft()[1] for _ in range(excess))
+            self.log_text.delete("1.0", f"{1 + removed_lines}.0")
+            self._log_has_older = True
+        self._update_log_page_info()
+        if at_bottom:
+            self.log_text.see(tk.END)
+
+    def _insert_log_entry(self, entry_id, level, text, search_text=""):
+        """插入一条带有级别标签的日志，匹配搜索文本的部分同时带有高亮标签"""
+        args = []
+        for segment, matched in highlight_segments(text, search_text):
+            args.append(segment)
+            args.append((level, "HIGHLIGHT") if matched else (level,))
+        self.log_text.insert(tk.END, *args)
+        self._displayed_log_lines.append((entry_id, text.count("\n")))
+        
+    def _update_log_page_info(self):
+        page = len(self._log_pages)
+        shown = len(self._displayed_log_lines)
+        self.log_page_info.config(text=f"第 {page} 页，{shown} 条" if shown else "没有匹配的日志")
+        self.log_older_button.config(state=tk.NORMAL if self._log_has_older else tk.DISABLED)
+        self.log_newer_button.config(state=tk.NORMAL if page > 1 else tk.DISABLED)
             
     def _refresh_logs(self):
         """定时刷新日志"""
-        self._load_logs()  # 加载并应用当前过滤器
-        self.root.after(5000, self._refresh_logs)
+        self._load_logs()  # 只读取新追加的日志
+        self.root.after(self.LOG_REFRESH_MS, self._refresh_logs)
     
     # 为配置字段添加自动保存功能
     def _setup_auto_save(self):
@@ -657,8 +917,25 @@ class FTPServerGUI:
             messagebox.showerror("错误", f"启动FTP服务器失败\n\n{error_msg}")
             
     def stop_server(self):
-        """停止FTP服务器"""
-        result, error_msg = self.server_manager.stop_server()
+        """停止FTP服务器: 先排空，等正在进行的传输完成；排空期间再次点击立即停止"""
+        if self.server_manager.draining:
+            self.server_manager.stop_server()
+            return
+        result, error_msg = self.server_manager.drain_server()
+        if result:
+            self.stop_button.config(text="立即停止")
+            self.status_label.config(text="服务器正在停止，等待正在进行的传输完成")
+            self._wait_for_drain()
+        else:
+            messagebox.showerror("错误", f"停止FTP服务器失败\n\n{error_msg}")
+            
+    def _wait_for_drain(self):
+        """排空在后台线程中进行，这里定期检查是否已经停止，不阻塞界面"""
+        if self.server_manager.draining:
+            self.root.after(250, self._wait_for_drain)
+            return
+        self.stop_button.config(text="停止服务器")
+        result, error_msg = self.server_manager.drain_result or (True, None)
         if result:
             self.status_label.config(text="服务器未运行")
             self.start_button.config(state=tk.NORMAL)
@@ -671,7 +948,7 @@ class FTPServerGUI:
         """显示添加用户对话框"""
         dialog = tk.Toplevel(self.root)
         dialog.title("添加用户")
-        dialog.geometry("500x400")  # 增大对话框尺寸以容纳复选框
+        dialog.geometry("500x470")  # 增大对话框尺寸以容纳复选框
         dialog.resizable(False, False)
         dialog.grab_set()  # 模态对话框
         
@@ -734,9 +1011,12 @@ class FTPServerGUI:
         ttk.Button(select_frame, text="全选", command=select_all).pack(side=tk.LEFT, padx=5)
         ttk.Button(select_frame, text="全不选", command=deselect_all).pack(side=tk.LEFT, padx=5)
         
+        # 限速设置
+        read_limit_var, write_limit_var = self._create_limit_frame(dialog)
+        
         # 按钮
         button_frame = ttk.Frame(dialog)
-        button_frame.grid(row=4, column=0, columnspan=3, pady=10)
+        button_frame.grid(row=5, column=0, columnspan=3, pady=10)
         
         def get_permissions_string():
             """根据复选框状态生成权限字符串"""
@@ -748,7 +1028,9 @@ class FTPServerGUI:
                      username_var.get(), 
                      password_var.get(), 
                      directory_var.get(), 
-                     get_permissions_string()
+                     get_permissions_string(),
+                     read_limit_var.get(),
+                     write_limit_var.get()
                  )).pack(side=tk.LEFT, padx=5)
         
         ttk.Button(button_frame, text="取消", 
@@ -757,17 +1039,48 @@ class FTPServerGUI:
         # 设置列权重
         dialog.columnconfigure(1, weight=1)
         
-    def _add_user(self, dialog, username, password, directory, permissions):
+    def _create_limit_frame(self, dialog, user_info=None):
+        """在用户对话框中创建上传/下载限速输入框（KB/s，0表示不限速）"""
+        limit_frame = ttk.LabelFrame(dialog, text="限速设置 (KB/s，0表示不限速)")
+        limit_frame.grid(row=4, column=0, columnspan=3, padx=10, pady=5, sticky=tk.EW)
+        user_info = user_info or {}
+        
+        ttk.Label(limit_frame, text="上传:").grid(row=0, column=0, sticky=tk.W, padx=10, pady=2)
+        read_limit_var = tk.StringVar(value=str(user_info.get("read_limit", 0) // 1024))
+        ttk.Entry(limit_frame, textvariable=read_limit_var, width=10).grid(row=0, column=1, sticky=tk.W, padx=5, pady=2)
+        
+        ttk.Label(limit_frame, text="下载:").grid(row=0, column=2, sticky=tk.W, padx=10, pady=2)
+        write_limit_var = tk.StringVar(value=str(user_info.get("write_limit", 0) // 1024))
+        ttk.Entry(limit_frame, textvariable=write_limit_var, width=10).grid(row=0, column=3, sticky=tk.W, padx=5, pady=2)
+        
+        return read_limit_var, write_limit_var
+        
+    def _parse_limit(self, text):
+        """把输入的KB/s转换为字节/秒，输入无效时返回None"""
+        try:
+            value = int(text.strip() or 0)
+        except ValueError:
+            return None
+        return value * 1024 if value >= 0 else None
+        
+    def _add_user(self, dialog, username, password, directory, permissions,
+                  read_limit="0", write_limit="0"):
         """添加用户"""
         if not username or not password or not directory:
             messagebox.showerror("错误", "所有字段都必须填写", parent=dialog)
             return
             
+        read_limit, write_limit = self._parse_limit(read_limit), self._parse_limit(write_limit)
+        if read_limit is None or write_limit is None:
+            messagebox.showerror("错误", "限速必须是非负整数", parent=dialog)
+            return
+            
         # 添加用户，获取状态和消息
-        success, message = self.server_manager.add_user(username, password, directory, permissions)
+        success, message = self.server_manager.add_user(username, password, directory, permissions,
+                                                        read_limit, write_limit)
         
         if success:
-            self._load_users()  # 重新加载用户列表
+            self._refresh_user(username)  # 更新用户列表
             dialog.destroy()
             messagebox.showinfo("成功", f"用户 {username} 已添加")
         else:
@@ -779,36 +1092,27 @@ class FTPServerGUI:
             
     def remove_user(self):
         """删除选定用户"""
-        selected_item = self.user_tree.selection()
-        if not selected_item:
+        username = self._selected_username
+        if not username:
             messagebox.showwarning("警告", "请先选择要删除的用户")
             return
             
-        username = self.user_tree.item(selected_item[0])["values"][0]
         if messagebox.askyesno("确认", f"确定要删除用户 {username} 吗?"):
             if self.server_manager.remove_user(username):
-                self._load_users()  # 重新加载用户列表
+                self._refresh_user(username)  # 更新用户列表
                 messagebox.showinfo("成功", f"用户 {username} 已删除")
             else:
                 messagebox.showerror("错误", f"删除用户 {username} 失败")
                 
     def edit_user(self):
         """编辑选定用户"""
-        selected_item = self.user_tree.selection()
-        if not selected_item:
+        username = self._selected_username
+        if not username:
             messagebox.showwarning("警告", "请先选择要编辑的用户")
             return
-            
-        # 获取选定用户的信息
-        selected_values = self.user_tree.item(selected_item[0])["values"]
-        username = selected_values[0]
         
         # 查找用户完整信息
-        user_info = None
-        for user in self.server_manager.users:
-            if user["username"] == username:
-                user_info = user
-                break
+        user_info = self.server_manager.get_user(username)
         
         if not user_info:
             messagebox.showerror("错误", f"找不到用户 {username} 的信息")
@@ -821,7 +1125,7 @@ class FTPServerGUI:
         """显示编辑用户对话框"""
         dialog = tk.Toplevel(self.root)
         dialog.title(f"编辑用户: {user_info['username']}")
-        dialog.geometry("500x400")
+        dialog.geometry("500x470")
         dialog.resizable(False, False)
         dialog.grab_set()  # 模态对话框
         
@@ -887,9 +1191,12 @@ class FTPServerGUI:
         ttk.Button(select_frame, text="全选", command=select_all).pack(side=tk.LEFT, padx=5)
         ttk.Button(select_frame, text="全不选", command=deselect_all).pack(side=tk.LEFT, padx=5)
         
+        # 限速设置
+        read_limit_var, write_limit_var = self._create_limit_frame(dialog, user_info)
+        
         # 按钮
         button_frame = ttk.Frame(dialog)
-        button_frame.grid(row=4, column=0, columnspan=3, pady=10)
+        button_frame.grid(row=5, column=0, columnspan=3, pady=10)
         
         def get_permissions_string():
             """根据复选框状态生成权限字符串"""
@@ -910,8 +1217,21 @@ class FTPServerGUI:
             if new_permissions == user_info.get("permissions", "elradfmwMT"):
                 new_permissions = None
                 
+            # 获取新的限速
+            new_read_limit = self._parse_limit(read_limit_var.get())
+            new_write_limit = self._parse_limit(write_limit_var.get())
+            if new_read_limit is None or new_write_limit is None:
+                messagebox.showerror("错误", "限速必须是非负整数", parent=dialog)
+                return
+            # 只比较KB精度，避免手工写入的非整KB限速在未修改时被改写
+            if new_read_limit == user_info.get("read_limit", 0) // 1024 * 1024:
+                new_read_limit = None
+            if new_write_limit == user_info.get("write_limit", 0) // 1024 * 1024:
+                new_write_limit = None
+                
             # 如果没有任何修改，直接关闭对话框
-            if new_password is None and new_directory is None and new_permissions is None:
+            if (new_password is None and new_directory is None and new_permissions is None
+                    and new_read_limit is None and new_write_limit is None):
                 dialog.destroy()
                 return
                 
@@ -920,9 +1240,11 @@ class FTPServerGUI:
                 user_info["username"], 
                 new_password, 
                 new_directory, 
-                new_permissions
+                new_permissions,
+                new_read_limit,
+                new_write_limit
             ):
-                self._load_users(self.current_page, self.page_size)  # 重新加载用户列表
+                self._refresh_user(user_info["username"])  # 更新用户列表
                 dialog.destroy()
                 messagebox.showinfo("成功", f"用户 {user_info['username']} 的信息已更新")
             else:
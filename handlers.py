@@ -0,0 +1,446 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import errno
+import socket
+import itertools
+import threading
+
+from pyftpdlib.authorizers import AuthenticationFailed, AuthorizerError
+from pyftpdlib.handlers import ActiveDTP, DTPHandler, FTPHandler, PassiveDTP
+
+from throttle import consume_all, lowest_rate
+
+
+class SessionRegistry:
+    """会话注册表，记录当前所有已建立的控制连接
+
+    各种服务引擎（单线程、多线程）下的连接都会登记在这里，
+    因此不再需要去遍历IO循环内部的socket映射表。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = set()
+
+    def add(self, session):
+        """登记一个会话"""
+        with self._lock:
+            self._sessions.add(session)
+
+    def discard(self, session):
+        """移除一个会话（不存在时忽略）"""
+        with self._lock:
+            self._sessions.discard(session)
+
+    def sessions(self):
+        """返回当前会话列表的副本"""
+        with self._lock:
+            return list(self._sessions)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+
+def _authenticate(authorizer, username, password, handler):
+    """在线程池中执行: 校验密码，返回 (主目录, 登录消息)"""
+    authorizer.validate_authentication(username, password, handler)
+    return authorizer.get_home_dir(username), authorizer.get_msg_login(username)
+
+
+def _set_socket_buffers(sock, dtp_handler, log):
+    """在listen()/connect()之前设置数据套接字的内核发送/接收缓冲区大小
+
+    TCP窗口缩放因子在三次握手时就已确定，连接建立后再增大SO_RCVBUF无法提高
+    高延迟链路上的吞吐量；被动模式下accept()得到的套接字继承监听套接字的设置。
+    """
+    for option, size in ((socket.SO_SNDBUF, getattr(dtp_handler, "so_sndbuf", 0)),
+                         (socket.SO_RCVBUF, getattr(dtp_handler, "so_rcvbuf", 0))):
+        if not size:
+            continue
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, option, size)
+        except (OSError, AttributeError) as e:
+            log(f"设置套接字缓冲区失败: {str(e)}")
+
+
+class TunedDTPHandler(DTPHandler):
+    """可调节缓冲区、支持限速的数据通道处理器
+
+    ac_in_buffer_size / ac_out_buffer_size 决定每次recv()和send()的块大小，
+    使用sendfile时后者也是每次sendfile()调用传输的字节数。
+    so_sndbuf / so_rcvbuf 为0时保持系统默认的套接字缓冲区大小，非0时由被动监听
+    （PooledPassiveDTP）和主动连接（TunedActiveDTP）在建立连接之前设置。
+
+    bandwidth 为 BandwidthLimiter 时按全局和用户限速收发数据: 与pyftpdlib的
+    ThrottledDTPHandler 一样，超出配额后暂时把通道移出IO循环，到时间再恢复，
+    但配额来自所有会话共享的令牌桶，而且sendfile下载也同样限速。
+    """
+
+    so_sndbuf = 0
+    so_rcvbuf = 0
+    bandwidth = None
+    # 限速时把每秒的配额至少分成这么多个数据块，使流量更平滑
+    throttle_chunks_per_second = 8
+    _throttler = None
+    _read_buckets = None
+    _write_buckets = None
+    # 正在接收的上传的续传状态（resume.UploadState）
+    _upload = None
+    # 本次传输的字节数是否已经累加到会话计数器
+    _accounted = False
+    # 被动模式下占用的端口池端口及其所属的端口池，数据连接关闭时归还
+    pool_port = None
+    port_pool = None
+
+    def __init__(self, sock, cmd_channel):
+        super().__init__(sock, cmd_channel)
+        if self.bandwidth is not None:
+            self._read_buckets, self._write_buckets = \
+                self.bandwidth.buckets_for(cmd_channel.username)
+            self._limit_buffer_sizes()
+
+    def _limit_buffer_sizes(self):
+        """限速时减小数据块，避免一次收发大块数据后长时间停顿"""
+        read_rate = lowest_rate(self._read_buckets)
+        if read_rate:
+            self.ac_in_buffer_size = min(self.ac_in_buffer_size,
+                                         max(4096, read_rate // self.throttle_chunks_per_second))
+        write_rate = lowest_rate(self._write_buckets)
+        if write_rate:
+            self.ac_out_buffer_size = min(self.ac_out_buffer_size,
+                                          max(4096, write_rate // self.throttle_chunks_per_second))
+
+    def enable_receiving(self, type, cmd):
+        super().enable_receiving(type, cmd)
+        upload = getattr(self.cmd_channel, "pending_upload", None)
+        if upload is not None:
+            self.cmd_channel.pending_upload = None
+            # ASCII模式下写入磁盘的数据与接收到的不同，不记录续传状态
+            if type == 'i':
+                self._upload = upload
+
+    def recv(self, buffer_size):
+        chunk = super().recv(buffer_size)
+        if self._read_buckets is not None and chunk:
+            self._throttle(consume_all(self._read_buckets, len(chunk)))
+        if self._upload is not None and chunk:
+            self._upload.update(chunk)
+        return chunk
+
+    def send(self, data):
+        sent = super().send(data)
+        if self._write_buckets is not None and sent:
+            self._throttle(consume_all(self._write_buckets, sent))
+        return sent
+
+    def initiate_sendfile(self):
+        before = self.tot_bytes_sent
+        super().initiate_sendfile()
+        sent = self.tot_bytes_sent - before
+        if self._write_buckets is not None and sent and not self._closed:
+            self._throttle(consume_all(self._write_buckets, sent))
+
+    def _throttle(self, delay):
+        """超出配额时把通道移出IO循环，delay秒后再恢复读写"""
+        if delay <= 0 or self._closed:
+            return
+        self.del_channel()
+        self._cancel_throttler()
+        self._throttler = self.ioloop.call_later(delay, self._resume,
+                                                 _errback=self.handle_error)
+
+    def _resume(self):
+        self._throttler = None
+        if not self._closed:
+            self.add_channel(events=self.ioloop.READ if self.receive else self.ioloop.WRITE)
+
+    def _cancel_throttler(self):
+        if self._throttler is not None and not self._throttler.cancelled:
+            self._throttler.cancel()
+        self._throttler = None
+
+    def close(self):
+        """关闭数据连接，并把本次传输的字节数累加到所属会话的计数器上"""
+        self._cancel_throttler()
+        if not self._closed and not self._accounted:
+            # TLS数据连接先发送关闭通知，套接字可能稍后才真正关闭，期间close()会被再次调用
+            self._accounted = True
+            cmd_channel = self.cmd_channel
+            if hasattr(cmd_channel, "bytes_in"):
+                cmd_channel.bytes_in += self.tot_bytes_received
+                cmd_channel.bytes_out += self.tot_bytes_sent
+            metrics = getattr(cmd_channel, "metrics", None)
+            if metrics is not None:
+                metrics.data_transferred(self.tot_bytes_sent, self.tot_bytes_received)
+        super().close()
+        if self._closed:
+            self._after_close()
+
+    def _after_close(self):
+        """数据连接关闭后归还被动端口，记录上传的续传状态"""
+        port, self.pool_port = self.pool_port, None
+        if port is not None:
+            self.port_pool.release(port)
+        upload, self._upload = self._upload, None
+        if upload is not None:
+            # 文件已经关闭，磁盘上的大小和修改时间是最终值
+            try:
+                upload.finish(self.transfer_finished)
+            except OSError as e:
+                self.log(f"记录续传状态失败: {str(e)}")
+
+
+class PooledPassiveDTP(PassiveDTP):
+    """从端口池分配端口的被动监听
+
+    端口由控制连接在PASV时从端口池取出，通过 passive_ports 传给pyftpdlib；
+    端口被服务器以外的程序占用时换下一个空闲端口。客户端连上后端口交给数据通道，
+    数据通道关闭时归还；没有等到连接就关闭（超时、被新的PASV取代）时在这里归还。
+    listen()之前按数据通道的 so_sndbuf / so_rcvbuf 设置缓冲区，接受的数据连接继承这些设置。
+    """
+
+    pool_port = None
+    port_pool = None
+
+    def bind(self, addr):
+        pool = self.cmd_channel.port_pool
+        host, port = addr[:2]
+        if pool is None or port == 0 or self.cmd_channel.unclaimed_port != port:
+            return super().bind(addr)
+        self.cmd_channel.unclaimed_port = None
+        attempts = len(pool)
+        while True:
+            try:
+                super().bind((host, port) + tuple(addr[2:]))
+            except OSError as e:
+                attempts -= 1
+                next_port = pool.acquire() if e.errno == errno.EADDRINUSE and attempts > 0 else None
+                # 被占用的端口排到队尾，稍后再试
+                pool.release(port)
+                if next_port is None:
+                    raise
+                port = next_port
+            else:
+                self.pool_port, self.port_pool = port, pool
+                return
+
+    def listen(self, num):
+        _set_socket_buffers(self.socket, self.cmd_channel.dtp_handler, self.log)
+        super().listen(num)
+
+    def handle_accepted(self, sock, addr):
+        port, self.pool_port = self.pool_port, None
+        previous = self.cmd_channel.data_channel
+        super().handle_accepted(sock, addr)
+        if port is None:
+            return
+        data_channel = self.cmd_channel.data_channel
+        if not self._closed:
+            # 拒绝了其他地址的连接，继续等待客户端
+            self.pool_port = port
+        elif data_channel is not None and data_channel is not previous \
+                and isinstance(data_channel, TunedDTPHandler) and not data_channel._closed:
+            data_channel.pool_port, data_channel.port_pool = port, self.port_pool
+        else:
+            self.port_pool.release(port)
+
+    def close(self):
+        port, self.pool_port = self.pool_port, None
+        if port is not None:
+            self.port_pool.release(port)
+        super().close()
+
+
+class TunedActiveDTP(ActiveDTP):
+    """主动模式（PORT/EPRT）的数据连接，在connect()之前设置套接字缓冲区大小"""
+
+    def connect(self, address):
+        _set_socket_buffers(self.socket, self.cmd_channel.dtp_handler, self.log)
+        super().connect(address)
+
+
+class ManagedFTPHandler(FTPHandler):
+    """受FTPServerManager管理的控制连接处理器
+
+    每次启动服务器时都会派生一个新的子类，并把会话注册表等
+    运行期对象作为类属性挂载上去，避免修改pyftpdlib的全局FTPHandler。
+    """
+
+    # 由 FTPServerManager 在启动时设置
+    registry = None
+    metrics = None
+    ingest = None
+    resume_index = None
+    # ftp_STOR/APPE 创建、等待数据通道开始接收时取走的续传状态
+    pending_upload = None
+    # 进程内唯一的会话编号，界面用它作为连接的稳定标识
+    _session_ids = itertools.count(1)
+    session_id = None
+
+    # 会话计数器，只在IO循环线程中更新，由连接快照读取
+    bytes_in = 0
+    bytes_out = 0
+    commands = 0
+    last_activity = 0.0
+    # 最近一次数据连接是否使用被动模式（占用被动端口）
+    passive_mode = False
+    # 被动端口池（portpool.PassivePortPool），为None时按pyftpdlib的方式随机挑选端口
+    port_pool = None
+    passive_dtp = PooledPassiveDTP
+    active_dtp = TunedActiveDTP
+    # 已从端口池取出、还没有被被动监听使用的端口
+    unclaimed_port = None
+    # 服务器正在排空: 拒绝打开新数据连接的命令，正在进行的传输不受影响
+    draining = False
+    data_commands = frozenset(("PASV", "EPSV", "PORT", "EPRT", "RETR", "STOR", "STOU",
+                               "APPE", "LIST", "NLST", "MLSD"))
+    # 校验密码的线程池和在IO循环线程中执行回调的对象（提供线程安全的 call_soon()），
+    # 所有会话共用一个IO循环时由服务器设置，计算密码哈希时不会阻塞其他会话
+    auth_executor = None
+    scheduler = None
+    # 后台校验密码期间收到的命令，校验结束后按顺序处理
+    _deferred_commands = None
+
+    def handle(self):
+        """连接被接受后登记会话并发送欢迎信息"""
+        self.session_id = next(self._session_ids)
+        self.last_activity = time.time()
+        if self.registry is not None:
+            self.registry.add(self)
+        super().handle()
+
+    def pre_process_command(self, line, cmd, arg):
+        """统计命令数和最后活动时间，排空时和上传处理管线饱和时拒绝新的传输"""
+        if self._deferred_commands is not None:
+            self._deferred_commands.append((line, cmd, arg))
+            return
+        self.commands += 1
+        self.last_activity = time.time()
+        if self.metrics is not None:
+            # 未知命令归入同一类，避免客户端随意发送的命令名撑大指标
+            self.metrics.command(cmd if cmd in self.proto_cmds else "OTHER")
+        if self.draining and cmd in self.data_commands:
+            self.respond("421 Server is shutting down, please reconnect later.")
+            if self.data_channel is None:
+                self.close_when_done()
+            return
+        if (cmd in ("STOR", "STOU", "APPE") and self.authenticated
+                and self.ingest is not None and self.ingest.saturated):
+            self.respond("450 Server busy processing uploads, try again later.")
+            return
+        super().pre_process_command(line, cmd, arg)
+
+    def ftp_PASS(self, line):
+        """在线程池中校验密码，校验期间暂停读取这个会话的命令"""
+        if self.auth_executor is None or self.scheduler is None \
+                or self.authenticated or not self.username:
+            return super().ftp_PASS(line)
+        self._deferred_commands = []
+        self.del_channel()
+        future = self.auth_executor.submit(_authenticate, self.authorizer, self.username, line, self)
+        future.add_done_callback(
+            lambda future: self.scheduler.call_soon(self._finish_auth, line, future))
+
+    def _finish_auth(self, password, future):
+        """在IO循环线程中执行: 回复校验结果，再处理校验期间收到的命令"""
+        deferred, self._deferred_commands = self._deferred_commands, None
+        if self._closed:
+            return
+        self.add_channel()
+        try:
+            home, msg_login = future.result()
+        except (AuthenticationFailed, AuthorizerError) as err:
+            self.handle_auth_failed(str(err), password)
+        except Exception as e:
+            self.log(f"校验密码时出错: {str(e)}")
+            self.handle_auth_failed("", password)
+        else:
+            self.handle_auth_success(home, password, msg_login)
+        for line, cmd, arg in deferred:
+            if self._closed:
+                break
+            # 其中的PASS又开始了新的后台校验时，剩下的命令继续排队
+            self.pre_process_command(line, cmd, arg)
+
+    def on_login(self, username):
+        if self.metrics is not None:
+            self.metrics.login(True)
+        super().on_login(username)
+
+    def on_login_failed(self, username, password):
+        if self.metrics is not None:
+            self.metrics.login(False)
+        super().on_login_failed(username, password)
+
+    def log_transfer(self, cmd, filename, receive, completed, elapsed, bytes):
+        """文件传输结束时由数据通道调用，记录传输耗时"""
+        if self.metrics is not None:
+            self.metrics.transfer(receive, completed, elapsed)
+        if receive and hasattr(self.fs, "invalidate"):
+            # 上传改变了文件大小和修改时间，但不会改变目录的mtime
+            self.fs.invalidate(filename)
+        super().log_transfer(cmd, filename, receive, completed, elapsed, bytes)
+
+    def ftp_STOR(self, file, mode='w'):
+        """记录上传的起始位置: REST指定的偏移，或APPE时文件的当前大小"""
+        self.pending_upload = None
+        if self.resume_index is not None:
+            offset = self._restart_position
+            if 'a' in mode:
+                try:
+                    offset = self.fs.getsize(file)
+                except OSError:
+                    offset = 0
+            self.pending_upload = self.resume_index.begin(self.username, file, offset)
+        result = super().ftp_STOR(file, mode)
+        if result is None:
+            self.pending_upload = None
+        return result
+
+    def on_file_received(self, file):
+        """上传完成后把文件交给后处理管线，只提交任务，不在IO循环中处理"""
+        if self.ingest is not None:
+            self.ingest.submit(file, self.username, self.fs.root)
+        super().on_file_received(file)
+
+    def _make_epasv(self, extmode=False):
+        self.passive_mode = True
+        pool = self.port_pool
+        if pool is None:
+            super()._make_epasv(extmode)
+            return
+        # 先关闭之前的被动监听和数据连接，归还它们占用的端口
+        self._shutdown_connecting_dtp()
+        if self.data_channel is not None:
+            self.data_channel.close()
+            self.data_channel = None
+        port = pool.acquire()
+        if port is None:
+            if self.metrics is not None:
+                self.metrics.passive_ports_exhausted()
+            self.respond_w_warning("425 All passive ports are in use, try again later.")
+            return
+        # pyftpdlib只在 passive_ports 中挑选端口，这里只给它分配到的这一个
+        self.passive_ports = (port,)
+        self.unclaimed_port = port
+        try:
+            super()._make_epasv(extmode)
+        finally:
+            del self.passive_ports
+            # 没有创建被动监听（例如连接数已满）时归还端口
+            if self.unclaimed_port is not None:
+                pool.release(self.unclaimed_port)
+                self.unclaimed_port = None
+
+    def _make_eport(self, ip, port):
+        self.passive_mode = False
+        super()._make_eport(ip, port)
+
+    def close(self):
+        """关闭连接并从注册表中移除"""
+        if self.registry is not None:
+            self.registry.discard(self)
+        super().close()
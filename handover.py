@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+监听套接字交接（零停机重启）
+配置了 handover_socket 时，运行中的服务器在这个Unix套接字上等待新进程接手:
+
+1. 新进程连接Unix套接字，旧进程用 SCM_RIGHTS 把所有监听套接字的文件描述符发送过去
+2. 新进程用收到的套接字启动服务器，立即开始接受连接，然后回复 "ready"
+3. 旧进程收到 "ready" 后关闭自己的监听套接字副本并排空: 已有会话的传输继续完成，
+   最多等待 drain_timeout 秒后退出
+
+交接期间监听套接字始终处于打开状态，内核队列中的新连接由两个进程中的一个接受，
+不会被拒绝。新进程启动失败时回复 "failed"，旧进程继续正常服务。
+只支持POSIX平台，Unix套接字文件的权限为0600，只有同一用户的进程可以接手。
+"""
+
+import os
+import json
+import array
+import socket
+import logging
+import threading
+
+# 等待对方响应的最长时间（秒），新进程启动服务器的时间也包含在内
+HANDOVER_TIMEOUT = 30
+# 一次最多交接的监听套接字数
+MAX_SOCKETS = 64
+
+
+class HandoverError(Exception):
+    """交接失败: 对方没有响应、协议错误或旧进程拒绝交接"""
+
+
+def is_supported():
+    """当前平台是否支持通过Unix套接字传递文件描述符"""
+    return hasattr(socket, "AF_UNIX") and hasattr(socket, "SCM_RIGHTS") and \
+        hasattr(socket.socket, "sendmsg")
+
+
+def _send_message(conn, message, fds=()):
+    data = json.dumps(message).encode("utf-8") + b"\n"
+    ancillary = []
+    if fds:
+        ancillary.append((socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", fds)))
+    conn.sendmsg([data], ancillary)
+
+
+def _recv_message(conn):
+    """接收一条消息和随附的文件描述符，返回 (消息, 文件描述符列表)"""
+    fds = array.array("i")
+    data, ancdata, flags, _ = conn.recvmsg(65536, socket.CMSG_LEN(MAX_SOCKETS * fds.itemsize))
+    for level, kind, payload in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(payload[:len(payload) - len(payload) % fds.itemsize])
+    if flags & getattr(socket, "MSG_CTRUNC", 0) or not data.endswith(b"\n"):
+        for fd in fds:
+            os.close(fd)
+        raise HandoverError("交接消息不完整")
+    try:
+        return json.loads(data.decode("utf-8")), list(fds)
+    except ValueError:
+        for fd in fds:
+            os.close(fd)
+        raise HandoverError("无法解析交接消息")
+
+
+def request_listeners(path, timeout=HANDOVER_TIMEOUT):
+    """新进程: 向旧进程请求监听套接字
+
+    返回:
+        tuple: (与旧进程的连接, 监听套接字列表, 旧进程pid)。启动服务器后必须调用 confirm()
+    """
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.settimeout(timeout)
+        conn.connect(path)
+        message, fds = _recv_message(conn)
+    except BaseException:
+        conn.close()
+        raise
+    if "error" in message or len(fds) != len(message.get("families", ())):
+        for fd in fds:
+            os.close(fd)
+        conn.close()
+        raise HandoverError(message.get("error") or "收到的监听套接字数量不正确")
+    sockets = []
+    for fd, family in zip(fds, message["families"]):
+        sock = socket.socket(family, socket.SOCK_STREAM, 0, fileno=fd)
+        sock.setblocking(False)
+        sockets.append(sock)
+    return conn, sockets, message.get("pid")
+
+
+def confirm(conn, ok):
+    """新进程: 告诉旧进程服务器是否已经用收到的套接字启动，旧进程据此排空或继续服务"""
+    try:
+        conn.sendall(b"ready\n" if ok else b"failed\n")
+    except OSError:
+        pass  # 旧进程已经退出
+    finally:
+        conn.close()
+
+
+class HandoverListener:
+    """旧进程: 在Unix套接字上等待新进程接手监听套接字"""
+
+    def __init__(self, path, get_sockets, on_handover, timeout=HANDOVER_TIMEOUT):
+        """初始化交接监听器
+
+        参数:
+            path: Unix套接字文件路径，已存在的文件会被替换
+            get_sockets: 返回当前监听套接字列表的函数，服务器不能交接时返回空列表
+            on_handover: 新进程确认接手后调用，参数为新进程的pid（无法获取时为None）
+        """
+        self.path = os.path.abspath(path)
+        self.get_sockets = get_sockets
+        self.on_handover = on_handover
+        self.timeout = timeout
+        self.logger = logging.getLogger("FTPServer.Handover")
+        self._sock = None
+        self._inode = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """创建Unix套接字并启动后台线程"""
+        if self._thread is not None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        try:
+            # 上一个进程（可能就是被本进程接替的进程）留下的套接字文件
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.bind(self.path)
+            os.chmod(self.path, 0o600)
+            sock.listen(1)
+            sock.settimeout(0.5)
+        except BaseException:
+            sock.close()
+            raise
+        self._sock = sock
+        self._inode = os.stat(self.path).st_ino
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="handover")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """停止等待交接，只删除仍属于本进程的套接字文件"""
+        self._stop_event.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.timeout + 1)
+        self._thread = None
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+            try:
+                # 接手的新进程已经在同一路径上创建了自己的套接字文件
+                if os.stat(self.path).st_ino == self._inode:
+                    os.unlink(self.path)
+            except OSError:
+                pass
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                conn, _ = self._sock.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            with conn:
+                try:
+                    pid = self._serve(conn)
+                except (OSError, HandoverError) as e:
+                    self.logger.error(f"交接监听套接字失败: {str(e)}")
+                    continue
+            if pid is not False:
+                self.on_handover(pid)
+                return
+
+    def _serve(self, conn):
+        """发送监听套接字并等待新进程确认，返回新进程pid；新进程启动失败时返回False"""
+        conn.settimeout(self.timeout)
+        pid = _peer_pid(conn)
+        sockets = self.get_sockets()
+        if not sockets:
+            _send_message(conn, {"error": "服务器未在运行或正在停止"})
+            return False
+        self.logger.info(f"正在把 {len(sockets)} 个监听套接字交给新进程 {pid or ''}".rstrip())
+        _send_message(conn, {"pid": os.getpid(), "families": [int(s.family) for s in sockets]},
+                      [s.fileno() for s in sockets])
+        reply = b""
+        while not reply.endswith(b"\n"):
+            chunk = conn.recv(64)
+            if not chunk:
+                break
+            reply += chunk
+        if reply.strip() != b"ready":
+            self.logger.warning("新进程没有用交接的套接字启动服务器，继续由本进程服务")
+            return False
+        return pid
+
+
+def _peer_pid(conn):
+    """Unix套接字对端的进程号（仅Linux），无法获取时返回None"""
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+    try:
+        creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, array.array("i").itemsize * 3)
+    except OSError:
+        return None
+    return array.array("i", creds)[0]
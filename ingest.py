@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+上传文件后处理管线
+上传完成时，控制连接处理器在IO循环中只把文件交给有界的线程池/进程池，
+校验和计算、移动和压缩等阶段都在池中依次执行，不会阻塞IO循环。
+
+待处理的文件数达到 max_pending 时管线处于饱和状态，此时服务器暂时拒绝新的
+上传命令（450），已经完成的上传仍然会排队处理，不会丢弃。
+
+可用的处理阶段（按配置中的顺序执行）:
+  checksum  计算SHA-256，写入同名的 .sha256 旁路文件
+  shard     按SHA-256前缀把文件移动到分片目录，例如 <shard_dir>/ab/cd/文件名
+  compress  用gzip压缩文件并删除原文件
+"""
+
+import os
+import gzip
+import shutil
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+# 计算校验和、压缩时每次读取的字节数
+CHUNK_SIZE = 1024 * 1024
+
+
+def checksum_stage(job, options):
+    """计算SHA-256并写入旁路文件（sha256sum格式）"""
+    digest = hashlib.sha256()
+    with open(job["path"], "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    job["sha256"] = digest.hexdigest()
+    sidecar = job["path"] + ".sha256"
+    with open(sidecar, "w", encoding="utf-8") as f:
+        f.write(f"{job['sha256']}  {os.path.basename(job['path'])}\n")
+    job["sidecars"].append(sidecar)
+    return job
+
+
+def shard_stage(job, options):
+    """把文件（及其旁路文件）移动到按哈希前缀分片的目录中
+
+    已经计算过SHA-256时按文件内容分片，否则按文件名分片。
+    """
+    key = job.get("sha256") or hashlib.sha256(os.path.basename(job["path"]).encode("utf-8")).hexdigest()
+    depth = options.get("shard_depth", 2)
+    target_dir = os.path.join(job["root"], options.get("shard_dir", ""),
+                              *[key[i * 2:i * 2 + 2] for i in range(depth)])
+    os.makedirs(target_dir, exist_ok=True)
+    target = os.path.join(target_dir, os.path.basename(job["path"]))
+    os.replace(job["path"], target)
+    sidecars = []
+    for sidecar in job["sidecars"]:
+        moved = os.path.join(target_dir, os.path.basename(sidecar))
+        os.replace(sidecar, moved)
+        sidecars.append(moved)
+    job["path"] = target
+    job["sidecars"] = sidecars
+    return job
+
+
+def compress_stage(job, options):
+    """用gzip压缩文件，压缩成功后删除原文件"""
+    source = job["path"]
+    target = source + ".gz"
+    with open(source, "rb") as src, gzip.open(target, "wb",
+                                                compresslevel=options.get("compress_level", 6)) as dst:
+        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+    os.remove(source)
+    job["path"] = target
+    return job
+
+
+STAGES = {
+    "checksum": checksum_stage,
+    "shard": shard_stage,
+    "compress": compress_stage,
+}
+
+
+def run_stages(job, stages, options):
+    """在池中依次执行各个阶段，返回处理后的任务信息
+
+    必须是模块级函数，进程池才能把它发送到工作进程。
+    """
+    for name in stages:
+        job = STAGES[name](job, options)
+    return job
+
+
+class UploadPipeline:
+    """把上传完成的文件交给有界的线程池或进程池处理
+
+    参数:
+        stages: 阶段名称列表，见 STAGES
+        executor: "thread" 或 "process"
+        workers: 池中的工作线程/进程数
+        max_pending: 排队和处理中的文件数达到这个值时 saturated 为True
+        options: 传给各阶段的参数（shard_dir、shard_depth、compress_level）
+    """
+
+    def __init__(self, stages, executor="thread", workers=2, max_pending=64, options=None):
+        unknown = [name for name in stages if name not in STAGES]
+        if unknown:
+            raise ValueError(f"未知的上传处理阶段: {', '.join(unknown)}")
+        self.stages = list(stages)
+        self.executor = executor
+        self.workers = workers
+        self.max_pending = max_pending
+        self.options = dict(options or {})
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+        self.logger = logging.getLogger("FTPServer.Ingest")
+
+    @property
+    def saturated(self):
+        """待处理的文件是否已经达到上限（由IO循环调用，只读一个整数）"""
+        return self.pending >= self.max_pending
+
+    def submit(self, path, username, root):
+        """提交一个上传完成的文件，立即返回
+
+        管线已经饱和时也会接受（文件已经在磁盘上），由 saturated 阻止新的上传。
+        """
+        job = {"path": path, "user": username, "root": root, "sidecars": []}
+        with self._lock:
+            self.pending += 1
+        try:
+            future = self._get_pool().submit(run_stages, job, self.stages, self.options)
+        except Exception as e:
+            self._finished(False)
+            self.logger.error(f"提交上传处理任务失败 {path}: {str(e)}")
+            return
+        future.add_done_callback(lambda f: self._on_done(job, f))
+
+    def stats(self):
+        """返回管线的统计信息"""
+        with self._lock:
+            return {"pending": self.pending, "completed": self.completed, "failed": self.failed,
+                    "max_pending": self.max_pending}
+
+    def close(self, wait=True):
+        """关闭池，wait为True时等待已提交的文件处理完"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None and self._pool_pid == os.getpid():
+            pool.shutdown(wait=wait)
+
+    def _get_pool(self):
+        # 多进程引擎的子进程不能使用父进程创建的池，在每个进程中按需创建
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                if self.executor == "process":
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                else:
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers,
+                                                    thread_name_prefix="ingest")
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _on_done(self, job, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            self._finished(False)
+            self.logger.error(f"处理上传文件失败 {job['path']} (用户: {job['user']}): {str(e)}")
+            return
+        self._finished(True)
+        checksum = f"，SHA-256: {result['sha256']}" if result.get("sha256") else ""
+        self.logger.info(f"上传文件处理完成: {result['path']} (用户: {job['user']}){checksum}")
+
+    def _finished(self, success):
+        with self._lock:
+            self.pending -= 1
+            if success:
+                self.completed += 1
+            else:
+                self.failed += 1
@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+监听套接字
+创建控制连接的监听套接字，支持多个绑定地址、IPv4/IPv6双栈和 SO_REUSEPORT:
+
+- 地址 "::" 在没有同时监听 "0.0.0.0" 时以双栈方式监听（关闭IPV6_V6ONLY），IPv4客户端
+  以 ::ffff:a.b.c.d 的形式接入，pyftpdlib会按IPv4处理PASV
+- reuse_port 为True时设置 SO_REUSEPORT，多个工作进程可以各自绑定同一个地址和端口，
+  由内核把新连接分配给其中一个进程
+- ListenerGroup 在同一个IO循环上运行多个 pyftpdlib FTPServer，对外提供与单个
+  FTPServer 相同的接口（handler、max_cons、close_all() 等）；其他线程通过 call_soon()
+  把操作交给IO循环线程执行，并通过一对本地套接字唤醒阻塞在poll()中的IO循环
+"""
+
+import os
+import socket
+import logging
+import threading
+from collections import deque
+
+from pyftpdlib.ioloop import AsyncChat
+from pyftpdlib.servers import FTPServer
+
+# 监听队列长度
+DEFAULT_BACKLOG = 128
+
+
+def has_reuse_port():
+    """当前平台是否支持 SO_REUSEPORT"""
+    return hasattr(socket, "SO_REUSEPORT")
+
+
+def is_ipv6(host):
+    return ":" in host
+
+
+def bind_addresses(address, extra=()):
+    """返回去重后的监听地址列表: 主地址 address 加上 extra 中的其他地址"""
+    hosts = []
+    for host in [address] + list(extra or ()):
+        host = host.strip().strip("[]")
+        if host and host not in hosts:
+            hosts.append(host)
+    return hosts
+
+
+def create_listener(host, port, reuse_port=False, dual_stack=True, backlog=DEFAULT_BACKLOG):
+    """创建并返回一个处于监听状态的非阻塞TCP套接字
+
+    参数:
+        host: IPv4或IPv6地址，"::" 表示所有IPv6接口
+        reuse_port: 设置 SO_REUSEPORT（平台不支持时抛出ValueError）
+        dual_stack: host为 "::" 时是否同时接受IPv4连接
+    """
+    family = socket.AF_INET6 if is_ipv6(host) else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        if os.name == "posix":
+            # Windows上的SO_REUSEADDR允许抢占正在使用的端口，只在POSIX上设置
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            if not has_reuse_port():
+                raise ValueError("当前平台不支持 SO_REUSEPORT")
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        if family == socket.AF_INET6 and hasattr(socket, "IPV6_V6ONLY"):
+            v6only = 0 if dual_stack and host == "::" else 1
+            sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, v6only)
+        sock.bind((host, port))
+        sock.listen(backlog)
+        sock.setblocking(False)
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+
+def open_listeners(hosts, port, reuse_port=False, backlog=DEFAULT_BACKLOG):
+    """为每个地址创建监听套接字，任何一个失败时关闭已经创建的套接字并抛出异常"""
+    # 同时监听 0.0.0.0 时 "::" 只接受IPv6，否则两者会争用IPv4的端口
+    dual_stack = "0.0.0.0" not in hosts
+    sockets = []
+    try:
+        for host in hosts:
+            sockets.append(create_listener(host, port, reuse_port, dual_stack, backlog))
+    except BaseException:
+        for sock in sockets:
+            sock.close()
+        raise
+    return sockets
+
+
+def split_port_range(ports, count):
+    """把被动端口范围平均分成 count 个互不重叠的连续区间
+
+    ports 为None（未配置被动端口范围）时每个区间都是None；端口数少于 count 时抛出ValueError。
+    """
+    if ports is None:
+        return [None] * count
+    if len(ports) < count:
+        raise ValueError(f"被动端口范围只有 {len(ports)} 个端口，不够分给 {count} 个工作进程")
+    size, extra = divmod(len(ports), count)
+    slices = []
+    start = ports.start
+    for i in range(count):
+        length = size + (1 if i < extra else 0)
+        slices.append(range(start, start + length))
+        start += length
+    return slices
+
+
+class _IOLoopWaker(AsyncChat):
+    """注册在IO循环中的本地套接字，其他线程写入一个字节即可唤醒IO循环执行回调
+
+    pyftpdlib的IO循环在还没有定时任务到期时会无限期地阻塞在poll()中（例如启动后还没有
+    任何连接），其他线程用 call_later() 安排的调用要等到下一个网络事件才会执行。
+    """
+
+    def __init__(self, ioloop):
+        reader, self._writer = socket.socketpair()
+        reader.setblocking(False)
+        self._writer.setblocking(False)
+        self._callbacks = deque()
+        super().__init__(reader, ioloop=ioloop)
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return False
+
+    def call_soon(self, target, *args):
+        """在IO循环线程中调用 target(*args)，可以在任意线程中调用"""
+        self._callbacks.append((target, args))
+        try:
+            self._writer.send(b"\0")
+        except OSError:
+            pass  # 缓冲区已满时IO循环已经会被唤醒
+
+    def handle_read(self):
+        try:
+            self.socket.recv(4096)
+        except OSError:
+            pass
+        while self._callbacks:
+            target, args = self._callbacks.popleft()
+            try:
+                target(*args)
+            except Exception:
+                logging.getLogger("FTPServer").exception(f"IO循环中的回调 {target} 失败")
+
+    def close(self):
+        super().close()
+        self._writer.close()
+
+
+class ListenerGroup:
+    """在同一个IO循环上监听多个套接字的FTP服务器，接口与 FTPServer 相同"""
+
+    def __init__(self, sockets, handler, ioloop=None, backlog=DEFAULT_BACKLOG):
+        if not sockets:
+            raise ValueError("至少需要一个监听套接字")
+        self.servers = []
+        for sock in sockets:
+            server = FTPServer(sock, handler, ioloop=ioloop, backlog=backlog)
+            ioloop = server.ioloop
+            self.servers.append(server)
+        self.ioloop = ioloop
+        self._waker = _IOLoopWaker(ioloop)
+        self._thread = None
+
+    @property
+    def handler(self):
+        return self.servers[0].handler
+
+    @property
+    def address(self):
+        """第一个监听地址 (ip, port)"""
+        return self.servers[0].address
+
+    @property
+    def addresses(self):
+        return [server.address for server in self.servers]
+
+    @property
+    def max_cons(self):
+        return self.servers[0].max_cons
+
+    @max_cons.setter
+    def max_cons(self, value):
+        for server in self.servers:
+            server.max_cons = value
+
+    @property
+    def max_cons_per_ip(self):
+        return self.servers[0].max_cons_per_ip
+
+    @max_cons_per_ip.setter
+    def max_cons_per_ip(self, value):
+        for server in self.servers:
+            server.max_cons_per_ip = value
+
+    def serve_forever(self, timeout=None, blocking=True, handle_exit=True):
+        """运行共享的IO循环，所有监听套接字上的连接都在其中处理"""
+        self._thread = threading.current_thread()
+        return self.servers[0].serve_forever(timeout=timeout, blocking=blocking,
+                                             handle_exit=handle_exit)
+
+    def _in_other_thread(self):
+        thread = self._thread
+        return thread is not None and thread.is_alive() and thread is not threading.current_thread()
+
+    def call_soon(self, target, *args):
+        """在IO循环线程中尽快调用 target(*args)，可以在任意线程中调用"""
+        self._waker.call_soon(target, *args)
+
+    def close(self):
+        """关闭所有监听套接字，已建立的连接不受影响"""
+        if self._in_other_thread():
+            self.call_soon(self.close)
+            return
+        for server in self.servers:
+            server.close()
+
+    def close_all(self, timeout=5):
+        """关闭IO循环中的所有连接和监听套接字
+
+        IO循环正在其他线程中运行时交给它自己关闭，最多等待 timeout 秒让它退出。
+        """
+        if self._in_other_thread():
+            self.call_soon(self.ioloop.close)
+            self._thread.join(timeout)
+            if not self._thread.is_alive():
+                return
+        return self.ioloop.close()
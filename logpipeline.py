@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+非阻塞日志管线
+IO循环线程只把日志记录放进有界队列，格式化和磁盘写入在后台线程中批量完成。
+
+fork()出的子进程（multiprocess引擎每个连接一个子进程）不会继承后台线程，
+子进程中的日志记录改为通过进程间队列发给父进程，由父进程的日志管线统一写入。
+"""
+
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, RotatingFileHandler
+
+LOG_FILE = "logs/ftp_server.log"
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# 日志管线的默认值，对应 settings.json 中的同名配置项
+DEFAULT_LOG_CONFIG = {
+    "log_level": "INFO",
+    "log_max_bytes": 10 * 1024 * 1024,   # 单个日志文件的最大字节数，0表示不按大小轮转
+    "log_backup_count": 5,               # 保留的历史日志文件数量
+    "log_rotate_interval": 86400,        # 按时间轮转的间隔（秒），0表示不按时间轮转
+    "log_queue_size": 10000              # 日志队列容量，队列满时丢弃新记录
+}
+
+
+class DroppingQueueHandler(QueueHandler):
+    """写入有界队列的日志处理器，队列满时丢弃记录并计数，从不阻塞调用线程"""
+
+    def __init__(self, log_queue):
+        QueueHandler.__init__(self, log_queue)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+
+class BatchFlushMixin:
+    """批量刷新: 处理一批日志期间跳过每条记录后的flush()，批次结束后统一刷新"""
+
+    defer_flush = False
+
+    def flush(self):
+        if not self.defer_flush:
+            super().flush()
+
+
+class BatchedStreamHandler(BatchFlushMixin, logging.StreamHandler):
+    """支持批量刷新的控制台日志处理器"""
+
+
+class RotatingLogFileHandler(BatchFlushMixin, RotatingFileHandler):
+    """同时按大小和时间轮转的日志文件处理器"""
+
+    def __init__(self, filename, max_bytes=0, backup_count=0, rotate_interval=0,
+                 encoding="utf-8"):
+        RotatingFileHandler.__init__(self, filename, maxBytes=max_bytes,
+                                     backupCount=backup_count, encoding=encoding)
+        self.rotate_interval = rotate_interval
+        self.rollover_at = self._next_rollover()
+
+    def _next_rollover(self):
+        if not self.rotate_interval:
+            return None
+        return time.time() + self.rotate_interval
+
+    def shouldRollover(self, record):
+        if self.rollover_at is not None and time.time() >= self.rollover_at:
+            return True
+        return RotatingFileHandler.shouldRollover(self, record)
+
+    def doRollover(self):
+        RotatingFileHandler.doRollover(self)
+        self.rollover_at = self._next_rollover()
+
+
+class BatchingQueueListener:
+    """后台日志线程: 从队列中批量取出记录，交给各处理器写入后统一刷新一次"""
+
+    _sentinel = None
+
+    def __init__(self, log_queue, handlers, drop_source=None, batch_size=256,
+                 flush_interval=0.5):
+        self.queue = log_queue
+        self.handlers = list(handlers)
+        self.drop_source = drop_source
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._reported_drops = 0
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="log-writer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """写完队列中剩余的日志后停止后台线程"""
+        if self._thread is None:
+            return
+        self.queue.put(self._sentinel)
+        self._thread.join(timeout=5)
+        self._thread = None
+
+    def _run(self):
+        while True:
+            try:
+                record = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._report_drops()
+                continue
+            batch = [record]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = self._sentinel in batch
+            self._write([r for r in batch if r is not self._sentinel])
+            self._report_drops()
+            if stopping:
+                return
+
+    def _write(self, records):
+        if not records:
+            return
+        for handler in self.handlers:
+            handler.defer_flush = True
+        try:
+            for record in records:
+                for handler in self.handlers:
+                    if record.levelno >= handler.level:
+                        handler.handle(record)
+        finally:
+            for handler in self.handlers:
+                handler.defer_flush = False
+                handler.flush()
+
+    def _report_drops(self):
+        """队列溢出后在日志中记录一条丢弃统计"""
+        if self.drop_source is None:
+            return
+        dropped = self.drop_source.dropped
+        if dropped > self._reported_drops:
+            record = logging.LogRecord("FTPServer.Log", logging.WARNING, __file__, 0,
+                                       f"日志队列已满，丢弃了 {dropped - self._reported_drops} 条日志"
+                                       f"（累计 {dropped} 条）", None, None)
+            self._reported_drops = dropped
+            self._write([record])
+
+
+class LogPipeline:
+    """已安装的日志管线，提供队列状态查询"""
+
+    def __init__(self, queue_handler, listener):
+        self.queue_handler = queue_handler
+        self.listener = listener
+        self.pid = os.getpid()
+        # 第一次fork()时创建: 子进程发送日志记录的进程间队列和父进程中的转发线程
+        self._fork_queue = None
+        self._forwarder = None
+
+    def before_fork(self):
+        """在父进程fork()之前调用，创建进程间队列并启动转发线程（只创建一次）"""
+        if os.getpid() != self.pid or self._fork_queue is not None:
+            return
+        import multiprocessing
+        self._fork_queue = multiprocessing.Queue()
+        self._forwarder = threading.Thread(target=self._forward, name="log-forwarder")
+        self._forwarder.daemon = True
+        self._forwarder.start()
+
+    def after_fork_in_child(self):
+        """在fork()出的子进程中调用: 日志记录改为发送给父进程"""
+        if self._fork_queue is None:
+            return
+        root = logging.getLogger()
+        if self.queue_handler in root.handlers:
+            root.removeHandler(self.queue_handler)
+            root.addHandler(QueueHandler(self._fork_queue))
+
+    def _forward(self):
+        """父进程中的转发线程: 把子进程的日志记录放进本进程的日志队列"""
+        while True:
+            try:
+                record = self._fork_queue.get()
+            except (EOFError, OSError, ValueError):
+                return
+            if record is None:
+                return
+            self.queue_handler.enqueue(record)
+
+    @property
+    def dropped(self):
+        """因队列已满而丢弃的日志条数"""
+        return self.queue_handler.dropped
+
+    @property
+    def pending(self):
+        """队列中尚未写入的日志条数"""
+        return self.queue_handler.queue.qsize()
+
+    def stop(self):
+        if os.getpid() != self.pid:
+            return  # 后台线程属于父进程
+        if self._forwarder is not None:
+            # 先转发完子进程已经发出的日志
+            self._fork_queue.put(None)
+            self._forwarder.join(timeout=5)
+            self._forwarder = None
+        self.listener.stop()
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_pipeline():
+    """返回当前进程已安装的日志管线，未安装时返回None"""
+    return _pipeline
+
+
+def _before_fork():
+    if _pipeline is not None:
+        _pipeline.before_fork()
+
+
+def _after_fork_in_child():
+    if _pipeline is not None:
+        _pipeline.after_fork_in_child()
+
+
+if hasattr(os, "register_at_fork"):  # Windows不支持fork()
+    os.register_at_fork(before=_before_fork, after_in_child=_after_fork_in_child)
+
+
+def install(config=None, log_file=LOG_FILE):
+    """在根日志记录器上安装非阻塞日志管线
+
+    与logging.basicConfig一样，根日志记录器已有处理器时不做任何修改
+    （例如被测试框架接管时）。同一进程内只会安装一次。
+    """
+    global _pipeline
+    settings = dict(DEFAULT_LOG_CONFIG)
+    settings.update({k: v for k, v in (config or {}).items() if k in DEFAULT_LOG_CONFIG})
+
+    with _pipeline_lock:
+        root = logging.getLogger()
+        if _pipeline is not None or root.handlers:
+            return _pipeline
+
+        log_dir = os.path.dirname(log_file)
+        if log_dir and not os.path.exists(log_dir):
+            os.makedirs(log_dir)
+
+        formatter = logging.Formatter(LOG_FORMAT)
+        file_handler = RotatingLogFileHandler(log_file,
+                                              max_bytes=settings["log_max_bytes"],
+                                              backup_count=settings["log_backup_count"],
+                                              rotate_interval=settings["log_rotate_interval"])
+        stream_handler = BatchedStreamHandler()
+        for handler in (file_handler, stream_handler):
+            handler.setFormatter(formatter)
+
+        log_queue = queue.Queue(maxsize=settings["log_queue_size"])
+        queue_handler = DroppingQueueHandler(log_queue)
+        listener = BatchingQueueListener(log_queue, [file_handler, stream_handler],
+                                         drop_source=queue_handler)
+        listener.start()
+
+        root.addHandler(queue_handler)
+        root.setLevel(getattr(logging, str(settings["log_level"]).upper(), logging.INFO))
+
+        _pipeline = LogPipeline(queue_handler, listener)
+        atexit.register(_pipeline.stop)
+        return _pipeline
@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+日志搜索索引
+对 LogTailer 解析出的日志建立增量的倒排索引（词 -> 日志编号数组），按级别、时间范围和
+关键字搜索时只检查候选日志，不需要把每条日志转换成小写再逐条比较。
+
+- 日志按到达顺序编号，编号只增不减；超出容量时丢弃最旧的日志，倒排表分批裁剪
+- 英文、数字按连续的字母数字切分成词，中文按单个字切分
+- 查询中被空白或符号完整隔开的词直接查倒排表；位于查询两端的词可能只是日志中某个词的
+  一部分，在拼接成一个字符串的词表中查找包含它的词；选出候选最少的一个词（或级别）
+  遍历候选，最后用子串比较确认整个查询确实出现在日志中
+- 结果从新到旧分页，用上一页最旧的编号继续向前翻页，不受显示条数限制
+"""
+
+import re
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import chain
+
+LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+_LEVEL_CODES = {name: code for code, name in enumerate(LEVELS, 1)}
+
+# 中文（CJK统一汉字）按字切分，其他字母数字按连续的串切分
+_CJK = "㐀-䶿一-鿿"
+TOKEN_PATTERN = re.compile(rf"[{_CJK}]|[^\W{_CJK}]+")
+_CJK_CHAR = re.compile(rf"[{_CJK}]")
+# 查询两端的不完整词少于这么多个字符、或者词表中包含它的词超过这么多个时，
+# 不用于缩小候选范围（直接从新到旧逐条确认，常见的片段很快就能填满一页）
+MIN_PARTIAL_TOKEN = 2
+MAX_PARTIAL_WORDS = 5000
+
+# 时间条件的格式（日志时间戳为 "2024-01-01 12:00:00,123"）
+_TIME_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d", "%H:%M:%S", "%H:%M")
+
+
+def tokenize(text):
+    """把小写化的文本切分成词"""
+    return TOKEN_PATTERN.findall(text)
+
+
+def time_key(timestamp):
+    """把日志时间戳转换成可比较的整数，例如 20240101120000123"""
+    digits = timestamp[0:4] + timestamp[5:7] + timestamp[8:10] + timestamp[11:13] \
+        + timestamp[14:16] + timestamp[17:19] + timestamp[20:23]
+    return int(digits) if digits.isdigit() else 0
+
+
+def parse_time_bound(text, end=False, today=None):
+    """解析界面上输入的时间条件，返回与 time_key 可比较的整数，空字符串返回None
+
+    只输入时间（HH:MM[:SS]）时使用今天的日期；end为True时精度以下的部分取最大值，
+    例如结束时间 "12:30" 包含 12:30:59.999。格式无效时抛出ValueError。
+    """
+    text = text.strip()
+    if not text:
+        return None
+    for fmt in _TIME_FORMATS:
+        try:
+            parsed = time.strptime(text, fmt)
+        except ValueError:
+            continue
+        if not fmt.startswith("%Y"):
+            today = today or time.localtime()
+            date = (today.tm_year, today.tm_mon, today.tm_mday)
+        else:
+            date = parsed[:3]
+        fields = list(date) + [parsed.tm_hour, parsed.tm_min, parsed.tm_sec]
+        key = int("%04d%02d%02d%02d%02d%02d" % tuple(fields)) * 1000
+        if end:
+            # 补齐未输入的部分: 日期 -> 整天，分钟 -> 整分钟，秒 -> 整秒
+            if "%H" not in fmt:
+                key += 235959 * 1000
+            elif "%S" not in fmt:
+                key += 59 * 1000
+            key += 999
+        return key
+    raise ValueError(f"无效的时间: {text}（格式: YYYY-MM-DD HH:MM:SS 或 HH:MM）")
+
+
+def highlight_segments(text, query):
+    """把文本按查询的匹配位置切分成 [(片段, 是否匹配)]，不区分大小写"""
+    if not query:
+        return [(text, False)]
+    segments = []
+    position = 0
+    for match in re.finditer(re.escape(query), text, re.IGNORECASE):
+        if match.start() > position:
+            segments.append((text[position:match.start()], False))
+        segments.append((match.group(), True))
+        position = match.end()
+    if position < len(text):
+        segments.append((text[position:], False))
+    return segments
+
+
+class SearchPage:
+    """一页搜索结果
+
+    entries 按时间从旧到新排列，元素为 (编号, 级别, 文本)；
+    older 是继续向前翻页时传给 search(before=...) 的编号，没有更早的结果时为None。
+    """
+
+    def __init__(self, entries, older):
+        self.entries = entries
+        self.older = older
+
+    @property
+    def has_more(self):
+        return self.older is not None
+
+
+class LogIndex:
+    """日志的内存倒排索引（只在界面线程中使用，不加锁）"""
+
+    def __init__(self, max_entries=1000000):
+        self.max_entries = max_entries
+        self._base = 0          # _texts[0] 的编号
+        self._texts = []
+        self._levels = array("B")
+        self._times = array("q")
+        self._postings = {}     # 词 -> 按编号升序的 array("I")
+        self._level_postings = {code: array("I") for code in _LEVEL_CODES.values()}
+        # 用换行符拼接的词表及每个词的起始位置，搜索时追加新词，有词被删除时重建
+        self._vocab_words = []
+        self._vocab_text = ""
+        self._vocab_starts = array("q")
+        self._vocab_new = []
+        self._vocab_stale = False
+        # 最后一条日志可能还会追加续行（异常堆栈），记住它以便更新
+        self._last_entry = None
+        self._last_length = 0
+
+    def __len__(self):
+        return len(self._texts)
+
+    @property
+    def next_id(self):
+        """下一条日志的编号"""
+        return self._base + len(self._texts)
+
+    def add(self, entries):
+        """添加 LogTailer 新解析出的日志，返回第一条新日志的编号"""
+        last = self._last_entry
+        if last is not None and len(last["text"]) != self._last_length:
+            # 上一批的最后一条日志追加了续行
+            entry_id = self.next_id - 1
+            if entry_id >= self._base:
+                self._texts[entry_id - self._base] = last["text"]
+                self._index_tokens(last["text"][self._last_length:], entry_id)
+            self._last_length = len(last["text"])
+        first_id = self.next_id
+        for entry in entries:
+            entry_id = self.next_id
+            text = entry["text"]
+            code = _LEVEL_CODES.get(entry["level"], 0)
+            self._texts.append(text)
+            self._levels.append(code)
+            self._times.append(time_key(entry["timestamp"]))
+            if code:
+                self._level_postings[code].append(entry_id)
+            self._index_tokens(text, entry_id)
+        if entries:
+            self._last_entry = entries[-1]
+            self._last_length = len(entries[-1]["text"])
+        if len(self._texts) > self.max_entries + self.max_entries // 4:
+            self._evict(len(self._texts) - self.max_entries)
+        return first_id
+
+    def clear(self):
+        """清空索引，编号继续递增"""
+        self._base = self.next_id
+        self._texts = []
+        self._levels = array("B")
+        self._times = array("q")
+        self._postings = {}
+        self._level_postings = {code: array("I") for code in _LEVEL_CODES.values()}
+        self._vocab_new = []
+        self._vocab_stale = True
+        self._last_entry = None
+
+    def _index_tokens(self, text, entry_id):
+        postings = self._postings
+        for token in set(tokenize(text.casefold())):
+            ids = postings.get(token)
+            if ids is None:
+                postings[token] = array("I", (entry_id,))
+                self._vocab_new.append(token)
+            elif ids[-1] != entry_id:
+                ids.append(entry_id)
+
+    def _evict(self, count):
+        """丢弃最旧的 count 条日志，并从倒排表中裁剪掉它们"""
+        del self._texts[:count]
+        del self._levels[:count]
+        del self._times[:count]
+        self._base += count
+        base = self._base
+        for token in list(self._postings):
+            ids = self._postings[token]
+            cut = bisect_left(ids, base)
+            if cut == len(ids):
+                del self._postings[token]
+                self._vocab_stale = True
+            elif cut:
+                del ids[:cut]
+        for ids in self._level_postings.values():
+            del ids[:bisect_left(ids, base)]
+
+    def search(self, query="", level="ALL", since=None, until=None, before=None, after=None,
+               limit=500):
+        """搜索日志，返回编号小于 before（且大于 after）的最新的最多 limit 条匹配
+
+        参数:
+            query: 不区分大小写的子串
+            level: "ALL" 或日志级别
+            since, until: time_key 格式的时间范围（包含两端），None表示不限
+        """
+        needle = query.casefold()
+        code = None if level == "ALL" else _LEVEL_CODES.get(level, -1)
+        if code == -1:
+            return SearchPage([], None)
+        lo = self._base if after is None else max(self._base, after + 1)
+        hi = self.next_id if before is None else min(self.next_id, before)
+        if since is not None:
+            lo = max(lo, self._base + bisect_left(self._times, since))
+        if until is not None:
+            hi = min(hi, self._base + bisect_left(self._times, until + 1))
+
+        candidates = self._candidates(needle, code, hi - lo)
+        if candidates is None:
+            candidates = range(lo, hi)
+            end = len(candidates)
+        else:
+            end = bisect_left(candidates, hi)
+
+        matches = []
+        older = None
+        texts, levels, times, base = self._texts, self._levels, self._times, self._base
+        for i in range(end - 1, -1, -1):
+            entry_id = candidates[i]
+            if entry_id < lo:
+                break
+            position = entry_id - base
+            if code is not None and levels[position] != code:
+                continue
+            if since is not None and times[position] < since:
+                continue
+            if until is not None and times[position] > until:
+                continue
+            text = texts[position]
+            if needle and needle not in text.casefold():
+                continue
+            if len(matches) == limit:
+                older = matches[-1][0]
+                break
+            matches.append((entry_id, LEVELS[levels[position] - 1] if levels[position] else "", text))
+        matches.reverse()
+        return SearchPage(matches, older)
+
+    def _candidates(self, needle, code, span):
+        """返回候选日志编号的升序序列，无法缩小范围时返回None
+
+        span 是编号范围内的日志条数，候选由多个词合并而成且超过其 1/20 时不再合并，
+        匹配足够密集，从新到旧逐条确认更快。
+        """
+        options = []
+        if code is not None:
+            options.append([self._level_postings[code]])
+        for token, complete in self._query_tokens(needle):
+            if complete:
+                ids = self._postings.get(token)
+                options.append([ids] if ids is not None else [])
+            elif len(token) >= MIN_PARTIAL_TOKEN:
+                words = self._words_containing(token)
+                if words is not None:
+                    options.append([self._postings[word] for word in words])
+        if not options:
+            return None
+        sizes = [sum(len(ids) for ids in lists) for lists in options]
+        best = options[sizes.index(min(sizes))]
+        if len(best) == 1:
+            return best[0]
+        if min(sizes) * 20 > span:
+            return None
+        return sorted(set(chain.from_iterable(best)))
+
+    def _words_containing(self, token):
+        """返回词表中包含 token 的词，超过 MAX_PARTIAL_WORDS 个时返回None"""
+        self._update_vocab()
+        words = []
+        last = -1
+        for match in re.finditer(re.escape(token), self._vocab_text):
+            i = bisect_right(self._vocab_starts, match.start()) - 1
+            if i != last:
+                if len(words) == MAX_PARTIAL_WORDS:
+                    return None
+                words.append(self._vocab_words[i])
+                last = i
+        return words
+
+    def _update_vocab(self):
+        if self._vocab_stale:
+            self._vocab_words = []
+            self._vocab_text = ""
+            self._vocab_starts = array("q")
+            new = list(self._postings)
+        else:
+            new = self._vocab_new
+        self._vocab_new = []
+        self._vocab_stale = False
+        if not new:
+            return
+        position = len(self._vocab_text) + 1 if self._vocab_words else 0
+        for word in new:
+            self._vocab_starts.append(position)
+            position += len(word) + 1
+        self._vocab_text = "\n".join(chain([self._vocab_text] if self._vocab_words else [], new))
+        self._vocab_words.extend(new)
+
+    @staticmethod
+    def _query_tokens(needle):
+        """切分查询，返回 [(词, 是否完整)]
+
+        两侧都是查询中的非词字符（或是单个汉字）的词是完整的词，日志中一定有同样的词；
+        位于查询开头或结尾的词可能只是日志中某个词的一部分。
+        """
+        tokens = []
+        for match in TOKEN_PATTERN.finditer(needle):
+            token = match.group()
+            complete = bool(_CJK_CHAR.fullmatch(token)) or (match.start() > 0 and match.end() < len(needle))
+            tokens.append((token, complete))
+        return tokens
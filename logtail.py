@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+增量日志读取
+记住已读取的字节偏移和文件inode，每次只解析新追加的行，并能识别日志轮转和截断。
+"""
+
+import os
+import re
+from collections import deque
+
+# 日志行格式: "时间 - 记录器名称 - 级别 - 消息"，不匹配的行视为上一条日志的续行（如异常堆栈）
+LOG_LINE_PATTERN = re.compile(
+    r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}) - (\S+) - ([A-Z]+) - (.*)$')
+
+
+def make_entry(timestamp, logger, level, message):
+    """构造一条解析后的日志记录"""
+    return {
+        "timestamp": timestamp,
+        "logger": logger,
+        "level": level,
+        "message": message,
+        "text": f"{timestamp} - {logger} - {level} - {message}\n"
+    }
+
+
+class LogTailer:
+    """增量日志读取器
+
+    解析后的日志保存在有界环形缓冲区 entries 中，超出容量时丢弃最旧的记录。
+    """
+
+    def __init__(self, path, max_entries=10000, initial_bytes=4 * 1024 * 1024,
+                 read_chunk=4 * 1024 * 1024):
+        """初始化读取器
+
+        参数:
+            path: 日志文件路径
+            max_entries: 环形缓冲区容量
+            initial_bytes: 首次打开时只读取文件末尾的这么多字节，避免加载数GB的历史日志
+            read_chunk: 每次poll()最多读取的字节数
+        """
+        self.path = path
+        self.entries = deque(maxlen=max_entries)
+        self.initial_bytes = initial_bytes
+        self.read_chunk = read_chunk
+        self._inode = None
+        self._offset = 0
+        self._partial = b""
+        self._skip_first_line = False
+
+    def poll(self):
+        """读取自上次调用以来新追加的日志
+
+        返回:
+            tuple: (新增日志记录列表, 是否发生了重置)
+                   发生轮转或截断时重置为True，调用方应基于entries重新显示全部内容
+        """
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return [], False
+
+        reset = False
+        new_entries = []
+        if self._inode is None:
+            # 首次打开: 从文件末尾附近开始读取
+            self._inode = st.st_ino
+            self._offset = max(0, st.st_size - self.initial_bytes)
+            self._skip_first_line = self._offset > 0
+        elif st.st_ino != self._inode or st.st_size < self._offset:
+            # 文件被轮转（inode变化）或截断: 先读完旧文件剩余的内容，再从新文件开头读取
+            if st.st_ino != self._inode:
+                new_entries.extend(self._read_rotated_remainder())
+            self._inode = st.st_ino
+            self._offset = 0
+            self._partial = b""
+            self._skip_first_line = False
+            reset = True
+
+        new_entries.extend(self._read_from(self.path))
+        return new_entries, reset
+
+    def _read_rotated_remainder(self):
+        """日志按数字后缀轮转时，旧文件会被重命名为 "<path>.1"，读完其中尚未读取的部分"""
+        rotated = self.path + ".1"
+        try:
+            if os.stat(rotated).st_ino != self._inode:
+                return []
+        except OSError:
+            return []
+        return self._read_from(rotated)
+
+    def _read_from(self, path):
+        try:
+            with open(path, "rb") as f:
+                f.seek(self._offset)
+                data = f.read(self.read_chunk)
+        except OSError:
+            return []
+        if not data:
+            return []
+        self._offset += len(data)
+
+        data = self._partial + data
+        lines = data.split(b"\n")
+        # 最后一段没有换行符，说明这一行还没写完，留到下次再解析
+        self._partial = lines.pop()
+        if self._skip_first_line and lines:
+            lines.pop(0)
+            self._skip_first_line = False
+        return self._parse(lines)
+
+    def _parse(self, lines):
+        new_entries = []
+        for raw in lines:
+            line = raw.decode("utf-8", errors="replace").rstrip("\r")
+            match = LOG_LINE_PATTERN.match(line)
+            if match:
+                entry = make_entry(*match.groups())
+                new_entries.append(entry)
+                self.entries.append(entry)
+            elif self.entries and line:
+                # 续行: 追加到上一条日志
+                last = self.entries[-1]
+                last["message"] += "\n" + line
+                last["text"] += line + "\n"
+        return new_entries
@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+服务器指标
+计数器和直方图在IO循环中只做一次加锁的字典累加；活动会话数、被动端口使用量等
+瞬时值在导出时才从连接快照中计算，不在IO循环中额外维护。
+
+指标可以通过 Metrics.collect() 以Python字典的形式读取，也可以通过
+MetricsHTTPServer 以Prometheus文本格式从本地HTTP端点 /metrics 读取。
+
+multiprocess引擎的会话在fork()出的子进程中运行，子进程中的计数器增量通过
+进程间队列定期发回主进程（forward_to() / collect_from()），由主进程累加。
+"""
+
+import time
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 传输耗时直方图的桶上限（秒）
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 由连接快照计算的瞬时指标及其说明
+GAUGE_HELP = {
+    "ftp_active_sessions": "Connected control sessions.",
+    "ftp_passive_ports_in_use": "Passive data ports currently held by sessions.",
+    "ftp_passive_ports_peak": "Highest number of passive ports held at once since the server started.",
+    "ftp_passive_ports_total": "Size of the configured passive port range (0 if unset).",
+    "ftp_ingest_pending": "Uploaded files queued or being processed by the ingest pipeline.",
+}
+
+
+class Histogram:
+    """固定桶的直方图，只记录每个桶的计数、总和与样本数"""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个桶为 +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def merge(self, other):
+        """累加另一个相同分桶的直方图"""
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.total += other.total
+        self.count += other.count
+
+    def copy(self):
+        other = Histogram(self.buckets)
+        other.counts = list(self.counts)
+        other.total = self.total
+        other.count = self.count
+        return other
+
+
+class Metrics:
+    """FTP服务器指标
+
+    gauges 为在导出时调用的函数，返回 {指标名: 值}，用于活动会话数等瞬时值。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.logins = {"success": 0, "failure": 0}
+        self.commands = {}
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.transfers = {}
+        self.transfer_durations = {"upload": Histogram(), "download": Histogram()}
+        self.tls_handshakes = {}
+        self.passive_exhausted = 0
+        self.gauges = []
+        # 子进程中: 发送计数器增量的进程间队列、发送间隔和上次发送的时间
+        self._channel = None
+        self._forward_interval = 1.0
+        self._forwarded_at = 0.0
+
+    def login(self, success):
+        """记录一次登录"""
+        with self._lock:
+            self.logins["success" if success else "failure"] += 1
+        if self._channel is not None:
+            self._forward()
+
+    def command(self, verb):
+        """记录一条命令"""
+        with self._lock:
+            self.commands[verb] = self.commands.get(verb, 0) + 1
+        if self._channel is not None:
+            self._forward()
+
+    def data_transferred(self, sent, received):
+        """记录数据通道收发的字节数（包括目录列表）"""
+        with self._lock:
+            self.bytes_sent += sent
+            self.bytes_received += received
+        if self._channel is not None:
+            self._forward()
+
+    def transfer(self, upload, completed, elapsed):
+        """记录一次文件传输及其耗时"""
+        direction = "upload" if upload else "download"
+        key = (direction, "completed" if completed else "incomplete")
+        with self._lock:
+            self.transfers[key] = self.transfers.get(key, 0) + 1
+            self.transfer_durations[direction].observe(elapsed)
+        if self._channel is not None:
+            self._forward()
+
+    def tls_handshake(self, channel, resumed):
+        """记录一次TLS握手，channel为control或data，resumed为None表示无法判断"""
+        key = (channel, "unknown" if resumed is None else ("resumed" if resumed else "full"))
+        with self._lock:
+            self.tls_handshakes[key] = self.tls_handshakes.get(key, 0) + 1
+        if self._channel is not None:
+            self._forward()
+
+    def passive_ports_exhausted(self):
+        """记录一次因被动端口用完而拒绝的PASV/EPSV"""
+        with self._lock:
+            self.passive_exhausted += 1
+        if self._channel is not None:
+            self._forward()
+
+    def forward_to(self, channel, interval=1.0):
+        """在子进程中调用: 之后每隔interval秒把计数器增量发送到channel，由主进程累加
+
+        只在记录指标时检查间隔，子进程退出前应调用 flush() 发送剩余的增量。
+        """
+        # fork()时其他线程可能正持有锁；复制来的是主进程已有的累计值，不能再发回去
+        self._lock = threading.Lock()
+        self.drain()
+        self._channel = channel
+        self._forward_interval = interval
+        self._forwarded_at = time.monotonic()
+
+    def flush(self):
+        """立即把尚未发送的计数器增量发送给主进程"""
+        if self._channel is not None:
+            self._forwarded_at = time.monotonic()
+            self._channel.put(self.drain())
+
+    def _forward(self):
+        if time.monotonic() - self._forwarded_at >= self._forward_interval:
+            self.flush()
+
+    def collect_from(self, channel):
+        """在主进程中调用: 启动后台线程累加子进程发来的增量，channel收到None时线程结束"""
+        thread = threading.Thread(target=self._receive, args=(channel,), name="metrics-collector")
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def _receive(self, channel):
+        while True:
+            try:
+                data = channel.get()
+            except (EOFError, OSError, ValueError):
+                return
+            if data is None:
+                return
+            self.merge(data)
+
+    def _counters(self):
+        return {
+            "logins": dict(self.logins),
+            "commands": dict(self.commands),
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "transfers": dict(self.transfers),
+            "transfer_durations": {k: h.copy() for k, h in self.transfer_durations.items()},
+            "tls_handshakes": dict(self.tls_handshakes),
+            "passive_exhausted": self.passive_exhausted,
+        }
+
+    def drain(self):
+        """返回自上次调用以来的计数器增量并清零（不包括瞬时指标）
+
+        工作进程定期把增量发送给主进程，由主进程的 merge() 累加。
+        """
+        with self._lock:
+            data = self._counters()
+            self.logins = {"success": 0, "failure": 0}
+            self.commands = {}
+            self.bytes_sent = 0
+            self.bytes_received = 0
+            self.transfers = {}
+            self.transfer_durations = {"upload": Histogram(), "download": Histogram()}
+            self.tls_handshakes = {}
+            self.passive_exhausted = 0
+        return data
+
+    def merge(self, data):
+        """累加 drain() 返回的计数器"""
+        with self._lock:
+            for key in ("logins", "commands", "transfers", "tls_handshakes"):
+                counters = getattr(self, key)
+                for name, value in data[key].items():
+                    counters[name] = counters.get(name, 0) + value
+            self.bytes_sent += data["bytes_sent"]
+            self.bytes_received += data["bytes_received"]
+            self.passive_exhausted += data["passive_exhausted"]
+            for direction, histogram in data["transfer_durations"].items():
+                self.transfer_durations[direction].merge(histogram)
+
+    def collect(self):
+        """返回当前所有指标的一致副本"""
+        with self._lock:
+            data = self._counters()
+        for gauge in list(self.gauges):
+            try:
+                data.update(gauge())
+            except Exception as e:
+                logging.getLogger("FTPServer.Metrics").error(f"读取指标失败: {str(e)}")
+        return data
+
+    def render(self):
+        """以Prometheus文本格式导出所有指标"""
+        data = self.collect()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(labels)} {value}")
+
+        metric("ftp_logins_total", "counter", "Login attempts by result.",
+               [({"result": k}, v) for k, v in sorted(data["logins"].items())])
+        metric("ftp_commands_total", "counter", "FTP commands received by verb.",
+               [({"verb": k}, v) for k, v in sorted(data["commands"].items())])
+        metric("ftp_bytes_sent_total", "counter", "Bytes sent on data channels.",
+               [({}, data["bytes_sent"])])
+        metric("ftp_bytes_received_total", "counter", "Bytes received on data channels.",
+               [({}, data["bytes_received"])])
+        metric("ftp_transfers_total", "counter", "File transfers by direction and result.",
+               [({"direction": d, "result": r}, v) for (d, r), v in sorted(data["transfers"].items())])
+        metric("ftp_tls_handshakes_total", "counter", "TLS handshakes by channel and session reuse.",
+               [({"channel": c, "session": r}, v) for (c, r), v in sorted(data["tls_handshakes"].items())])
+        metric("ftp_passive_port_exhaustions_total", "counter",
+               "PASV/EPSV commands refused because every passive port was in use.",
+               [({}, data["passive_exhausted"])])
+
+        lines.append("# HELP ftp_transfer_duration_seconds File transfer duration.")
+        lines.append("# TYPE ftp_transfer_duration_seconds histogram")
+        for direction, histogram in sorted(data["transfer_durations"].items()):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                cumulative += count
+                labels = _labels({"direction": direction, "le": bound})
+                lines.append(f"ftp_transfer_duration_seconds_bucket{labels} {cumulative}")
+            labels = _labels({"direction": direction})
+            lines.append(f"ftp_transfer_duration_seconds_sum{labels} {histogram.total}")
+            lines.append(f"ftp_transfer_duration_seconds_count{labels} {histogram.count}")
+
+        for name in sorted(k for k in data if k.startswith("ftp_")):
+            metric(name, "gauge", GAUGE_HELP.get(name, name), [({}, data[name])])
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    """只提供 GET /metrics 的HTTP请求处理器"""
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.getLogger("FTPServer.Metrics").debug(format % args)
+
+
+class MetricsHTTPServer:
+    """在后台线程中运行的本地指标HTTP端点"""
+
+    def __init__(self, metrics, address="127.0.0.1", port=9121):
+        self.metrics = metrics
+        self.address = address
+        self.port = port
+        self._httpd = None
+        self._thread = None
+
+    def start(self):
+        self._httpd = ThreadingHTTPServer((self.address, self.port), _MetricsRequestHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.metrics = self.metrics
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="metrics-http")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._httpd is None:
+            return
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join(timeout=5)
+        self._httpd = None
+        self._thread = None
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+被动端口池
+pyftpdlib每次PASV都把整个 passive_ports 范围复制成列表，再随机挑选端口逐个尝试bind()，
+端口快用完时要失败很多次才能找到空闲端口，全部用完后还会悄悄改用内核分配的随机端口。
+
+端口池用一个空闲端口队列和一个占用位图记录每个端口的状态: 分配和归还都是O(1)，
+刚归还的端口排到队尾，尽量晚一些再被重新使用；端口用完时PASV立即收到明确的425回复。
+端口在PASV时分配，数据连接关闭（或被动监听超时、被新的PASV/PORT取代）时立即归还。
+"""
+
+import threading
+from collections import deque
+
+
+class PassivePortPool:
+    """线程安全的被动端口分配器
+
+    记录当前占用数、历史峰值和因端口用完而拒绝的次数。多线程引擎的所有会话共享
+    同一个端口池；多进程引擎下每个子进程各有一份副本，只能靠bind()失败后换端口避免冲突。
+    """
+
+    def __init__(self, ports):
+        self._lock = threading.Lock()
+        self.peak = 0
+        self.exhausted = 0
+        self._set_range(ports, ())
+
+    def _set_range(self, ports, used):
+        self.ports = ports
+        self._used = bytearray(len(ports))
+        for port in used:
+            self._used[port - ports.start] = 1
+        self._free = deque(port for port in ports if not self._used[port - ports.start])
+        self.in_use = len(ports) - len(self._free)
+
+    def __len__(self):
+        return len(self.ports)
+
+    def __contains__(self, port):
+        return port in self.ports
+
+    @property
+    def available(self):
+        return len(self._free)
+
+    def acquire(self):
+        """分配一个空闲端口，端口用完时返回None"""
+        with self._lock:
+            if not self._free:
+                self.exhausted += 1
+                return None
+            port = self._free.popleft()
+            self._used[port - self.ports.start] = 1
+            self.in_use += 1
+            if self.in_use > self.peak:
+                self.peak = self.in_use
+            return port
+
+    def release(self, port):
+        """归还端口；不在范围内或未被占用的端口被忽略，返回是否归还成功"""
+        with self._lock:
+            if port not in self.ports or not self._used[port - self.ports.start]:
+                return False
+            self._used[port - self.ports.start] = 0
+            self._free.append(port)
+            self.in_use -= 1
+            return True
+
+    def resize(self, ports):
+        """更换端口范围，仍在使用的端口如果在新范围内继续记为占用"""
+        with self._lock:
+            used = [port for port in self.ports
+                    if self._used[port - self.ports.start] and port in ports]
+            self._set_range(ports, used)
+
+    def stats(self):
+        """返回 {"size", "in_use", "peak", "exhausted"}"""
+        with self._lock:
+            return {"size": len(self.ports), "in_use": self.in_use,
+                    "peak": self.peak, "exhausted": self.exhausted}
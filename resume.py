@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+断点续传状态
+记录中断的上传: (用户, 路径, 已接收大小, 已接收数据的CRC32)。客户端用 REST+STOR 或 APPE
+从已接收的大小继续上传时，校验和从记录的值继续累加，不需要重新读取已经写入磁盘的数据。
+SHA-256等哈希的中间状态无法保存，因此这里使用可以从中间值继续计算的CRC32。
+
+索引保存为只追加的JSON Lines文件，每行一条记录，删除以 size 为 -1 的记录表示；
+无效记录过多时由清理线程压缩（写入临时文件后原子替换）。多进程引擎的各个进程
+在开始上传前读取其他进程追加的记录。
+"""
+
+import os
+import json
+import time
+import zlib
+import logging
+import threading
+
+
+class UploadState:
+    """一次正在进行的上传，由数据通道在接收数据时更新"""
+
+    __slots__ = ("index", "user", "path", "offset", "received", "crc")
+
+    def __init__(self, index, user, path, offset, crc):
+        self.index = index
+        self.user = user
+        self.path = path
+        self.offset = offset
+        self.received = 0
+        # None 表示已有数据的校验和未知（没有续传记录或记录与文件不符）
+        self.crc = crc
+
+    @property
+    def size(self):
+        return self.offset + self.received
+
+    def update(self, chunk):
+        """累加接收到的数据"""
+        self.received += len(chunk)
+        if self.crc is not None:
+            self.crc = zlib.crc32(chunk, self.crc)
+
+    def finish(self, completed):
+        """上传结束（完成或中断）时调用"""
+        self.index.finish(self, completed)
+
+
+class ResumeIndex:
+    """中断上传的磁盘索引（线程安全）"""
+
+    # 文件中的行数超过有效记录数的这个倍数（且至少有这么多行）时压缩
+    COMPACT_RATIO = 4
+    COMPACT_MIN_LINES = 1000
+
+    def __init__(self, path):
+        self.path = path
+        self.logger = logging.getLogger("FTPServer.Resume")
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._lines = 0
+        self._loaded = None  # (inode, 已读取的字节数)
+        with self._lock:
+            self._refresh()
+
+    def get(self, user, path):
+        """返回 {"size", "crc", "mtime", "updated"}，没有记录时返回None"""
+        with self._lock:
+            self._refresh()
+            entry = self._entries.get((user, path))
+            return dict(entry) if entry is not None else None
+
+    def entries(self):
+        """返回所有记录的 [((用户, 路径), 记录)] 副本"""
+        with self._lock:
+            self._refresh()
+            return [(key, dict(entry)) for key, entry in self._entries.items()]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def begin(self, user, path, offset):
+        """开始一次从offset处写入的上传，返回 UploadState
+
+        记录的大小和修改时间与文件一致时从记录的CRC32继续计算，否则已有数据的校验和未知。
+        """
+        crc = 0 if offset == 0 else None
+        if offset:
+            with self._lock:
+                self._refresh()
+                entry = self._entries.get((user, path))
+            if entry is not None and entry["size"] == offset and _mtime(path) == entry["mtime"]:
+                crc = entry["crc"]
+        return UploadState(self, user, path, offset, crc)
+
+    def finish(self, state, completed):
+        """记录中断的上传，或在上传完成后删除记录"""
+        key = (state.user, state.path)
+        if completed:
+            with self._lock:
+                self._refresh()
+                if key in self._entries:
+                    del self._entries[key]
+                    self._append({"u": state.user, "p": state.path, "s": -1})
+            if state.offset and state.crc is not None:
+                self.logger.info(f"续传上传完成: {state.path} (用户: {state.user}, 大小: {state.size}, "
+                                 f"CRC32: {state.crc:08x})")
+            return
+        crc = state.crc
+        try:
+            st = os.stat(state.path)
+        except OSError:
+            return
+        if st.st_size != state.size:
+            # 写入失败等情况下磁盘上的数据与接收到的数据不一致
+            crc = None
+        record = {"u": state.user, "p": state.path, "s": st.st_size, "c": crc,
+                  "m": st.st_mtime_ns, "t": time.time()}
+        with self._lock:
+            self._refresh()
+            self._entries[key] = _entry(record)
+            self._append(record)
+
+    def discard(self, user, path):
+        """删除一条记录"""
+        with self._lock:
+            self._refresh()
+            if self._entries.pop((user, path), None) is not None:
+                self._append({"u": user, "p": path, "s": -1})
+
+    def compact(self, force=False):
+        """有效记录远少于文件行数时重写索引文件，返回是否进行了压缩"""
+        with self._lock:
+            self._refresh()
+            if not force and (self._lines < self.COMPACT_MIN_LINES
+                              or self._lines < len(self._entries) * self.COMPACT_RATIO):
+                return False
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                for (user, path), entry in self._entries.items():
+                    f.write(_dumps({"u": user, "p": path, "s": entry["size"], "c": entry["crc"],
+                                    "m": entry["mtime"], "t": entry["updated"]}))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+            st = os.stat(self.path)
+            self._loaded = (st.st_ino, st.st_size)
+            self._lines = len(self._entries)
+            return True
+
+    def _append(self, record):
+        """在持有锁、且已经读取过最新记录的情况下追加一条记录"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        line = _dumps(record).encode("utf-8")
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(fd, line)
+            st = os.fstat(fd)
+        finally:
+            os.close(fd)
+        self._lines += 1
+        if self._loaded is not None and self._loaded[0] == st.st_ino \
+                and self._loaded[1] + len(line) == st.st_size:
+            self._loaded = (st.st_ino, st.st_size)
+
+    def _refresh(self):
+        """在持有锁的情况下读取其他进程追加的记录，文件被替换时重新读取全部记录"""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            self._entries.clear()
+            self._lines = 0
+            self._loaded = None
+            return
+        if self._loaded is not None and self._loaded == (st.st_ino, st.st_size):
+            return
+        offset = 0
+        if self._loaded is not None and self._loaded[0] == st.st_ino and self._loaded[1] <= st.st_size:
+            offset = self._loaded[1]
+        else:
+            self._entries.clear()
+            self._lines = 0
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        # 只处理完整的行，最后一行可能正在被其他进程写入
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+                key = (record["u"], record["p"])
+            except (ValueError, KeyError, TypeError):
+                continue
+            self._lines += 1
+            if record.get("s", -1) < 0:
+                self._entries.pop(key, None)
+            else:
+                self._entries[key] = _entry(record)
+        self._loaded = (st.st_ino, offset + end)
+
+
+def _entry(record):
+    return {"size": record["s"], "crc": record.get("c"), "mtime": record.get("m"),
+            "updated": record.get("t", 0)}
+
+
+def _dumps(record):
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class ResumeJanitor:
+    """定期清理被放弃的部分上传文件
+
+    超过 max_age 秒没有继续上传、且文件在那之后没有被修改过的部分文件会被删除；
+    文件已经不存在或被其他方式修改过的记录只从索引中移除。
+    """
+
+    def __init__(self, index, max_age=86400, interval=3600):
+        self.index = index
+        self.max_age = max_age
+        self.interval = interval
+        self.logger = logging.getLogger("FTPServer.Resume")
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """启动后台清理线程"""
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="resume-janitor")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """停止后台清理线程"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def sweep(self, now=None):
+        """清理一次，返回删除的部分文件路径列表"""
+        now = time.time() if now is None else now
+        removed = []
+        for (user, path), entry in self.index.entries():
+            if now - entry["updated"] < self.max_age:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                self.index.discard(user, path)
+                continue
+            if st.st_size == entry["size"] and st.st_mtime_ns == entry["mtime"]:
+                try:
+                    os.remove(path)
+                    removed.append(path)
+                    self.logger.info(f"删除被放弃的部分上传文件: {path} (用户: {user}, 大小: {st.st_size})")
+                except OSError as e:
+                    self.logger.error(f"删除部分上传文件失败 {path}: {str(e)}")
+                    continue
+            self.index.discard(user, path)
+        try:
+            self.index.compact()
+        except OSError as e:
+            self.logger.error(f"压缩续传索引失败: {str(e)}")
+        return removed
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                self.logger.error(f"清理部分上传文件失败: {str(e)}")
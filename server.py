@@ -3,88 +3,249 @@
 
 import os
 import sys
+import time
 import logging
 import threading
 import socket
+import ast
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 
 # 导入FTP服务器依赖
-from pyftpdlib.authorizers import DummyAuthorizer
-from pyftpdlib.handlers import FTPHandler
-from pyftpdlib.servers import FTPServer
+from pyftpdlib.servers import FTPServer, ThreadedFTPServer
+try:
+    # 多进程服务器仅在POSIX平台上可用
+    from pyftpdlib.servers import MultiprocessFTPServer
+except ImportError:
+    MultiprocessFTPServer = None
 
 # 导入配置管理器
 from config import ConfigManager
+from authorizer import (PBKDF2_ITERATIONS, HashedAuthorizer, LazyUserTable, hash_password,
+                        is_password_hash)
+from handlers import SessionRegistry
+from ftps import build_handlers
+from throttle import BandwidthLimiter
+from metrics import Metrics, MetricsHTTPServer
+from snapshot import ConnectionSnapshot, SnapshotPublisher, EMPTY_SNAPSHOT
+from cachedfs import CachedFS, ListingCache
+from ingest import UploadPipeline
+from resume import ResumeIndex, ResumeJanitor
+from userstore import (JsonUserStore, SqliteUserStore, UserListView, UserStoreError,
+                       migrate_from_json)
+from watcher import ConfigWatcher
+from portpool import PassivePortPool
+from listeners import ListenerGroup, bind_addresses, has_reuse_port, open_listeners, split_port_range
+from workers import WorkerPool, install_worker_logging
+import handover
+import logpipeline
+from logpipeline import LOG_FILE
+
+if MultiprocessFTPServer is not None:
+
+    class ForkingFTPServer(MultiprocessFTPServer):
+        """每个连接一个子进程的服务器，子进程中的指标增量通过 metrics_channel 发回主进程"""
+
+        metrics_channel = None
+
+        def _loop(self, handler):
+            # 在子进程中执行
+            metrics = handler.metrics if self.metrics_channel is not None else None
+            if metrics is not None:
+                metrics.forward_to(self.metrics_channel)
+            try:
+                super()._loop(handler)
+            finally:
+                if metrics is not None:
+                    metrics.flush()
+else:
+    ForkingFTPServer = None
+
+# 可选的服务引擎: 配置项 "engine" 的取值 -> pyftpdlib服务器类
+SERVER_ENGINES = {
+    "async": FTPServer,
+    "threaded": ThreadedFTPServer,
+    "multiprocess": ForkingFTPServer,
+    # 每个工作进程一个 SO_REUSEPORT 监听套接字和一个异步IO循环
+    "reuseport": FTPServer if has_reuse_port() else None,
+}
+
+# 单线程异步引擎中校验密码（计算PBKDF2/scrypt）的线程数
+AUTH_THREADS = max(1, min(4, os.cpu_count() or 1))
+
+# 排空进度: 仍在进行的传输数、仍然连接的会话数、距离截止时间的秒数
+DrainProgress = namedtuple("DrainProgress", ["transfers", "sessions", "remaining"])
+
+
+def _is_valid_limit(value):
+    """限速必须是非负整数（字节/秒）"""
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
 
 class FTPServerManager:
     """FTP服务器管理类，负责服务器的启动、停止和管理"""
     
-    def __init__(self, config_path="config/settings.json", users_path="config/users.json"):
-        """初始化FTP服务器管理器"""
+    def __init__(self, config_path="config/settings.json", users_path="config/users.json", worker=None):
+        """初始化FTP服务器管理器
+        
+        worker 为 workers.WorkerInfo 时作为reuseport引擎的工作进程运行: 只使用被动端口范围
+        中属于自己的一段，日志发送给主进程，不启动指标端点和配置文件监视。
+        """
         # 初始化配置
         self.config_manager = ConfigManager(config_path, users_path)
+        self.worker = worker
+        self.worker_pool = None
+        self.listen_hosts = []
+        self.listen_port = None
         self.server = None
+        self.authorizer = None
         self.server_thread = None
         self.running = False
+        self.engine = None
+        self.sessions = SessionRegistry()
+        self.watcher = None
+        self.log_pipeline = None
+        self.snapshots = None
+        self.bandwidth = None
+        self.metrics_http = None
+        self.listing_cache = None
+        self.ingest = None
+        self.resume_index = None
+        self.resume_janitor = None
+        self.auth_executor = None
+        # 多进程引擎: 子进程发回指标增量的队列和主进程中累加增量的线程
+        self._metrics_channel = None
+        self._metrics_collector = None
+        # threaded/multiprocess 引擎: IO循环中检查排空标志、关闭监听套接字的定时任务
+        self._drain_check = None
+        # 排空停止: 最近一次进度、停止的结果、排空线程和提前结束排空的事件
+        self.draining = False
+        self.drain_progress = None
+        self.drain_result = None
+        self._drain_thread = None
+        self._drain_cancel = threading.Event()
+        # 交接: 等待新进程接手监听套接字的监听器，监听套接字是否已交给新进程
+        self.handover = None
+        self.handed_over = False
+        # batch_users() 期间被修改的用户名，退出时统一同步
+        self._user_batch = None
+        
+        # 指标在多次启动之间累计
+        self.metrics = Metrics()
+        self.metrics.gauges.append(self._snapshot_gauges)
+        self.metrics.gauges.append(self._ingest_gauges)
+        
+        # 加载配置（日志管线的轮转和队列参数来自配置文件）
+        self.config = self.config_manager.load_config()
         
         # 初始化日志
         self.setup_logging()
         
-        # 加载配置
-        self.config = self.config_manager.load_config()
-        self.users = self.config_manager.load_users()
+        # 加载用户
+        self.user_store = None
+        self.users = []
+        self.open_user_store()
+        
+    def open_user_store(self):
+        """按配置打开用户存储后端
+        
+        json后端把users.json全部读入 self.users；sqlite后端的 self.users 是按需查询的只读视图，
+        数据库为空且users.json存在时先迁移其中的用户。
+        """
+        if self.user_store is not None:
+            self.user_store.close()
+        store_config = self.config_manager.get_user_store_config()
+        if store_config["backend"] != "sqlite":
+            self.user_store = JsonUserStore(self.config_manager)
+            self.users = self.config_manager.load_users()
+            return
+        store = SqliteUserStore(store_config["path"])
+        if store.count() == 0 and os.path.exists(self.config_manager.users_path):
+            try:
+                migrated = migrate_from_json(self.config_manager.users_path, store)
+                self.logger.info(f"已从 {self.config_manager.users_path} 迁移 {migrated} 个用户到 {store_config['path']}")
+            except (OSError, ValueError, KeyError, UserStoreError) as e:
+                self.logger.error(f"迁移用户失败: {str(e)}")
+        self.user_store = store
+        self.users = UserListView(store)
+        
+    def get_user(self, username):
+        """按用户名查找用户，不存在时返回None"""
+        return self.user_store.get(username)
+        
+    def count_users(self):
+        """返回用户总数"""
+        return self.user_store.count()
+        
+    def get_users_page(self, offset, limit):
+        """返回从offset开始的最多limit个用户，用于界面分页"""
+        return self.user_store.page(offset, limit)
         
     def setup_logging(self):
-        """设置日志记录"""
-        log_dir = os.path.dirname("logs/ftp_server.log")
+        """设置日志记录
+        
+        日志记录先进入有界队列，由后台线程批量写入控制台和按大小/时间轮转的日志文件，
+        IO循环线程不会因为磁盘写入而阻塞。
+        """
+        if self.worker is not None:
+            install_worker_logging(self.worker.channel, self.config.get("log_level", "INFO"))
+            self.logger = logging.getLogger("FTPServer")
+            return
         try:
-            if not os.path.exists(log_dir):
-                os.makedirs(log_dir)
+            self.log_pipeline = logpipeline.install(self.config, LOG_FILE)
         except Exception as e:
-            print(f"无法创建日志目录: {str(e)}")
+            print(f"无法初始化日志: {str(e)}")
             sys.exit(1)
-            
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler("logs/ftp_server.log"),
-                logging.StreamHandler()
-            ]
-        )
         self.logger = logging.getLogger("FTPServer")
+        
+    def get_log_stats(self):
+        """获取日志管线状态: 队列中待写入的条数和因队列已满丢弃的条数"""
+        if self.log_pipeline is None:
+            return {"pending": 0, "dropped": 0}
+        return {"pending": self.log_pipeline.pending, "dropped": self.log_pipeline.dropped}
     
     def get_local_ip_addresses(self):
-        """获取本机所有有效IP地址列表"""
+        """获取本机所有有效IP地址列表（IPv4在前，IPv6在后）"""
         ip_list = []
+        ipv6_list = []
         try:
             # 获取本机主机名
             hostname = socket.gethostname()
             # 获取本机IP (包括IPv4和IPv6)
             addresses = socket.getaddrinfo(hostname, None)
             
-            # 筛选IPv4地址
             for addr in addresses:
-                if addr[0] == socket.AF_INET:  # 只取IPv4地址
-                    ip = addr[4][0]
+                ip = addr[4][0]
+                if addr[0] == socket.AF_INET:
                     if ip not in ip_list and not ip.startswith('127.'):  # 排除localhost
                         ip_list.append(ip)
+                elif addr[0] == socket.AF_INET6:
+                    # 链路本地地址需要指定网卡才能绑定，不列出
+                    ip = ip.split('%')[0]
+                    if ip not in ipv6_list and ip != '::1' and not ip.lower().startswith('fe80'):
+                        ipv6_list.append(ip)
             
             # 始终添加localhost和0.0.0.0（所有接口）
             if '127.0.0.1' not in ip_list:
                 ip_list.append('127.0.0.1')
             if '0.0.0.0' not in ip_list:
                 ip_list.append('0.0.0.0')
+            # 支持IPv6时添加 ::1 和 ::（所有IPv6接口，未同时监听0.0.0.0时也接受IPv4连接）
+            if socket.has_ipv6:
+                ipv6_list.extend(['::1', '::'])
                 
-            return ip_list
+            return ip_list + ipv6_list
         except Exception as e:
             self.logger.error(f"获取本机IP地址失败: {str(e)}")
             return ['127.0.0.1', '0.0.0.0']  # 返回默认值
     
     def is_valid_binding_address(self, address):
         """验证IP地址是否可以用于绑定"""
-        # 特殊情况: 0.0.0.0表示绑定所有接口，始终有效
-        if address == "0.0.0.0":
+        # 特殊情况: 0.0.0.0和::表示绑定所有接口，始终有效
+        if address in ("0.0.0.0", "::"):
             return True
             
         # 获取本机所有IP地址
@@ -92,67 +253,223 @@ class FTPServerManager:
         
         return address in valid_ips
     
-    def start_server(self):
-        """启动FTP服务器"""
+    def _parse_passive_ports(self):
+        """解析被动端口配置，返回端口range，未配置时返回None"""
+        if "passive_ports" not in self.config:
+            return None
+        try:
+            ports = self.config["passive_ports"].split("-")
+        except AttributeError:
+            raise ValueError("被动端口格式应为'起始端口-结束端口'")
+        if len(ports) != 2:
+            raise ValueError("被动端口格式应为'起始端口-结束端口'")
+        start, end = int(ports[0]), int(ports[1])
+        if start > end:
+            raise ValueError("起始端口不能大于结束端口")
+        ports = range(start, end + 1)  # 结束端口+1
+        if self.worker is not None:
+            # 工作进程只使用属于自己的一段
+            return split_port_range(ports, self.worker.count)[self.worker.index]
+        return ports
+        
+    def _max_connections(self):
+        """本进程的最大连接数，reuseport引擎的工作进程平分配置的总数"""
+        total = self.config["max_connections"]
+        if self.worker is None:
+            return total
+        return max(1, -(-total // self.worker.count))
+    
+    def start_server(self, sockets=None):
+        """启动FTP服务器
+        
+        参数:
+            sockets: 已经在监听的套接字（例如从旧进程交接来的），为None时按配置创建
+        """
         if self.running:
             self.logger.warning("服务器已经在运行")
             return False, "服务器已经在运行"
             
         try:
-            # 验证绑定地址是否有效
-            if not self.is_valid_binding_address(self.config["address"]):
-                valid_ips = self.get_local_ip_addresses()
-                err_msg = f"IP地址 {self.config['address']} 不是本机有效的网络接口地址。\n\n"
-                err_msg += "请使用以下有效的IP地址之一:\n- " + "\n- ".join(valid_ips)
-                self.logger.error(f"无效的绑定地址: {self.config['address']}")
-                raise ValueError(err_msg)
+            # 验证绑定地址是否有效（交接来的套接字已经绑定，使用它们的实际地址）
+            if sockets:
+                hosts = [sock.getsockname()[0] for sock in sockets]
+            else:
+                hosts = bind_addresses(self.config["address"], self.config.get("bind_addresses"))
+            for host in hosts:
+                if not self.is_valid_binding_address(host):
+                    valid_ips = self.get_local_ip_addresses()
+                    err_msg = f"IP地址 {host} 不是本机有效的网络接口地址。\n\n"
+                    err_msg += "请使用以下有效的IP地址之一:\n- " + "\n- ".join(valid_ips)
+                    self.logger.error(f"无效的绑定地址: {host}")
+                    raise ValueError(err_msg)
+                    
+            # 选择服务引擎
+            engine = self.config.get("engine", "async")
+            if engine not in SERVER_ENGINES:
+                raise ValueError(f"未知的服务引擎: {engine}，可选值: {', '.join(SERVER_ENGINES)}")
+            server_class = SERVER_ENGINES[engine]
+            if server_class is None:
+                raise ValueError(f"当前平台不支持服务引擎: {engine}")
+            if server_class is not FTPServer and len(hosts) > 1:
+                raise ValueError(f"服务引擎 {engine} 只支持一个监听地址")
+            if sockets and engine == "reuseport":
+                raise ValueError("reuseport引擎的工作进程各自创建监听套接字，不能使用交接的套接字")
+            if engine == "reuseport" and self.worker is None:
+                # 本进程不接受连接，只启动并监督工作进程
+                return self._start_workers(engine, hosts)
                 
             # 创建认证器
-            authorizer = DummyAuthorizer()
+            authorizer = HashedAuthorizer()
             
-            # 添加用户
-            for user in self.users:
-                perm = user.get("permissions", "elradfmwMT")  # 默认权限
-                authorizer.add_user(
-                    user["username"], 
-                    user["password"], 
-                    user["directory"], 
-                    perm=perm
-                )
+            # 添加用户（按需读取的存储后端在用户登录时才查询）
+            plaintext_users = 0
+            if self.user_store.lazy:
+                authorizer.user_table = LazyUserTable(self.user_store.get)
+            else:
+                for user in self.users:
+                    perm = user.get("permissions", "elradfmwMT")  # 默认权限
+                    authorizer.add_user(
+                        user["username"], 
+                        user["password"], 
+                        user["directory"], 
+                        perm=perm
+                    )
+                    if not is_password_hash(user["password"]):
+                        plaintext_users += 1
+            if plaintext_users:
+                self.logger.warning(f"有 {plaintext_users} 个用户的密码仍以明文保存，修改密码后将以哈希形式保存")
             
-            # 设置FTP处理器
-            handler = FTPHandler
+            # 设置FTP处理器（每次启动派生新的子类，避免修改全局FTPHandler）
+            # 启用FTPS时使用支持TLS的处理器，所有连接共用一个带会话缓存的SSL上下文
+            handler, dtp_handler = build_handlers(self.config_manager.get_tls_config())
+            self.sessions = SessionRegistry()
             handler.authorizer = authorizer
+            handler.registry = self.sessions
+            handler.metrics = self.metrics
             handler.banner = "FTP服务器已准备就绪"
             
+            # 传输调优: sendfile零拷贝下载、数据通道缓冲区和带宽限制
+            transfer = self.config_manager.get_transfer_config()
+            bandwidth = BandwidthLimiter(transfer["read_limit"], transfer["write_limit"])
+            # 不限速的用户在首次登录时才按需创建令牌桶
+            for user in self.user_store.limited_users():
+                bandwidth.set_user_limits(user["username"], user.get("read_limit", 0),
+                                          user.get("write_limit", 0))
+            dtp_handler.ac_in_buffer_size = transfer["read_size"]
+            dtp_handler.ac_out_buffer_size = transfer["write_size"]
+            dtp_handler.so_sndbuf = transfer["so_sndbuf"]
+            dtp_handler.so_rcvbuf = transfer["so_rcvbuf"]
+            dtp_handler.bandwidth = bandwidth
+            handler.use_sendfile = bool(transfer["use_sendfile"]) and hasattr(os, "sendfile")
+            if transfer["use_sendfile"] and not handler.use_sendfile:
+                self.logger.warning("当前平台不支持sendfile，下载将使用普通send()")
+            
+            # 目录列表缓存: 所有会话共享，按目录mtime/inotify失效
+            cache_config = self.config_manager.get_listing_cache_config()
+            listing_cache = None
+            if cache_config["enabled"]:
+                listing_cache = ListingCache(cache_config["max_bytes"], cache_config["ttl"],
+                                             use_inotify=cache_config["inotify"],
+                                             sort=cache_config["sorted"])
+                handler.abstracted_fs = type("AbstractedFS", (CachedFS,), {"cache": listing_cache})
+            
             # 被动模式设置
-            if "passive_ports" in self.config:
+            try:
+                handler.passive_ports = self._parse_passive_ports()
+            except ValueError as e:
+                if listing_cache is not None:
+                    listing_cache.close()
+                return False, f"无效的被动端口设置: {str(e)}"
+            # 端口池按O(1)分配被动端口，数据连接关闭时归还
+            if handler.passive_ports is not None:
+                handler.port_pool = PassivePortPool(handler.passive_ports)
+                if len(handler.passive_ports) < self._max_connections():
+                    self.logger.warning(f"被动端口只有 {len(handler.passive_ports)} 个，少于最大连接数 "
+                                        f"{self._max_connections()}，连接较多时PASV可能因端口用完被拒绝")
+                
+            # 上传后处理管线: 校验和、分片移动、压缩在线程池/进程池中执行
+            ingest_config = self.config_manager.get_ingest_config()
+            ingest = None
+            if ingest_config["enabled"]:
+                ingest = UploadPipeline(ingest_config["stages"], ingest_config["executor"],
+                                        ingest_config["workers"], ingest_config["max_pending"],
+                                        options=ingest_config)
+                handler.ingest = ingest
+                
+            # 断点续传: 记录中断的上传，定期清理被放弃的部分文件
+            resume_config = self.config_manager.get_resume_config()
+            resume_index = None
+            if resume_config["enabled"]:
                 try:
-                    ports = self.config["passive_ports"].split("-")
-                    if len(ports) != 2:
-                        raise ValueError("被动端口格式应为'起始端口-结束端口'")
-                    start, end = int(ports[0]), int(ports[1])
-                    if start > end:
-                        raise ValueError("起始端口不能大于结束端口")
-                    handler.passive_ports = range(start, end + 1)  # 结束端口+1
-                except ValueError as e:
-                    return False, f"无效的被动端口设置: {str(e)}"
+                    resume_index = ResumeIndex(resume_config["index_path"])
+                    handler.resume_index = resume_index
+                except OSError as e:
+                    self.logger.error(f"无法读取续传索引 {resume_config['index_path']}: {str(e)}")
             
-            # 创建FTP服务器
-            address = (self.config["address"], self.config["port"])
-            self.server = FTPServer(address, handler)
+            # 创建FTP服务器: 每个监听地址一个套接字，reuseport引擎的工作进程设置 SO_REUSEPORT
+            if sockets:
+                port = sockets[0].getsockname()[1]
+            else:
+                port = self.config["port"]
+                sockets = open_listeners(hosts, port, reuse_port=(engine == "reuseport"))
+            if server_class is FTPServer:
+                self.server = ListenerGroup(sockets, handler)
+                # 所有会话共用一个IO循环，密码在线程池中校验，完成后交回IO循环回复
+                self.auth_executor = ThreadPoolExecutor(max_workers=AUTH_THREADS,
+                                                        thread_name_prefix="auth")
+                handler.auth_executor = self.auth_executor
+                handler.scheduler = self.server
+            else:
+                self.server = server_class(sockets[0], handler)
+            if server_class is ForkingFTPServer:
+                self._metrics_channel = multiprocessing.Queue()
+                self._metrics_collector = self.metrics.collect_from(self._metrics_channel)
+                self.server.metrics_channel = self._metrics_channel
+            self.listen_hosts = hosts
+            self.listen_port = port
+            self.engine = engine
+            self.authorizer = authorizer
+            self.bandwidth = bandwidth
+            self.listing_cache = listing_cache
+            self.ingest = ingest
+            self.resume_index = resume_index
             
             # 设置并发连接限制
-            self.server.max_cons = self.config["max_connections"]
+            self.server.max_cons = self._max_connections()
             self.server.max_cons_per_ip = self.config["max_conn_per_ip"]
             
+            # 由IO循环定期发布连接快照，其他线程只读取快照
+            self.snapshots = SnapshotPublisher(self._collect_connections,
+                                               interval=self.config.get("snapshot_interval", 1.0))
+            self.snapshots.start(self.server.ioloop)
+            
             # 在单独的线程中启动服务器
-            self.server_thread = threading.Thread(target=self.server.serve_forever)
+            # 多线程/多进程引擎的主循环以固定超时轮询定时任务，不能长于快照发布间隔
+            serve_kwargs = {}
+            if server_class is not FTPServer:
+                serve_kwargs["timeout"] = min(1.0, self.snapshots.interval)
+                # 这类服务器没有线程安全的 call_soon()，定时任务必须在IO循环开始运行之前安排
+                self._drain_check = self.server.ioloop.call_every(serve_kwargs["timeout"],
+                                                                  self._close_when_draining)
+            self.server_thread = threading.Thread(target=self.server.serve_forever,
+                                                  kwargs=serve_kwargs)
             self.server_thread.daemon = True
             self.server_thread.start()
             
             self.running = True
-            self.logger.info(f"FTP服务器启动成功，监听地址: {self.config['address']}:{self.config['port']}")
+            
+            # max_age为0时从不删除部分文件（其中可能有用户主动取消、仍想保留的上传）；
+            # 工作进程共用同一个续传索引，只由第一个工作进程清理
+            if resume_index is not None and resume_config["max_age"] > 0 and \
+                    (self.worker is None or self.worker.index == 0):
+                self.resume_janitor = ResumeJanitor(resume_index, resume_config["max_age"],
+                                                    resume_config["janitor_interval"])
+                self.resume_janitor.start()
+            # 指标端点和配置文件监视由主进程负责
+            if self.worker is None:
+                self._start_services()
+                
+            self.logger.info(f"FTP服务器启动成功，监听地址: {self._listen_description()}，服务引擎: {engine}")
             return True, None
             
         except ValueError as ve:
@@ -174,35 +491,295 @@ class FTPServerManager:
             self.logger.error(f"启动服务器失败: {str(e)}")
             return False, str(e)
     
+    def _set_passive_ports(self, handler, ports):
+        """更换运行中服务器的被动端口范围，已占用的端口在新范围内时继续记为占用"""
+        handler.passive_ports = ports
+        if ports is None:
+            handler.port_pool = None
+        elif handler.port_pool is None:
+            handler.port_pool = PassivePortPool(ports)
+        else:
+            handler.port_pool.resize(ports)
+            
+    def _start_workers(self, engine, hosts):
+        """reuseport引擎: 启动工作进程，本进程只汇总它们的日志、连接快照和指标
+        
+        工作进程从配置文件和用户文件读取设置，启动前应先保存配置。
+        """
+        count = self.config.get("workers") or os.cpu_count() or 1
+        try:
+            split_port_range(self._parse_passive_ports(), count)
+        except ValueError as e:
+            return False, f"无效的被动端口设置: {str(e)}"
+        pool = WorkerPool(self.config_manager.config_path, self.config_manager.users_path, count,
+                          self.metrics, interval=self.config.get("snapshot_interval", 1.0))
+        ok, error_msg = pool.start()
+        if not ok:
+            self.logger.error(f"启动服务器失败: {error_msg}")
+            return False, error_msg
+        self.worker_pool = pool
+        self.snapshots = pool.snapshots
+        self.server_thread = pool.thread
+        self.listen_hosts = hosts
+        self.listen_port = self.config["port"]
+        self.engine = engine
+        self.running = True
+        self._start_services()
+        self.logger.info(f"FTP服务器启动成功，监听地址: {self._listen_description()}，"
+                         f"服务引擎: {engine}，工作进程: {count}")
+        return True, None
+        
+    def _start_services(self):
+        """启动主进程中的辅助服务: 本地HTTP指标端点和配置文件监视"""
+        # 可选: 本地HTTP指标端点
+        if self.config.get("metrics_port"):
+            self.metrics_http = MetricsHTTPServer(self.metrics,
+                                                  self.config.get("metrics_address", "127.0.0.1"),
+                                                  self.config["metrics_port"])
+            try:
+                self.metrics_http.start()
+                self.logger.info(f"指标端点: http://{self.metrics_http.address}:{self.metrics_http.port}/metrics")
+            except OSError as e:
+                self.metrics_http = None
+                self.logger.error(f"启动指标端点失败: {str(e)}")
+                
+        # 可选: 监视配置文件的外部修改并热加载
+        if self.config.get("watch_config", False):
+            self.watcher = ConfigWatcher({
+                self.config_manager.config_path: self.load_config,
+                self.config_manager.users_path: self.reload_users
+            }, interval=self.config.get("watch_interval", 2))
+            self.watcher.start()
+            
+        # 可选: 等待新进程接手监听套接字（reuseport引擎的新进程可以直接绑定同一个端口）
+        path = self.config.get("handover_socket")
+        if path and self.worker_pool is None:
+            if not handover.is_supported():
+                self.logger.warning("当前平台不支持交接监听套接字，已忽略 handover_socket")
+                return
+            self.handed_over = False
+            self.handover = handover.HandoverListener(path, self._listening_sockets, self._hand_over)
+            try:
+                self.handover.start()
+            except OSError as e:
+                self.handover = None
+                self.logger.error(f"无法创建交接套接字 {path}: {str(e)}")
+                
+    def _listening_sockets(self):
+        """可以交给新进程的监听套接字，服务器未运行或正在停止时为空列表"""
+        if not self.running or self.draining or self.server is None or self.worker_pool is not None:
+            return []
+        if isinstance(self.server, ListenerGroup):
+            return [server.socket for server in self.server.servers]
+        return [self.server.socket]
+        
+    def _hand_over(self, pid):
+        """新进程已经用交接的套接字开始接受连接: 排空本进程的会话后停止"""
+        self.logger.info(f"监听套接字已由新进程 {pid or ''} 接手，本进程不再接受新连接")
+        ok, error_msg = self.drain_server()
+        self.handed_over = ok
+        if not ok:
+            self.logger.warning(f"交接后无法排空: {error_msg}")
+            
+    def take_over(self, timeout=handover.HANDOVER_TIMEOUT):
+        """从运行中的旧进程接手监听套接字并启动服务器，旧进程随后排空并退出
+        
+        旧进程和本进程使用同一个配置项 handover_socket。
+        
+        返回:
+            tuple: (是否成功, 错误信息)
+        """
+        path = self.config.get("handover_socket")
+        if not path:
+            return False, "没有设置 handover_socket"
+        if not handover.is_supported():
+            return False, "当前平台不支持交接监听套接字"
+        if self.config.get("engine", "async") == "reuseport":
+            return False, "reuseport引擎不需要交接，新进程可以直接监听同一个端口"
+        try:
+            conn, sockets, pid = handover.request_listeners(path, timeout)
+        except (OSError, handover.HandoverError) as e:
+            self.logger.error(f"无法从旧进程接手监听套接字: {str(e)}")
+            return False, f"无法从旧进程接手监听套接字: {str(e)}"
+        self.logger.info(f"已从进程 {pid} 接手 {len(sockets)} 个监听套接字")
+        ok, error_msg = self.start_server(sockets=sockets)
+        handover.confirm(conn, ok)
+        if not ok:
+            for sock in sockets:
+                sock.close()
+        return ok, error_msg
+            
+    def _listen_description(self):
+        """监听地址的文字说明，例如 0.0.0.0:2121, [::]:2121"""
+        return ", ".join(f"[{host}]:{self.listen_port}" if ":" in host else f"{host}:{self.listen_port}"
+                         for host in self.listen_hosts)
+    
+    def drain_server(self, timeout=None, progress=None, done=None):
+        """排空后停止服务器，立即返回，不阻塞调用者
+
+        立即停止接受新连接，会话再发出打开数据连接的命令时收到421并断开；正在进行的传输
+        最多再继续 timeout 秒（默认为配置项 drain_timeout），全部结束或超时后停止服务器。
+        排空期间调用 stop_server() 会提前结束排空并立即停止。
+
+        参数:
+            progress: 在排空线程中定期调用，参数为DrainProgress，也可以读取 drain_progress
+            done: 服务器停止后在排空线程中调用，参数为 stop_server() 的返回值
+
+        返回:
+            tuple: (是否开始排空, 错误信息)
+        """
+        if not self.running:
+            self.logger.warning("服务器未在运行")
+            return False, "服务器未在运行"
+        if self.draining:
+            return False, "服务器正在停止"
+        if timeout is None:
+            timeout = self.config.get("drain_timeout", 30)
+        self.draining = True
+        self.drain_progress = None
+        self.drain_result = None
+        self._drain_cancel.clear()
+        started = time.time()
+        self._stop_accepting()
+        self.logger.info(f"正在停止服务器: 不再接受新连接，等待正在进行的传输完成（最多 {timeout} 秒）")
+        self._drain_thread = threading.Thread(target=self._drain, name="drain", daemon=True,
+                                              args=(started, time.monotonic() + timeout, progress, done))
+        self._drain_thread.start()
+        return True, None
+
+    def _stop_accepting(self):
+        """关闭监听套接字，让会话拒绝新的数据连接命令"""
+        if self.worker_pool is not None:
+            self.worker_pool.drain()
+            return
+        # 处理器类的属性，会话下一条命令就能看到；监听套接字必须在IO循环线程中关闭，
+        # threaded/multiprocess 引擎由 _close_when_draining() 看到这个标志后关闭
+        self.server.handler.draining = True
+        if isinstance(self.server, ListenerGroup):
+            self.server.call_soon(self.server.close)
+
+    def _close_when_draining(self):
+        """IO循环中的定时任务: 开始排空后关闭监听套接字"""
+        if self.server.handler.draining:
+            self._drain_check.cancel()
+            self.server.close()
+
+    def _drain(self, started, deadline, progress, done):
+        """排空线程: 根据连接快照等待传输结束，然后停止服务器"""
+        transfers = 0
+        try:
+            while True:
+                snapshot = self.get_snapshot()
+                connections = snapshot.connections
+                # 多进程引擎看不到每个连接的状态，等待所有连接结束
+                transfers = sum(1 for c in connections if c.status != 'IDLE')
+                remaining = max(0.0, deadline - time.monotonic())
+                self.drain_progress = DrainProgress(transfers, len(connections), remaining)
+                if progress is not None:
+                    try:
+                        progress(self.drain_progress)
+                    except Exception as e:
+                        self.logger.error(f"报告排空进度失败: {str(e)}")
+                # 开始排空之前生成的快照可能漏掉刚开始的传输
+                fresh = snapshot.taken_at >= started
+                if (fresh and not transfers) or remaining <= 0 or not self.server_thread.is_alive():
+                    break
+                if self._drain_cancel.wait(min(0.25, remaining)):
+                    break
+            if transfers:
+                self.logger.warning(f"排空结束时仍有 {transfers} 个传输，将被中断")
+        finally:
+            result = self.stop_server()
+            self.drain_result = result
+            self.draining = False
+            self._drain_thread = None
+            if done is not None:
+                done(result)
+
     def stop_server(self):
-        """停止FTP服务器"""
+        """立即停止FTP服务器，正在进行的传输会被中断"""
+        drain_thread = self._drain_thread
+        if drain_thread is not None and drain_thread is not threading.current_thread():
+            # 提前结束排空，由排空线程停止服务器
+            self._drain_cancel.set()
+            drain_thread.join(timeout=15)
+            return self.drain_result or (False, "停止服务器超时")
         if not self.running:
             self.logger.warning("服务器未在运行")
             return False, "服务器未在运行"
         
         try:
-            self.server.close_all()
-            self.server.close()  # 关闭监听套接字
+            if self.handover:
+                self.handover.stop()
+                self.handover = None
+            if self.watcher:
+                self.watcher.stop()
+                self.watcher = None
+            if self.metrics_http:
+                self.metrics_http.stop()
+                self.metrics_http = None
+            if self.worker_pool is not None:
+                # 工作进程关闭各自的连接，发送最后的指标后退出
+                self.worker_pool.stop()
+                self.worker_pool = None
+            else:
+                self.server.close_all()
+                self.server.close()  # 关闭监听套接字
             if self.server_thread:
                 self.server_thread.join(timeout=5)
+            if self._metrics_channel is not None:
+                # 子进程退出前已经发出最后的增量，收完后停止累加线程
+                self._metrics_channel.put(None)
+                self._metrics_collector.join(timeout=5)
+                self._metrics_channel.close()
+                self._metrics_channel = self._metrics_collector = None
+            if self.snapshots:
+                self.snapshots.stop()
+                self.snapshots = None
+            self._drain_check = None
             self.running = False
+            self.engine = None
+            self.authorizer = None
+            self.bandwidth = None
+            if self.listing_cache:
+                self.listing_cache.close()
+                self.listing_cache = None
+            if self.ingest:
+                # 已提交的文件在后台继续处理，不在这里等待
+                self.ingest.close(wait=False)
+                self.ingest = None
+            if self.resume_janitor:
+                self.resume_janitor.stop()
+                self.resume_janitor = None
+            self.resume_index = None
+            if self.auth_executor:
+                self.auth_executor.shutdown(wait=False)
+                self.auth_executor = None
             self.logger.info("FTP服务器已停止")
             return True, None
         except Exception as e:
             self.logger.error(f"停止服务器失败: {str(e)}")
             return False, str(e)
     
-    def add_user(self, username, password, directory, permissions="elradfmwMT"):
+    def add_user(self, username, password, directory, permissions="elradfmwMT",
+                 read_limit=0, write_limit=0):
         """添加新用户
         
+        参数:
+            read_limit: 用户上传限速（字节/秒），0表示不限速
+            write_limit: 用户下载限速（字节/秒），0表示不限速
+        
         返回:
             tuple: (成功状态, 消息)
         """
         # 检查用户是否已存在
-        for user in self.users:
-            if user["username"] == username:
-                self.logger.warning(f"尝试添加重复的用户名: {username}")
-                return False, "用户名已存在"
+        if self.user_store.get(username) is not None:
+            self.logger.warning(f"尝试添加重复的用户名: {username}")
+            return False, "用户名已存在"
+                
+        for limit in (read_limit, write_limit):
+            if not _is_valid_limit(limit):
+                return False, "限速必须是非负整数（字节/秒）"
                 
         # 创建用户目录
         try:
@@ -212,55 +789,292 @@ class FTPServerManager:
             self.logger.error(error_msg)
             return False, error_msg
                 
-        # 添加新用户到配置管理器
-        self.users.append({
+        # 添加新用户到配置管理器（密码以加盐哈希形式保存）
+        user = {
             "username": username,
-            "password": password,
+            "password": hash_password(password, iterations=self._password_iterations()),
             "directory": directory,
-            "permissions": permissions
-        })
+            "permissions": permissions,
+            "read_limit": read_limit,
+            "write_limit": write_limit
+        }
         
         # 保存用户信息
-        if self.config_manager.save_users():
+        try:
+            user = self.user_store.put(user)
+        except UserStoreError as e:
+            self.logger.error(str(e))
+            return False, "保存用户信息失败"
+        if self._save_users():
+            self._push_user(user)
             return True, "用户添加成功"
         else:
             return False, "保存用户信息失败"
         
+    def _password_iterations(self):
+        """新密码哈希的PBKDF2迭代次数，已保存的哈希按各自记录的次数校验"""
+        return self.config.get("password_iterations", PBKDF2_ITERATIONS)
+        
     def remove_user(self, username):
         """删除用户"""
-        for i, user in enumerate(self.users):
-            if user["username"] == username:
-                del self.users[i]
-                return self.config_manager.save_users()
-        return False
+        try:
+            if not self.user_store.delete(username):
+                return False
+        except UserStoreError as e:
+            self.logger.error(str(e))
+            return False
+        if not self._save_users():
+            return False
+        self._drop_user(username)
+        return True
         
-    def update_user(self, username, new_password=None, new_directory=None, new_permissions=None):
+    def update_user(self, username, new_password=None, new_directory=None, new_permissions=None,
+                    new_read_limit=None, new_write_limit=None):
         """更新用户信息"""
-        for i, user in enumerate(self.users):
-            if user["username"] == username:
-                # 仅更新提供的字段
-                if new_password is not None:
-                    self.users[i]["password"] = new_password
-                if new_directory is not None:
-                    # 确保目录存在
-                    try:
-                        os.makedirs(new_directory, exist_ok=True)
-                        self.users[i]["directory"] = new_directory
-                    except OSError as e:
-                        self.logger.error(f"创建目录失败: {str(e)}")
-                        return False
-                if new_permissions is not None:
-                    self.users[i]["permissions"] = new_permissions
-                    
-                # 保存更新后的用户信息
-                return self.config_manager.save_users()
+        for limit in (new_read_limit, new_write_limit):
+            if limit is not None and not _is_valid_limit(limit):
+                self.logger.error(f"无效的限速设置: {limit}")
+                return False
+        user = self.user_store.get(username)
+        if user is None:
+            return False
+            
+        # 仅更新提供的字段
+        if new_password is not None:
+            user["password"] = hash_password(new_password, iterations=self._password_iterations())
+        if new_directory is not None:
+            # 确保目录存在
+            try:
+                os.makedirs(new_directory, exist_ok=True)
+                user["directory"] = new_directory
+            except OSError as e:
+                self.logger.error(f"创建目录失败: {str(e)}")
+                return False
+        if new_permissions is not None:
+            user["permissions"] = new_permissions
+        if new_read_limit is not None:
+            user["read_limit"] = new_read_limit
+        if new_write_limit is not None:
+            user["write_limit"] = new_write_limit
+            
+        # 保存更新后的用户信息
+        try:
+            user = self.user_store.put(user)
+        except UserStoreError as e:
+            self.logger.error(str(e))
+            return False
+        if not self._save_users():
+            return False
+        self._push_user(user)
+        return True
+
+    def put_user(self, user):
+        """保存已经准备好的用户（密码已哈希、目录已创建），添加或替换同名用户
+
+        供批量导入使用，不做重复检查，也不创建目录。
+        """
+        try:
+            user = self.user_store.put(user)
+        except UserStoreError as e:
+            self.logger.error(str(e))
+            return False
+        if not self._save_users():
+            return False
+        self._push_user(user)
+        return True
+
+    @contextmanager
+    def batch_users(self):
+        """批量增删改用户: 退出时只保存一次用户文件，再把修改同步到运行中的服务器
         
-        # 如果没有找到用户
-        return False
+        块内发生异常或保存失败时回滚全部修改，运行中的服务器不受影响。
+        
+        用法:
+            with manager.batch_users():
+                for row in rows:
+                    manager.add_user(...)
+        """
+        if self._user_batch is not None:
+            yield
+            return
+        self._user_batch = set()
+        try:
+            with self.user_store.batch():
+                yield
+        finally:
+            changed, self._user_batch = self._user_batch, None
+        if self.watcher:
+            self.watcher.refresh(self.config_manager.users_path)
+        if self.worker_pool is not None and changed:
+            # 工作进程重新读取一次即可
+            self.worker_pool.reload_users()
+            return
+        for username in changed:
+            user = self.user_store.get(username)
+            if user is not None:
+                self._push_user(user)
+            else:
+                self._drop_user(username)
+
+    def _save_users(self):
+        """保存用户文件，并让文件监视器忽略这次由程序自身引起的修改"""
+        result = self.user_store.save()
+        if self.watcher and self._user_batch is None:
+            self.watcher.refresh(self.config_manager.users_path)
+        return result
+
+    def _push_user(self, user):
+        """把用户的最新信息同步到正在运行的认证器和限速器中"""
+        if self._user_batch is not None:
+            self._user_batch.add(user["username"])
+            return
+        if self.worker_pool is not None:
+            self.worker_pool.reload_users()
+            return
+        authorizer = self.authorizer
+        if authorizer is None:
+            return
+        username = user["username"]
+        bandwidth = self.bandwidth
+        if bandwidth is not None:
+            bandwidth.set_user_limits(username, user.get("read_limit", 0), user.get("write_limit", 0))
+        if isinstance(authorizer.user_table, LazyUserTable):
+            # 下次登录或查询时从存储中重新读取
+            authorizer.forget_user(username)
+            return
+        perm = user.get("permissions", "elradfmwMT")
+        try:
+            if authorizer.has_user(username):
+                authorizer.update_user(username, password=user["password"],
+                                       homedir=user["directory"], perm=perm)
+            else:
+                authorizer.add_user(username, user["password"], user["directory"], perm=perm)
+        except ValueError as e:
+            self.logger.error(f"同步用户 {username} 到运行中的服务器失败: {str(e)}")
+
+    def _drop_user(self, username):
+        """从正在运行的认证器和限速器中移除用户"""
+        if self._user_batch is not None:
+            self._user_batch.add(username)
+            return
+        if self.worker_pool is not None:
+            self.worker_pool.reload_users()
+            return
+        bandwidth = self.bandwidth
+        if bandwidth is not None:
+            bandwidth.remove_user(username)
+        authorizer = self.authorizer
+        if authorizer is not None and isinstance(authorizer.user_table, LazyUserTable):
+            authorizer.forget_user(username)
+        elif authorizer is not None and authorizer.has_user(username):
+            authorizer.remove_user(username)
+
+    def reload_users(self):
+        """重新读取用户文件，并把增删改同步到正在运行的服务器"""
+        if self.worker_pool is not None:
+            self.users = self.config_manager.load_users(keep_on_error=True)
+            self.worker_pool.reload_users()
+            return
+        if self.user_store.lazy:
+            # 用户在数据库中，丢弃认证器缓存即可
+            if self.authorizer is not None:
+                self.authorizer.forget_user()
+            self.logger.info("用户缓存已清空，将从用户数据库重新读取")
+            return
+        self.users = self.config_manager.load_users(keep_on_error=True)
+        if self.authorizer is None:
+            return
+        usernames = set()
+        for user in self.users:
+            usernames.add(user["username"])
+            entry = self.authorizer.user_table.get(user["username"])
+            if (entry is not None and entry["pwd"] == user["password"]
+                    and entry["home"] == os.path.realpath(user["directory"])
+                    and entry["perm"] == user.get("permissions", "elradfmwMT")
+                    and self._user_limits_unchanged(user)):
+                continue
+            self._push_user(user)
+        for username in list(self.authorizer.user_table):
+            if username not in usernames and username != "anonymous":
+                self._drop_user(username)
+        self.logger.info("用户信息已热加载")
+
+    def _user_limits_unchanged(self, user):
+        bandwidth = self.bandwidth
+        if bandwidth is None:
+            return True
+        return bandwidth.get_user_limits(user["username"]) == (
+            user.get("read_limit", 0), user.get("write_limit", 0))
+
+    def load_config(self):
+        """重新读取配置文件，并尽可能在不重启的情况下应用到运行中的服务器"""
+        config = self.config_manager.load_config(keep_on_error=True)
+        self.config = config
+        if self.running:
+            errors = self.config_manager.validate_config()
+            if errors:
+                self.logger.warning("配置验证未通过，未应用到运行中的服务器: " + "; ".join(errors))
+            else:
+                self.apply_config()
+        return config
+
+    def apply_config(self):
+        """把当前配置应用到运行中的服务器
+        
+        最大连接数、每IP最大连接数、被动端口范围和全局限速会立即生效，
+        已建立的连接不受影响，正在进行的传输按新的限速继续。
+        
+        返回:
+            list: 需要重启服务器才能生效的配置项
+        """
+        if not self.running:
+            return []
+            
+        if self.worker_pool is not None:
+            # 工作进程从配置文件重新读取并各自应用
+            self.worker_pool.reload_config()
+        elif self.server is not None:
+            self.server.max_cons = self._max_connections()
+            self.server.max_cons_per_ip = self.config["max_conn_per_ip"]
+            try:
+                self._set_passive_ports(self.server.handler, self._parse_passive_ports())
+            except ValueError as e:
+                self.logger.error(f"无效的被动端口设置: {str(e)}")
+        else:
+            return []
+        if self.bandwidth is not None:
+            transfer = self.config_manager.get_transfer_config()
+            self.bandwidth.configure(transfer["read_limit"], transfer["write_limit"])
+            
+        # 这些配置只能在重启后生效
+        pending = []
+        if self.config["port"] != self.listen_port:
+            pending.append("port")
+        if bind_addresses(self.config["address"], self.config.get("bind_addresses")) != self.listen_hosts:
+            pending.append("address")
+        if self.config.get("engine", "async") != self.engine:
+            pending.append("engine")
+        if self.worker_pool is not None and (
+                self.config.get("workers") or os.cpu_count() or 1) != self.worker_pool.count:
+            pending.append("workers")
+        path = self.config.get("handover_socket")
+        path = os.path.abspath(path) if path else None
+        if self.worker_pool is None and handover.is_supported() and \
+                path != (self.handover.path if self.handover else None):
+            pending.append("handover_socket")
+        if pending:
+            self.logger.warning(f"以下配置需要重启服务器才能生效: {', '.join(pending)}")
+        self.logger.info("配置已热加载")
+        return pending
 
     def save_config(self):
-        """保存服务器配置"""
-        return self.config_manager.save_config()
+        """保存服务器配置，并把可热加载的配置应用到运行中的服务器"""
+        result = self.config_manager.save_config()
+        if self.watcher:
+            self.watcher.refresh(self.config_manager.config_path)
+        if result and self.running:
+            self.apply_config()
+        return result
 
     def get_server_status(self):
         """获取服务器当前状态信息"""
@@ -272,57 +1086,169 @@ class FTPServerManager:
                 "port": "-"
             }
         
-        # 获取当前连接数
-        try:
-            active_conns = len(self.server._map) - 2  # 减去监听socket和定时器
-            if active_conns < 0:
-                active_conns = 0
-                
-            return {
-                "running": True,
-                "connections": active_conns,
-                "address": self.config["address"],
-                "port": self.config["port"]
-            }
-        except:
-            return {
-                "running": True,
-                "connections": 0,
-                "address": self.config["address"],
-                "port": self.config["port"]
-            }
+        # 当前连接数取自最近一次发布的连接快照
+        return {
+            "running": True,
+            "connections": len(self.get_snapshot().connections),
+            "address": self.config["address"],
+            "port": self.config["port"],
+            "engine": self.engine,
+            "workers": self.worker_pool.count if self.worker_pool is not None else 0,
+            "draining": self.draining
+        }
+
+    def get_snapshot(self):
+        """获取最近一次发布的连接快照
+        
+        快照是不可变对象，可以在任意线程中读取，不需要加锁。
+        服务器未运行时返回空快照。
+        
+        返回:
+            ServerSnapshot: (taken_at, connections)，connections为ConnectionSnapshot元组
+        """
+        publisher = self.snapshots
+        if publisher is None:
+            return EMPTY_SNAPSHOT
+        return publisher.current
+
+    def get_metrics(self):
+        """获取服务器指标
+        
+        返回:
+            dict: 登录次数、按命令统计的命令数、收发字节数、传输次数和耗时直方图，
+                  以及活动会话数、被动端口使用量等瞬时值
+        """
+        return self.metrics.collect()
+
+    def _ingest_gauges(self):
+        """上传后处理管线的待处理文件数"""
+        if self.worker_pool is not None:
+            return {"ftp_ingest_pending": self.worker_pool.gauge("ftp_ingest_pending")}
+        ingest = self.ingest
+        return {"ftp_ingest_pending": ingest.pending if ingest is not None else 0}
+
+    def _snapshot_gauges(self):
+        """根据最近一次的连接快照和被动端口池计算瞬时指标"""
+        connections = self.get_snapshot().connections
+        gauges = {
+            "ftp_active_sessions": len(connections),
+            "ftp_passive_ports_in_use": sum(1 for c in connections if c.passive),
+            "ftp_passive_ports_peak": 0,
+            "ftp_passive_ports_total": 0
+        }
+        if self.worker_pool is not None:
+            # 各工作进程的端口范围互不重叠，峰值取各进程峰值之和
+            for name in ("ftp_passive_ports_in_use", "ftp_passive_ports_peak", "ftp_passive_ports_total"):
+                gauges[name] = self.worker_pool.gauge(name)
+        elif self.running and self.server is not None:
+            handler = self.server.handler
+            gauges["ftp_passive_ports_total"] = len(handler.passive_ports or ())
+            if self.engine == "multiprocess":
+                # 端口池在各个子进程中，主进程看不到占用情况，不导出这两项而不是报告0
+                del gauges["ftp_passive_ports_in_use"], gauges["ftp_passive_ports_peak"]
+            elif handler.port_pool is not None:
+                stats = handler.port_pool.stats()
+                gauges["ftp_passive_ports_in_use"] = stats["in_use"]
+                gauges["ftp_passive_ports_peak"] = stats["peak"]
+        return gauges
+
+    def _worker_tasks(self):
+        """返回多进程引擎下仍存活的工作进程列表"""
+        tasks = getattr(self.server, "_active_tasks", None) or []
+        return [t for t in list(tasks) if t.is_alive()]
+
+    def _collect_connections(self):
+        """在IO循环线程中收集所有连接的状态，供快照发布器调用"""
+        if self.engine == "multiprocess":
+            return self._collect_worker_connections()
+            
+        connections = []
+        for session in self.sessions.sessions():
+            bytes_in, bytes_out = session.bytes_in, session.bytes_out
+            status, path, transfer_bytes = 'IDLE', None, None
+            # 如果正在传输，计入当前传输的字节数
+            data_channel = session.data_channel
+            if data_channel is not None:
+                status = 'TRANSFERRING'
+                bytes_in += data_channel.tot_bytes_received
+                bytes_out += data_channel.tot_bytes_sent
+                if data_channel.file_obj is not None:
+                    path = data_channel.file_obj.name
+                    transfer_bytes = data_channel.get_transmitted_bytes()
+            connections.append(ConnectionSnapshot(
+                id=session.session_id,
+                ip=session.remote_ip,
+                port=session.remote_port,
+                user=session.username or '',
+                connected_at=session.started,
+                status=status,
+                file=path,
+                transfer_bytes=transfer_bytes,
+                bytes_in=bytes_in,
+                bytes_out=bytes_out,
+                commands=session.commands,
+                last_activity=session.last_activity,
+                pid=None,
+                passive=session._dtp_acceptor is not None or (
+                    data_channel is not None and session.passive_mode)
+            ))
+        return connections
+
+    def _collect_worker_connections(self):
+        """多进程引擎下根据工作进程信息构造连接状态
+        
+        每个连接由单独的子进程处理，主进程只能看到工作进程，没有会话计数器。
+        """
+        connections = []
+        for task in self._worker_tasks():
+            # pyftpdlib 将工作进程命名为客户端地址的repr，例如 "('1.2.3.4', 5678)"
+            try:
+                ip, port = ast.literal_eval(task.name)[:2]
+            except (ValueError, SyntaxError, TypeError):
+                ip, port = task.name, ''
+            connections.append(ConnectionSnapshot(
+                id=f"pid-{task.pid}", ip=ip, port=port, user=None, connected_at=None,
+                status='ACTIVE', file=None, transfer_bytes=None, bytes_in=None,
+                bytes_out=None, commands=None, last_activity=None, pid=task.pid,
+                passive=False
+            ))
+        return connections
 
     def get_connections(self):
-        """获取当前所有连接的信息"""
+        """获取当前所有连接的信息（基于最近一次发布的连接快照）"""
         connections = []
-        if not self.running or not self.server:
+        if not self.running:
             return connections
             
-        try:
-            # 遍历所有活动连接
-            for sock in list(self.server._map.values()):
-                # 跳过服务器监听socket和定时器
-                if not hasattr(sock, 'cmd_channel') or not hasattr(sock, 'remote_ip'):
-                    continue
-                    
-                # 获取连接信息
-                conn_info = {
-                    'ip': sock.remote_ip,
-                    'port': sock.remote_port,
-                    'user': sock.username if hasattr(sock, 'username') else '匿名',
-                    'time_connected': datetime.fromtimestamp(sock.created).strftime('%Y-%m-%d %H:%M:%S'),
-                    'status': 'IDLE' if not hasattr(sock, 'data_channel') else 'ACTIVE'
-                }
+        for conn in self.get_snapshot().connections:
+            if conn.pid is not None:
+                connections.append({
+                    'id': conn.id,
+                    'ip': conn.ip,
+                    'port': conn.port,
+                    'user': '-',
+                    'time_connected': '',
+                    'status': conn.status,
+                    'pid': conn.pid
+                })
+                continue
                 
-                # 如果正在传输，添加传输信息
-                if hasattr(sock, 'data_channel') and sock.data_channel is not None:
-                    if hasattr(sock.data_channel, 'file_obj'):
-                        conn_info['file'] = os.path.basename(sock.data_channel.file_obj.name) 
-                        conn_info['bytes_transferred'] = sock.data_channel.tot_bytes_sent
-                    conn_info['status'] = 'TRANSFERRING'
-                    
-                connections.append(conn_info)
-        except Exception as e:
-            self.logger.error(f"获取连接信息失败: {str(e)}")
+            conn_info = {
+                'id': conn.id,
+                'ip': conn.ip,
+                'port': conn.port,
+                'user': conn.user or '匿名',
+                'time_connected': datetime.fromtimestamp(conn.connected_at).strftime('%Y-%m-%d %H:%M:%S'),
+                'status': conn.status,
+                'bytes_in': conn.bytes_in,
+                'bytes_out': conn.bytes_out,
+                'commands': conn.commands,
+                'last_activity': conn.last_activity
+            }
+            # 如果正在传输，添加传输信息
+            if conn.file is not None:
+                conn_info['file'] = os.path.basename(conn.file)
+                conn_info['bytes_transferred'] = conn.transfer_bytes
+            connections.append(conn_info)
             
         return connections
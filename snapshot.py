@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+连接状态快照
+IO循环按固定间隔生成一份不可变的连接状态快照，并通过一次引用替换发布出去。
+图形界面、命令行或指标导出器随时读取 publisher.current 即可，无需加锁，
+也不会和IO循环线程竞争访问 socket_map。
+"""
+
+import time
+import logging
+from collections import namedtuple
+
+# 单个连接的状态
+ConnectionSnapshot = namedtuple("ConnectionSnapshot", [
+    "id",              # 稳定的连接标识
+    "ip",              # 客户端IP
+    "port",            # 客户端端口
+    "user",            # 登录用户名，未登录时为空字符串
+    "connected_at",    # 连接建立时间 (time.time())
+    "status",          # IDLE / TRANSFERRING / ACTIVE
+    "file",            # 当前传输的文件路径，没有传输时为None
+    "transfer_bytes",  # 当前传输已完成的字节数，没有传输时为None
+    "bytes_in",        # 本次会话累计接收的字节数（包括正在进行的传输）
+    "bytes_out",       # 本次会话累计发送的字节数（包括正在进行的传输）
+    "commands",        # 本次会话处理的命令数
+    "last_activity",   # 最后一次收到命令的时间 (time.time())
+    "pid",             # 多进程引擎下处理该连接的进程ID
+    "passive",         # 是否占用着一个被动模式端口（监听中或数据连接进行中）
+])
+
+# 整个服务器在某一时刻的状态
+ServerSnapshot = namedtuple("ServerSnapshot", ["taken_at", "connections"])
+
+EMPTY_SNAPSHOT = ServerSnapshot(0.0, ())
+
+
+class SnapshotPublisher:
+    """在IO循环中周期性生成并发布连接状态快照"""
+
+    def __init__(self, collect, interval=1.0):
+        """初始化发布器
+
+        参数:
+            collect: 在IO循环线程中调用，返回ConnectionSnapshot序列的函数
+            interval: 发布间隔（秒）
+        """
+        self.collect = collect
+        self.interval = interval
+        self.current = EMPTY_SNAPSHOT
+        self.logger = logging.getLogger("FTPServer.Snapshot")
+        self._task = None
+
+    def start(self, ioloop):
+        """立即发布一次快照，之后由ioloop按固定间隔发布"""
+        self.publish()
+        self._task = ioloop.call_every(self.interval, self.publish)
+
+    def stop(self):
+        """停止发布并清空快照"""
+        if self._task is not None and not self._task.cancelled:
+            self._task.cancel()
+        self._task = None
+        self.current = EMPTY_SNAPSHOT
+
+    def publish(self):
+        """生成新快照并替换当前快照（单次引用赋值，读取方无需加锁）"""
+        try:
+            connections = tuple(self.collect())
+        except Exception as e:
+            self.logger.error(f"生成连接快照失败: {str(e)}")
+            return
+        self.current = ServerSnapshot(time.time(), connections)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import pytest
+import tempfile
+import shutil
+
+# 添加项目根目录到路径，以便引入模块
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import authorizer as authorizer_module
+from authorizer import HashedAuthorizer, hash_password, is_password_hash, verify_password
+from pyftpdlib.authorizers import AuthenticationFailed
+
+
+class TestPasswordHash:
+    """密码哈希函数测试类"""
+
+    def test_pbkdf2_roundtrip(self):
+        """测试PBKDF2哈希的生成和校验"""
+        stored = hash_password("secret", iterations=1000)
+        assert is_password_hash(stored)
+        assert verify_password("secret", stored)
+        assert not verify_password("wrong", stored)
+        # 每次使用不同的盐
+        assert stored != hash_password("secret", iterations=1000)
+
+    def test_scrypt_roundtrip(self):
+        """测试scrypt哈希的生成和校验"""
+        stored = hash_password("secret", scheme="scrypt")
+        assert stored.startswith("scrypt$")
+        assert verify_password("secret", stored)
+        assert not verify_password("wrong", stored)
+
+    def test_plaintext_compat(self):
+        """测试旧版明文密码仍可校验"""
+        assert not is_password_hash("password123")
+        assert verify_password("password123", "password123")
+        assert not verify_password("password", "password123")
+
+
+class TestHashedAuthorizer:
+    """哈希认证器测试类"""
+
+    @pytest.fixture
+    def home(self):
+        """创建临时主目录"""
+        temp_path = tempfile.mkdtemp()
+        yield temp_path
+        shutil.rmtree(temp_path)
+
+    def test_validate_and_cache(self, home, monkeypatch):
+        """测试验证成功后结果被缓存"""
+        auth = HashedAuthorizer()
+        auth.add_user("alice", hash_password("pw", iterations=1000), home, perm="elr")
+        auth.validate_authentication("alice", "pw", None)
+
+        calls = []
+        original = authorizer_module.verify_password
+        monkeypatch.setattr(authorizer_module, "verify_password",
+                            lambda *args: calls.append(args) or original(*args))
+        auth.validate_authentication("alice", "pw", None)
+        assert calls == []
+
+        with pytest.raises(AuthenticationFailed):
+            auth.validate_authentication("alice", "bad", None)
+        assert len(calls) == 1
+
+    def test_runtime_update_and_remove(self, home):
+        """测试运行期间更新和删除用户"""
+        auth = HashedAuthorizer()
+        auth.add_user("bob", hash_password("old", iterations=1000), home, perm="elr")
+        auth.validate_authentication("bob", "old", None)
+
+        auth.update_user("bob", password=hash_password("new", iterations=1000), perm="elradfmw")
+        with pytest.raises(AuthenticationFailed):
+            auth.validate_authentication("bob", "old", None)
+        auth.validate_authentication("bob", "new", None)
+        assert auth.has_perm("bob", "w")
+
+        auth.remove_user("bob")
+        assert not auth.has_perm("bob", "r")
+        with pytest.raises(AuthenticationFailed):
+            auth.validate_authentication("bob", "new", None)
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
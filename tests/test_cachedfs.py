@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import pytest
+
+# 添加项目根目录到路径，以便引入模块
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from cachedfs import CachedFS, DirectoryListing, ListingCache
+
+
+def _age(path):
+    """把目录的修改时间调到过去，使扫描结果可以被缓存"""
+    old = time.time() - 60
+    os.utime(path, (old, old))
+
+
+def _make_files(path, names):
+    for name in names:
+        with open(os.path.join(path, name), 'w') as f:
+            f.write(name)
+    _age(path)
+
+
+class _Handler:
+    """CachedFS需要的最小命令通道"""
+    use_gmt_times = True
+    unicode_errors = 'replace'
+
+
+class TestListingCache:
+    """目录列表缓存测试类"""
+
+    @pytest.fixture
+    def cache(self):
+        cache = ListingCache(use_inotify=False)
+        yield cache
+        cache.close()
+
+    def test_scan_then_hit(self, cache, tmp_path):
+        """测试第一次扫描后缓存，第二次直接命中"""
+        _make_files(str(tmp_path), ["a", "b", "c"])
+        listing = cache.listdir(str(tmp_path))
+        assert isinstance(listing, DirectoryListing)
+        assert sorted(listing) == ["a", "b", "c"]
+        assert listing.lstat_for(os.path.join(str(tmp_path), "a")).st_size == 1
+
+        assert sorted(cache.listdir(str(tmp_path))) == ["a", "b", "c"]
+        stats = cache.stats()
+        assert stats["hits"] == 1 and stats["misses"] == 1 and stats["entries"] == 1
+
+    def test_sorted_by_default(self, tmp_path):
+        """测试目录项默认按名称排序（与NLST一致），sort=False时按扫描顺序边读边输出"""
+        names = [f"f{n:03d}" for n in range(100, 0, -1)]
+        _make_files(str(tmp_path), names)
+        cache = ListingCache(max_bytes=5000, use_inotify=False)
+        try:
+            # 放不进缓存的大目录也完整排序
+            assert list(cache.listdir(str(tmp_path))) == sorted(names)
+            cache.max_bytes = 1 << 20
+            list(cache.listdir(str(tmp_path)))
+            assert list(cache.listdir(str(tmp_path))) == sorted(names)
+            assert cache.stats()["hits"] == 1
+        finally:
+            cache.close()
+
+        cache = ListingCache(use_inotify=False, sort=False)
+        try:
+            listing = cache.listdir(str(tmp_path))
+            assert listing._scanner is not None
+            assert list(listing) == [entry.name for entry in os.scandir(str(tmp_path))]
+        finally:
+            cache.close()
+
+    def test_missing_directory_raises(self, cache, tmp_path):
+        """测试目录不存在时listdir立即抛出OSError"""
+        with pytest.raises(OSError):
+            cache.listdir(str(tmp_path / "missing"))
+
+    def test_directory_change_invalidates(self, cache, tmp_path):
+        """测试目录mtime变化（外部新建文件）后重新扫描"""
+        _make_files(str(tmp_path), ["a"])
+        list(cache.listdir(str(tmp_path)))
+        _make_files(str(tmp_path), ["b"])
+        os.utime(str(tmp_path))
+        assert sorted(cache.listdir(str(tmp_path))) == ["a", "b"]
+        assert cache.stats()["hits"] == 0
+
+    def test_recently_modified_directory_is_not_cached(self, cache, tmp_path):
+        """测试刚修改过的目录不缓存（粗粒度mtime无法区分之后的修改）"""
+        _make_files(str(tmp_path), ["a"])
+        os.utime(str(tmp_path))
+        list(cache.listdir(str(tmp_path)))
+        assert cache.stats()["entries"] == 0
+
+    def test_ttl(self, tmp_path):
+        """测试没有inotify时缓存超过ttl后重新读取"""
+        cache = ListingCache(ttl=1, use_inotify=False)
+        _make_files(str(tmp_path), ["a"])
+        list(cache.listdir(str(tmp_path)))
+        cache._entries[str(tmp_path)].scanned_at -= 2
+        list(cache.listdir(str(tmp_path)))
+        assert cache.stats()["misses"] == 2
+
+    def test_lru_eviction_by_size(self, tmp_path):
+        """测试缓存总大小超过上限时淘汰最久未使用的目录，超大目录只流式输出不缓存"""
+        dirs = []
+        for i in range(3):
+            path = tmp_path / str(i)
+            path.mkdir()
+            _make_files(str(path), [f"file{n}" for n in range(5)])
+            dirs.append(str(path))
+        big = tmp_path / "big"
+        big.mkdir()
+        _make_files(str(big), [f"file{n}" for n in range(50)])
+
+        cache = ListingCache(max_bytes=5000, use_inotify=False)
+        for path in dirs:
+            list(cache.listdir(path))
+        assert cache.stats()["entries"] == 2
+        assert cache.stats()["bytes"] <= 5000
+        assert dirs[0] not in cache._entries
+
+        assert len(list(cache.listdir(str(big)))) == 50
+        assert str(big) not in cache._entries
+
+    @pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify仅在Linux上可用")
+    def test_inotify_invalidates_on_file_change(self, tmp_path):
+        """测试inotify在目录中的文件内容被修改时使缓存失效（目录mtime不变）"""
+        cache = ListingCache()
+        try:
+            if not cache.inotify_active:
+                pytest.skip("inotify不可用")
+            _make_files(str(tmp_path), ["a"])
+            list(cache.listdir(str(tmp_path)))
+            assert cache.stats()["entries"] == 1
+            with open(os.path.join(str(tmp_path), "a"), 'a') as f:
+                f.write("more")
+            for _ in range(50):
+                if cache.stats()["entries"] == 0:
+                    break
+                time.sleep(0.05)
+            assert cache.stats()["entries"] == 0
+        finally:
+            cache.close()
+
+
+class TestCachedFS:
+    """带缓存的文件系统测试类"""
+
+    @pytest.fixture
+    def fs(self, tmp_path):
+        cache = ListingCache(use_inotify=False)
+        fs_class = type("AbstractedFS", (CachedFS,), {"cache": cache})
+        yield fs_class(str(tmp_path), _Handler())
+        cache.close()
+
+    def test_format_list_uses_scanned_stats(self, fs, tmp_path):
+        """测试LIST格式化使用扫描得到的stat结果"""
+        _make_files(str(tmp_path), ["hello.txt"])
+        listing = fs.listdir(str(tmp_path))
+        lines = list(fs.format_list(str(tmp_path), listing))
+        assert len(lines) == 1
+        assert lines[0].endswith(b" hello.txt\r\n")
+        assert b" 9 " in lines[0]
+
+        mlsd = list(fs.format_mlsx(str(tmp_path), fs.listdir(str(tmp_path)), "r",
+                                   ["type", "size"]))
+        assert mlsd == [b"size=9;type=file; hello.txt\r\n"]
+
+    def test_mutations_invalidate_parent(self, fs, tmp_path):
+        """测试通过文件系统进行的修改使所在目录的缓存失效"""
+        _make_files(str(tmp_path), ["a"])
+        cache = fs.cache
+        path = str(tmp_path)
+
+        list(fs.listdir(path))
+        fs.remove(os.path.join(path, "a"))
+        assert path not in cache._entries
+
+        _age(path)
+        list(fs.listdir(path))
+        fs.mkdir(os.path.join(path, "sub"))
+        assert path not in cache._entries
+
+        _age(path)
+        list(fs.listdir(path))
+        fs.open(os.path.join(path, "b"), "wb").close()
+        assert path not in cache._entries
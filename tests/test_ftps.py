@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import pytest
+
+# 添加项目根目录到路径，以便引入模块
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+SSL = pytest.importorskip("OpenSSL.SSL")
+
+from ftps import create_ssl_context, generate_self_signed_cert, build_handlers
+from config import DEFAULT_TLS_CONFIG
+from metrics import Metrics
+
+
+@pytest.fixture
+def cert(tmp_path):
+    """生成自签名证书，返回 (证书路径, 私钥路径)"""
+    certfile = str(tmp_path / "cert.pem")
+    keyfile = str(tmp_path / "key.pem")
+    generate_self_signed_cert(certfile, keyfile, "127.0.0.1")
+    return certfile, keyfile
+
+
+class TestSSLContext:
+    """FTPS的SSL上下文测试类"""
+
+    def test_session_cache_and_ciphers(self, cert):
+        """测试上下文启用了服务器端会话缓存并只保留AEAD密码套件"""
+        context = create_ssl_context(*cert, session_timeout=120)
+        assert context.get_session_cache_mode() & SSL.SESS_CACHE_SERVER
+        assert context.get_timeout() == 120
+        ciphers = SSL.Connection(context, None).get_cipher_list()
+        tls12 = [c for c in ciphers if not c.startswith("TLS_")]
+        assert tls12 and all("GCM" in c or "CHACHA20" in c for c in tls12)
+
+    def test_session_tickets_option(self, cert):
+        """测试关闭会话票据时设置 OP_NO_TICKET"""
+        # set_options(0) 不改变选项，返回当前的选项
+        assert not create_ssl_context(*cert).set_options(0) & SSL.OP_NO_TICKET
+        assert create_ssl_context(*cert, session_tickets=False).set_options(0) & SSL.OP_NO_TICKET
+
+    def test_invalid_settings(self, cert, tmp_path):
+        """测试证书、密码套件和TLS版本无效时抛出ValueError"""
+        with pytest.raises(ValueError):
+            create_ssl_context(str(tmp_path / "missing.pem"))
+        with pytest.raises(ValueError):
+            create_ssl_context(*cert, ciphers="NO-SUCH-CIPHER")
+        with pytest.raises(ValueError):
+            create_ssl_context(*cert, min_version="TLSv1.0")
+
+    def test_build_handlers(self, cert):
+        """测试按配置派生普通或支持TLS的处理器"""
+        handler, dtp_handler = build_handlers(dict(DEFAULT_TLS_CONFIG))
+        assert not hasattr(handler, "ssl_context")
+        assert handler.dtp_handler is dtp_handler
+
+        tls = dict(DEFAULT_TLS_CONFIG, enabled=True, certfile=cert[0], keyfile=cert[1],
+                   data_required=True)
+        handler, dtp_handler = build_handlers(tls)
+        assert handler.ssl_context is not None
+        assert handler.tls_data_required is True
+        assert "AUTH" in handler.proto_cmds
+        assert handler.dtp_handler is dtp_handler
+
+        with pytest.raises(ValueError):
+            build_handlers(dict(DEFAULT_TLS_CONFIG, enabled=True))
+
+    def test_handshake_metrics(self):
+        """测试TLS握手指标按通道和是否恢复会话计数"""
+        metrics = Metrics()
+        metrics.tls_handshake("control", False)
+        metrics.tls_handshake("data", True)
+        metrics.tls_handshake("data", True)
+        assert metrics.collect()["tls_handshakes"] == {("control", "full"): 1, ("data", "resumed"): 2}
+        assert 'ftp_tls_handshakes_total{channel="data",session="resumed"} 2' in metrics.render()
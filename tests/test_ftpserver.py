@@ -78,10 +78,10 @@ class TestFTPServerManager:
         """测试添加用户功能"""
         # 添加新用户
         user_dir = os.path.join(temp_dir, 'ftp_files', 'new_user')
-        result = server_manager.add_user("new_user", "new_pass", user_dir)
+        result, message = server_manager.add_user("new_user", "new_pass", user_dir)
         
         # 验证结果
-        assert result is True
+        assert result is True, message
         assert len(server_manager.users) == 2
         assert any(user["username"] == "new_user" for user in server_manager.users)
         assert os.path.exists(user_dir)
@@ -110,6 +110,67 @@ class TestFTPServerManager:
         server_manager.load_config()
         assert server_manager.config["port"] == 2222
         
+    def test_batch_users(self, server_manager, temp_dir, monkeypatch):
+        """测试批量修改用户只保存一次，异常时回滚全部修改"""
+        config_manager = server_manager.config_manager
+        saves = []
+        original_write = config_manager._write_json
+        monkeypatch.setattr(config_manager, "_write_json",
+                            lambda *args, **kwargs: (saves.append(args[0]), original_write(*args, **kwargs)))
+        monkeypatch.setattr("server.hash_password", lambda password, **kwargs: "hashed")
+
+        with server_manager.batch_users():
+            for i in range(50):
+                result, _ = server_manager.add_user(f"bulk{i}", "pw", os.path.join(temp_dir, f"bulk{i}"))
+                assert result is True
+            assert server_manager.remove_user("bulk0") is True
+        assert saves == [config_manager.users_path]
+        assert len(server_manager.users) == 50
+        assert config_manager.get_user("bulk49")["directory"].endswith("bulk49")
+
+        with pytest.raises(RuntimeError):
+            with server_manager.batch_users():
+                server_manager.add_user("extra", "pw", os.path.join(temp_dir, "extra"))
+                server_manager.update_user("bulk1", new_permissions="elr")
+                raise RuntimeError("中途失败")
+        assert config_manager.get_user("extra") is None
+        assert config_manager.get_user("bulk1")["permissions"] == "elradfmwMT"
+        assert len(saves) == 1
+
+        with open(config_manager.users_path) as f:
+            assert len(json.load(f)) == 50
+
+    def test_users_file_is_written_atomically(self, server_manager, monkeypatch):
+        """测试保存失败时原用户文件保持不变，且不留下临时文件"""
+        config_manager = server_manager.config_manager
+        with open(config_manager.users_path) as f:
+            before = f.read()
+
+        def broken_dump(*args, **kwargs):
+            raise OSError("磁盘已满")
+
+        monkeypatch.setattr("config.json.dump", broken_dump)
+        assert config_manager.save_users() is False
+        with open(config_manager.users_path) as f:
+            assert f.read() == before
+        assert sorted(os.listdir(os.path.dirname(config_manager.users_path))) == ["settings.json", "users.json"]
+
+    def test_compact_users_file(self, server_manager):
+        """测试紧凑格式的用户文件及大量用户的加载"""
+        config_manager = server_manager.config_manager
+        config_manager.config["users_file_compact"] = True
+        with config_manager.batch():
+            for i in range(20000):
+                config_manager.put_user({"username": f"u{i}", "password": "x", "directory": "/tmp",
+                                         "permissions": "elr"})
+                assert config_manager.save_users() is True
+        with open(config_manager.users_path) as f:
+            content = f.read()
+        assert "\n" not in content and ", " not in content
+        users = config_manager.load_users()
+        assert len(users) == 20001
+        assert config_manager.get_user("u19999")["permissions"] == "elr"
+
     def test_server_start_stop(self, server_manager):
         """测试服务器启动和停止功能"""
         # 启动服务器
@@ -121,6 +182,950 @@ class TestFTPServerManager:
         stop_result, _ = server_manager.stop_server()
         assert stop_result is True
         assert server_manager.running is False
+        
+    def test_threaded_engine(self, server_manager):
+        """测试多线程服务引擎的启动、状态查询和停止"""
+        server_manager.config["engine"] = "threaded"
+        start_result, _ = server_manager.start_server()
+        assert start_result is True
+        
+        status = server_manager.get_server_status()
+        assert status["engine"] == "threaded"
+        assert status["connections"] == 0
+        assert server_manager.get_connections() == []
+        
+        stop_result, _ = server_manager.stop_server()
+        assert stop_result is True
+        
+    @pytest.mark.skipif(not hasattr(os, "fork"), reason="multiprocess引擎需要fork()")
+    def test_multiprocess_engine_logging(self, server_manager, temp_dir):
+        """测试multiprocess引擎下子进程中的会话日志写入父进程的日志文件"""
+        import subprocess
+        # pytest接管了根日志记录器，日志管线只能在独立的进程中安装
+        server_manager.config["engine"] = "multiprocess"
+        assert server_manager.save_config()
+        code = f"""
+import sys, time, ftplib
+sys.path.insert(0, {os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))!r})
+from server import FTPServerManager
+manager = FTPServerManager({server_manager.config_manager.config_path!r},
+                           {server_manager.config_manager.users_path!r})
+ok, error = manager.start_server()
+assert ok, error
+ftp = ftplib.FTP()
+ftp.connect("127.0.0.1", 2121)
+ftp.login("test_user", "password123")
+ftp.nlst()
+ftp.quit()
+time.sleep(0.5)
+manager.stop_server()
+manager.log_pipeline.stop()
+"""
+        subprocess.run([sys.executable, "-c", code], cwd=temp_dir, check=True, timeout=60,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        with open(os.path.join(temp_dir, 'logs', 'ftp_server.log'), encoding='utf-8') as f:
+            log = f.read()
+        assert "USER 'test_user' logged in." in log
+        assert "FTP session closed" in log
+
+    @pytest.mark.skipif(not hasattr(os, "fork"), reason="multiprocess引擎需要fork()")
+    def test_multiprocess_engine_metrics(self, server_manager, temp_dir):
+        """测试multiprocess引擎下子进程中的登录、命令和字节数汇总到主进程的指标"""
+        import io
+        import time
+        import ftplib
+        with open(os.path.join(temp_dir, 'ftp_files', 'test_user', 'data.bin'), 'wb') as f:
+            f.write(b'x' * 5000)
+        server_manager.config["engine"] = "multiprocess"
+        start_result, _ = server_manager.start_server()
+        assert start_result is True
+        try:
+            ftp = ftplib.FTP()
+            ftp.connect("127.0.0.1", 2121)
+            ftp.login("test_user", "password123")
+            ftp.retrbinary("RETR data.bin", io.BytesIO().write)
+            ftp.quit()
+            # 子进程退出时发送剩余的增量
+            deadline = time.time() + 10
+            while time.time() < deadline and server_manager.get_metrics()["commands"].get("QUIT") != 1:
+                time.sleep(0.1)
+            metrics = server_manager.get_metrics()
+            assert metrics["logins"]["success"] == 1
+            assert metrics["commands"]["RETR"] == 1
+            assert metrics["bytes_sent"] >= 5000
+            assert metrics["transfers"] == {("download", "completed"): 1}
+        finally:
+            server_manager.stop_server()
+
+    @pytest.mark.skipif(not hasattr(__import__("socket"), "SO_REUSEPORT"),
+                        reason="平台不支持SO_REUSEPORT")
+    def test_reuseport_engine(self, server_manager):
+        """测试reuseport引擎: 多个工作进程监听同一端口，连接快照和指标汇总到主进程"""
+        import ftplib
+        import time
+        server_manager.config["engine"] = "reuseport"
+        server_manager.config["workers"] = 2
+        server_manager.config["snapshot_interval"] = 0.2
+        # 工作进程从配置文件读取设置
+        assert server_manager.save_config()
+        start_result, error_msg = server_manager.start_server()
+        assert start_result is True, error_msg
+        try:
+            status = server_manager.get_server_status()
+            assert status["engine"] == "reuseport"
+            assert status["workers"] == 2
+            assert len(server_manager.worker_pool.pids) == 2
+
+            clients = []
+            for _ in range(4):
+                ftp = ftplib.FTP()
+                ftp.connect("127.0.0.1", 2121)
+                ftp.login("test_user", "password123")
+                ftp.nlst()
+                clients.append(ftp)
+
+            deadline = time.time() + 10
+            while time.time() < deadline and len(server_manager.get_connections()) < 4:
+                time.sleep(0.1)
+            connections = server_manager.get_connections()
+            assert len(connections) == 4
+            assert all(c["user"] == "test_user" for c in connections)
+            assert len({c["id"] for c in connections}) == 4
+            for ftp in clients:
+                ftp.quit()
+
+            while time.time() < deadline and server_manager.get_metrics()["logins"]["success"] < 4:
+                time.sleep(0.1)
+            metrics = server_manager.get_metrics()
+            assert metrics["logins"]["success"] == 4
+            assert metrics["ftp_passive_ports_total"] == 101
+        finally:
+            stop_result, _ = server_manager.stop_server()
+        assert stop_result is True
+        assert server_manager.worker_pool is None
+
+    @pytest.mark.skipif(not __import__("socket").has_ipv6, reason="系统不支持IPv6")
+    def test_bind_addresses(self, server_manager):
+        """测试同时监听IPv4和IPv6地址"""
+        import ftplib
+        server_manager.config["bind_addresses"] = ["::1"]
+        start_result, error_msg = server_manager.start_server()
+        assert start_result is True, error_msg
+        try:
+            assert server_manager.get_server_status()["running"] is True
+            for host in ("127.0.0.1", "::1"):
+                ftp = ftplib.FTP()
+                ftp.connect(host, 2121)
+                ftp.login("test_user", "password123")
+                ftp.quit()
+        finally:
+            server_manager.stop_server()
+
+        server_manager.config["engine"] = "threaded"
+        start_result, error_msg = server_manager.start_server()
+        assert start_result is False
+        assert "threaded" in error_msg
+
+    def test_passive_port_pool(self, server_manager, temp_dir):
+        """测试被动端口在数据连接关闭后归还，端口用完时PASV收到425"""
+        import io
+        import time
+        import ftplib
+        with open(os.path.join(temp_dir, 'ftp_files', 'test_user', 'a.txt'), 'wb') as f:
+            f.write(b'a' * 1000)
+        server_manager.config["passive_ports"] = "61000-61001"
+        start_result, _ = server_manager.start_server()
+        assert start_result is True
+        clients = []
+        try:
+            for _ in range(3):
+                ftp = ftplib.FTP()
+                ftp.connect("127.0.0.1", 2121)
+                ftp.login("test_user", "password123")
+                clients.append(ftp)
+
+            # 传输结束后端口立即归还，可以反复使用
+            for _ in range(5):
+                data = io.BytesIO()
+                clients[0].retrbinary("RETR a.txt", data.write)
+                assert len(data.getvalue()) == 1000
+            pool = server_manager.server.handler.port_pool
+            deadline = time.time() + 5
+            while time.time() < deadline and pool.in_use:
+                time.sleep(0.05)
+            assert pool.stats()["in_use"] == 0
+
+            ports = [clients[i].makepasv()[1] for i in range(2)]
+            assert sorted(ports) == [61000, 61001]
+            with pytest.raises(ftplib.error_temp, match="425"):
+                clients[2].makepasv()
+
+            metrics = server_manager.get_metrics()
+            assert metrics["ftp_passive_ports_in_use"] == 2
+            assert metrics["ftp_passive_ports_peak"] == 2
+            assert metrics["passive_exhausted"] == 1
+
+            # 改用主动模式后被动监听关闭，端口归还
+            clients[1].makeport().close()
+            assert clients[2].makepasv()[1] in (61000, 61001)
+        finally:
+            for ftp in clients:
+                ftp.close()
+            server_manager.stop_server()
+
+    def test_connection_ids_are_stable(self, server_manager):
+        """测试连接列表中的连接ID在多次查询之间保持不变"""
+        import ftplib
+        import time
+        start_result, _ = server_manager.start_server()
+        assert start_result is True
+        ftp = ftplib.FTP()
+        try:
+            ftp.connect("127.0.0.1", 2121)
+            ftp.login("test_user", "password123")
+            first = None
+            for _ in range(50):
+                first = server_manager.get_connections()
+                if first and first[0]["user"] == "test_user":
+                    break
+                time.sleep(0.05)
+            second = server_manager.get_connections()
+            assert len(first) == 1
+            assert first[0]["id"] == second[0]["id"]
+            assert server_manager.get_server_status()["connections"] == 1
+        finally:
+            ftp.close()
+            server_manager.stop_server()
+
+    def test_connection_snapshot(self, server_manager, temp_dir):
+        """测试IO循环定期发布的连接快照及其会话计数器"""
+        import io
+        import ftplib
+        import time
+        home = os.path.join(temp_dir, 'ftp_files', 'test_user')
+        os.makedirs(home, exist_ok=True)
+        with open(os.path.join(home, 'data.bin'), 'wb') as f:
+            f.write(b'x' * 100000)
+
+        server_manager.config["snapshot_interval"] = 0.05
+        start_result, _ = server_manager.start_server()
+        assert start_result is True
+        ftp = ftplib.FTP()
+        try:
+            ftp.connect("127.0.0.1", 2121)
+            ftp.login("test_user", "password123")
+            ftp.retrbinary("RETR data.bin", io.BytesIO().write)
+            conn = None
+            for _ in range(50):
+                snapshot = server_manager.get_snapshot()
+                if snapshot.connections and snapshot.connections[0].bytes_out == 100000:
+                    conn = snapshot.connections[0]
+                    break
+                time.sleep(0.05)
+            assert conn is not None
+            assert conn.user == "test_user"
+            assert conn.status == 'IDLE'
+            assert conn.bytes_in == 0
+            assert conn.commands >= 5  # USER, PASS, TYPE, PASV, RETR
+            assert conn.last_activity >= conn.connected_at
+            # 快照是不可变的
+            with pytest.raises(AttributeError):
+                conn.commands = 0
+
+            info = server_manager.get_connections()[0]
+            assert info['bytes_out'] == 100000
+            assert info['commands'] == conn.commands
+        finally:
+            ftp.close()
+            server_manager.stop_server()
+        assert server_manager.get_snapshot().connections == ()
+
+    def test_server_metrics(self, server_manager, temp_dir):
+        """测试服务器运行时采集的登录、命令和传输指标"""
+        import io
+        import ftplib
+        import time
+        home = os.path.join(temp_dir, 'ftp_files', 'test_user')
+        with open(os.path.join(home, 'data.bin'), 'wb') as f:
+            f.write(b'x' * 5000)
+
+        server_manager.config["snapshot_interval"] = 0.05
+        start_result, _ = server_manager.start_server()
+        assert start_result is True
+        ftp = ftplib.FTP()
+        try:
+            ftp.connect("127.0.0.1", 2121)
+            with pytest.raises(ftplib.error_perm):
+                ftp.login("test_user", "wrong")
+            ftp.login("test_user", "password123")
+            ftp.retrbinary("RETR data.bin", io.BytesIO().write)
+            ftp.sendcmd("PASV")
+            for _ in range(50):
+                metrics = server_manager.get_metrics()
+                if metrics["ftp_passive_ports_in_use"] == 1:
+                    break
+                time.sleep(0.05)
+            assert metrics["logins"] == {"success": 1, "failure": 1}
+            assert metrics["commands"]["RETR"] == 1
+            assert metrics["commands"]["PASS"] == 2
+            assert metrics["bytes_sent"] >= 5000
+            assert metrics["transfers"] == {("download", "completed"): 1}
+            assert metrics["transfer_durations"]["download"].count == 1
+            assert metrics["ftp_active_sessions"] == 1
+            assert metrics["ftp_passive_ports_in_use"] == 1
+            assert metrics["ftp_passive_ports_total"] == 101
+        finally:
+            ftp.close()
+            server_manager.stop_server()
+
+    def test_bandwidth_limits(self, server_manager, temp_dir):
+        """测试用户下载限速，以及运行中修改限速立即生效"""
+        import io
+        import ftplib
+        import time
+        home = os.path.join(temp_dir, 'ftp_files', 'test_user')
+        with open(os.path.join(home, 'data.bin'), 'wb') as f:
+            f.write(b'x' * 300000)
+
+        assert server_manager.update_user("test_user", new_write_limit=200000) is True
+        assert server_manager.update_user("test_user", new_read_limit=-1) is False
+        start_result, _ = server_manager.start_server()
+        assert start_result is True
+        ftp = ftplib.FTP()
+        try:
+            ftp.connect("127.0.0.1", 2121)
+            ftp.login("test_user", "password123")
+            started = time.monotonic()
+            ftp.retrbinary("RETR data.bin", io.BytesIO().write)
+            assert time.monotonic() - started > 1.0
+
+            assert server_manager.update_user("test_user", new_write_limit=0) is True
+            started = time.monotonic()
+            ftp.retrbinary("RETR data.bin", io.BytesIO().write)
+            assert time.monotonic() - started < 1.0
+        finally:
+            ftp.close()
+            server_manager.stop_server()
+
+        server_manager.config["transfer"] = {"write_limit": -5}
+        assert any("write_limit" in e for e in server_manager.config_manager.validate_config())
+
+    def test_drain_server(self, server_manager, temp_dir):
+        """测试排空停止: 拒绝新连接和新的数据连接命令，正在进行的下载可以完成"""
+        import io
+        import time
+        import socket
+        import ftplib
+        import threading
+        with open(os.path.join(temp_dir, 'ftp_files', 'test_user', 'data.bin'), 'wb') as f:
+            f.write(b'x' * 300000)
+        server_manager.config["transfer"] = {"write_limit": 200000}
+        start_result, _ = server_manager.start_server()
+        assert start_result is True
+        downloader, idle = ftplib.FTP(), ftplib.FTP()
+        for ftp in (downloader, idle):
+            ftp.connect("127.0.0.1", 2121)
+            ftp.login("test_user", "password123")
+        data = io.BytesIO()
+        download = threading.Thread(target=downloader.retrbinary, args=("RETR data.bin", data.write))
+        progress, stopped = [], threading.Event()
+        try:
+            download.start()
+            deadline = time.time() + 5
+            while time.time() < deadline and not any(
+                    c.status == 'TRANSFERRING' for c in server_manager.get_snapshot().connections):
+                time.sleep(0.05)
+
+            result, _ = server_manager.drain_server(timeout=10, progress=progress.append,
+                                                    done=lambda r: (progress.append(r), stopped.set()))
+            assert result is True
+            assert server_manager.get_server_status()["draining"] is True
+            assert server_manager.drain_server()[0] is False
+
+            # 空闲会话打开数据连接时收到421并被断开
+            with pytest.raises(ftplib.error_temp, match="421"):
+                idle.makepasv()
+            # 监听套接字关闭后新连接被拒绝
+            deadline = time.time() + 3
+            while time.time() < deadline:
+                try:
+                    socket.create_connection(("127.0.0.1", 2121), timeout=1).close()
+                except OSError:
+                    break
+                time.sleep(0.1)
+            else:
+                pytest.fail("排空期间仍在接受新连接")
+
+            assert stopped.wait(10)
+            download.join(5)
+            assert len(data.getvalue()) == 300000
+            assert progress[-1] == (True, None)
+            assert any(p.transfers == 1 for p in progress[:-1])
+            assert server_manager.running is False
+            assert server_manager.draining is False
+        finally:
+            downloader.close()
+            idle.close()
+            if server_manager.running:
+                server_manager.stop_server()
+
+    @pytest.mark.parametrize("engine", ["async", "threaded"])
+    def test_drain_closes_listeners_in_io_loop(self, server_manager, temp_dir, engine):
+        """测试排空时监听套接字在IO循环线程中关闭，其他线程不修改IO循环的定时任务"""
+        import io
+        import time
+        import ftplib
+        import socket
+        import threading
+        with open(os.path.join(temp_dir, 'ftp_files', 'test_user', 'data.bin'), 'wb') as f:
+            f.write(b'x' * 300000)
+        server_manager.config["engine"] = engine
+        server_manager.config["transfer"] = {"write_limit": 100000}
+        start_result, _ = server_manager.start_server()
+        assert start_result is True
+        closed_in, scheduled_in = [], set()
+        close = server_manager.server.close
+        server_manager.server.close = lambda: (closed_in.append(threading.current_thread()), close())
+        # 定时任务堆不是线程安全的，启动后只能由IO循环线程修改
+        sched = server_manager.server.ioloop.sched
+        register = sched.register
+        sched.register = lambda task: (scheduled_in.add(threading.current_thread()), register(task))[1]
+        ftp = ftplib.FTP()
+        ftp.connect("127.0.0.1", 2121)
+        ftp.login("test_user", "password123")
+
+        def fetch():
+            try:
+                ftp.retrbinary("RETR data.bin", io.BytesIO().write)
+            except (ftplib.Error, OSError, EOFError):
+                pass  # 传输被中断
+
+        download = threading.Thread(target=fetch)
+        try:
+            download.start()
+            deadline = time.time() + 5
+            while time.time() < deadline and not any(
+                    c.status == 'TRANSFERRING' for c in server_manager.get_snapshot().connections):
+                time.sleep(0.05)
+            assert server_manager.drain_server(timeout=10)[0] is True
+            deadline = time.time() + 3
+            while time.time() < deadline and not closed_in:
+                time.sleep(0.05)
+            assert closed_in == [server_manager.server_thread]
+            assert scheduled_in <= {server_manager.server_thread}
+            with pytest.raises(OSError):
+                socket.create_connection(("127.0.0.1", 2121), timeout=1).close()
+        finally:
+            if server_manager.running:
+                server_manager.stop_server()
+            download.join(5)
+            ftp.close()
+
+    def test_drain_deadline(self, server_manager, temp_dir):
+        """测试排空超时后中断传输，排空期间可以立即停止"""
+        import io
+        import time
+        import ftplib
+        import threading
+        with open(os.path.join(temp_dir, 'ftp_files', 'test_user', 'data.bin'), 'wb') as f:
+            f.write(b'x' * 300000)
+        server_manager.config["transfer"] = {"write_limit": 50000}
+        for timeout in (0.5, 30):
+            start_result, _ = server_manager.start_server()
+            assert start_result is True
+            ftp = ftplib.FTP()
+            ftp.connect("127.0.0.1", 2121)
+            ftp.login("test_user", "password123")
+
+            def fetch():
+                try:
+                    ftp.retrbinary("RETR data.bin", io.BytesIO().write)
+                except (ftplib.Error, OSError, EOFError):
+                    pass  # 传输被中断
+
+            download = threading.Thread(target=fetch)
+            try:
+                download.start()
+                deadline = time.time() + 5
+                while time.time() < deadline and not any(
+                        c.status == 'TRANSFERRING' for c in server_manager.get_snapshot().connections):
+                    time.sleep(0.05)
+                started = time.monotonic()
+                assert server_manager.drain_server(timeout=timeout)[0] is True
+                if timeout > 1:
+                    # 立即停止，不等待排空
+                    assert server_manager.stop_server() == (True, None)
+                else:
+                    while server_manager.draining:
+                        time.sleep(0.05)
+                assert time.monotonic() - started < 3
+                assert server_manager.running is False
+                download.join(5)
+            finally:
+                ftp.close()
+
+    @pytest.mark.skipif(not hasattr(__import__("socket"), "AF_UNIX"), reason="平台不支持Unix套接字")
+    def test_handover(self, server_manager, temp_dir):
+        """测试零停机重启: 新进程接手监听套接字，旧进程的下载完成后退出，期间没有连接被拒绝"""
+        import io
+        import time
+        import signal
+        import ftplib
+        import socket
+        import threading
+        import subprocess
+        with open(os.path.join(temp_dir, 'ftp_files', 'test_user', 'data.bin'), 'wb') as f:
+            f.write(b'x' * 300000)
+        server_manager.config["transfer"] = {"write_limit": 200000}
+        server_manager.config["handover_socket"] = os.path.join(temp_dir, 'run', 'ftp.sock')
+        # 新进程从配置文件读取设置
+        assert server_manager.save_config()
+        start_result, error_msg = server_manager.start_server()
+        assert start_result is True, error_msg
+
+        downloader = ftplib.FTP()
+        downloader.connect("127.0.0.1", 2121)
+        downloader.login("test_user", "password123")
+        data = io.BytesIO()
+        download = threading.Thread(target=downloader.retrbinary, args=("RETR data.bin", data.write))
+        refused, probing = [], threading.Event()
+
+        def probe():
+            # 交接期间不停地建立新连接，每个连接都应该收到欢迎信息
+            while not probing.is_set():
+                try:
+                    with socket.create_connection(("127.0.0.1", 2121), timeout=5) as sock:
+                        if not sock.recv(64).startswith(b"220"):
+                            refused.append("no banner")
+                except OSError as e:
+                    refused.append(e)
+                time.sleep(0.02)
+
+        prober = threading.Thread(target=probe)
+        project_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+        process = None
+        try:
+            download.start()
+            prober.start()
+            process = subprocess.Popen(
+                [sys.executable, "-m", "ftpserver", "serve", "--takeover",
+                 "--config", server_manager.config_manager.config_path,
+                 "--users", server_manager.config_manager.users_path],
+                cwd=project_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+            deadline = time.time() + 20
+            while time.time() < deadline and (server_manager.running or server_manager.draining):
+                time.sleep(0.1)
+            # 旧进程等下载完成后才停止
+            assert server_manager.running is False
+            assert server_manager.handed_over is True
+            download.join(5)
+            assert len(data.getvalue()) == 300000
+            assert server_manager.drain_result == (True, None)
+
+            # 旧进程停止后由新进程继续服务，交接套接字也归新进程所有
+            ftp = ftplib.FTP()
+            ftp.connect("127.0.0.1", 2121)
+            ftp.login("test_user", "password123")
+            assert "data.bin" in ftp.nlst()
+            ftp.quit()
+            assert os.path.exists(server_manager.config["handover_socket"])
+            probing.set()
+            prober.join(10)
+            assert refused == []
+
+            process.send_signal(signal.SIGTERM)
+            assert process.wait(20) == 0
+        finally:
+            probing.set()
+            downloader.close()
+            if process is not None and process.poll() is None:
+                process.kill()
+                process.wait()
+            if server_manager.running:
+                server_manager.stop_server()
+
+    def test_listing_cache(self, server_manager, temp_dir):
+        """测试目录列表缓存: 重复LIST命中缓存，覆盖上传后列表显示新的文件大小"""
+        import io
+        import ftplib
+        home = os.path.join(temp_dir, 'ftp_files', 'test_user')
+        with open(os.path.join(home, 'data.bin'), 'wb') as f:
+            f.write(b'x' * 10)
+        old = os.stat(home).st_mtime - 60
+        os.utime(home, (old, old))
+
+        server_manager.users[0]["permissions"] = "elrw"
+        start_result, _ = server_manager.start_server()
+        assert start_result is True
+        ftp = ftplib.FTP()
+        try:
+            ftp.connect("127.0.0.1", 2121)
+            ftp.login("test_user", "password123")
+            assert ftp.nlst() == ["data.bin"]
+            ftp.nlst()
+            assert server_manager.listing_cache.stats()["hits"] >= 1
+
+            ftp.storbinary("STOR data.bin", io.BytesIO(b'y' * 20))
+            lines = []
+            ftp.retrlines("LIST", lines.append)
+            assert len(lines) == 1 and " 20 " in lines[0]
+        finally:
+            ftp.close()
+            server_manager.stop_server()
+        assert server_manager.listing_cache is None
+
+    def test_listing_cache_order(self, server_manager, temp_dir):
+        """测试使用目录缓存时LIST、MLSD和NLST都按名称排序"""
+        import ftplib
+        home = os.path.join(temp_dir, 'ftp_files', 'test_user')
+        names = ["zeta", "alpha", "mid", "beta", "omega"]
+        for name in names:
+            with open(os.path.join(home, name), 'wb') as f:
+                f.write(b'x')
+        old = os.stat(home).st_mtime - 60
+        os.utime(home, (old, old))
+
+        start_result, _ = server_manager.start_server()
+        assert start_result is True
+        ftp = ftplib.FTP()
+        try:
+            ftp.connect("127.0.0.1", 2121)
+            ftp.login("test_user", "password123")
+            for _ in range(2):  # 第一次扫描，第二次命中缓存
+                lines = []
+                ftp.retrlines("LIST", lines.append)
+                assert [line.split()[-1] for line in lines] == sorted(names)
+                assert [name for name, _ in ftp.mlsd()] == sorted(names)
+                assert ftp.nlst() == sorted(names)
+            assert server_manager.listing_cache.stats()["hits"] >= 1
+        finally:
+            ftp.close()
+            server_manager.stop_server()
+
+    def test_upload_ingest(self, server_manager, temp_dir):
+        """测试上传完成后在后台生成校验和文件，管线饱和时拒绝新的上传"""
+        import io
+        import ftplib
+        import time
+        home = os.path.join(temp_dir, 'ftp_files', 'test_user')
+        server_manager.users[0]["permissions"] = "elrw"
+        server_manager.config["ingest"] = {"enabled": True, "stages": ["checksum"]}
+        start_result, _ = server_manager.start_server()
+        assert start_result is True
+        ftp = ftplib.FTP()
+        try:
+            ftp.connect("127.0.0.1", 2121)
+            ftp.login("test_user", "password123")
+            ftp.storbinary("STOR up.bin", io.BytesIO(b'z' * 1000))
+            sidecar = os.path.join(home, 'up.bin.sha256')
+            for _ in range(50):
+                if os.path.exists(sidecar):
+                    break
+                time.sleep(0.05)
+            assert os.path.exists(sidecar)
+
+            server_manager.ingest.pending = server_manager.ingest.max_pending
+            with pytest.raises(ftplib.error_temp, match="450"):
+                ftp.storbinary("STOR again.bin", io.BytesIO(b'z'))
+            server_manager.ingest.pending = 0
+        finally:
+            ftp.close()
+            server_manager.stop_server()
+
+    def test_resumable_upload(self, server_manager, temp_dir):
+        """测试中断的上传被记录到续传索引，REST续传完成后记录被删除"""
+        import io
+        import zlib
+        import ftplib
+        import time
+        home = os.path.join(temp_dir, 'ftp_files', 'test_user')
+        path = os.path.join(home, 'big.bin')
+        # 续传默认关闭；开启后max_age默认为0，不启动删除部分文件的清理线程
+        assert server_manager.config_manager.get_resume_config()["enabled"] is False
+        server_manager.config["resume"] = {"enabled": True}
+        server_manager.users[0]["permissions"] = "elrw"
+        start_result, _ = server_manager.start_server()
+        assert start_result is True
+        assert server_manager.resume_janitor is None
+        index = server_manager.resume_index
+        ftp = ftplib.FTP()
+        try:
+            ftp.connect("127.0.0.1", 2121)
+            ftp.login("test_user", "password123")
+            ftp.voidcmd("TYPE I")
+            conn = ftp.transfercmd("STOR big.bin")
+            conn.sendall(b'a' * 50000)
+            for _ in range(50):
+                if os.path.exists(path) and os.path.getsize(path) == 50000:
+                    break
+                time.sleep(0.05)
+            if ftp.abort().startswith("426"):
+                ftp.getresp()  # 426之后还有ABOR命令本身的226回复
+            conn.close()
+            for _ in range(50):
+                if index.get("test_user", path):
+                    break
+                time.sleep(0.05)
+            entry = index.get("test_user", path)
+            assert entry["size"] == 50000
+            assert entry["crc"] == zlib.crc32(b'a' * 50000)
+
+            ftp.storbinary("STOR big.bin", io.BytesIO(b'b' * 1000), rest=50000)
+            assert os.path.getsize(path) == 51000
+            for _ in range(50):
+                if index.get("test_user", path) is None:
+                    break
+                time.sleep(0.05)
+            assert index.get("test_user", path) is None
+        finally:
+            ftp.close()
+            server_manager.stop_server()
+
+    def test_ftps_session_reuse(self, server_manager, temp_dir):
+        """测试FTPS: 加密的上传/下载，数据连接恢复控制连接的TLS会话"""
+        pytest.importorskip("OpenSSL")
+        import io
+        import ssl
+        import ftplib
+        import time
+        from ftps import generate_self_signed_cert
+
+        class ReusingFTP_TLS(ftplib.FTP_TLS):
+            """数据连接恢复控制连接TLS会话的客户端（ftplib默认不恢复）"""
+            def ntransfercmd(self, cmd, rest=None):
+                conn, size = ftplib.FTP.ntransfercmd(self, cmd, rest)
+                if self._prot_p:
+                    conn = self.context.wrap_socket(conn, server_hostname=self.host,
+                                                    session=self.sock.session)
+                return conn, size
+
+        certfile = os.path.join(temp_dir, 'config', 'cert.pem')
+        keyfile = os.path.join(temp_dir, 'config', 'key.pem')
+        generate_self_signed_cert(certfile, keyfile, "127.0.0.1")
+        server_manager.config["tls"] = {"enabled": True, "certfile": certfile, "keyfile": keyfile,
+                                        "control_required": True, "require_session_reuse": True}
+        server_manager.users[0]["permissions"] = "elrw"
+        start_result, _ = server_manager.start_server()
+        assert start_result is True
+        context = ssl.create_default_context(cafile=certfile)
+        try:
+            plain = ftplib.FTP()
+            plain.connect("127.0.0.1", 2121)
+            with pytest.raises(ftplib.error_perm, match="550"):
+                plain.login("test_user", "password123")
+            plain.close()
+
+            ftp = ReusingFTP_TLS(context=context)
+            ftp.connect("127.0.0.1", 2121)
+            ftp.login("test_user", "password123")
+            ftp.prot_p()
+            ftp.storbinary("STOR secret.bin", io.BytesIO(b's' * 200000))
+            data = io.BytesIO()
+            ftp.retrbinary("RETR secret.bin", data.write)
+            assert data.getvalue() == b's' * 200000
+            ftp.quit()
+
+            # 不恢复会话的客户端打开的数据连接被拒绝
+            ftp = ftplib.FTP_TLS(context=context)
+            ftp.connect("127.0.0.1", 2121)
+            ftp.login("test_user", "password123")
+            ftp.prot_p()
+            with pytest.raises((ftplib.error_perm, OSError)):
+                ftp.retrbinary("RETR secret.bin", io.BytesIO().write)
+            ftp.close()
+
+            for _ in range(50):
+                handshakes = server_manager.get_metrics()["tls_handshakes"]
+                if handshakes.get(("data", "full")):
+                    break
+                time.sleep(0.05)
+            assert handshakes[("control", "full")] == 2
+            assert handshakes[("data", "resumed")] == 2
+            assert handshakes[("data", "full")] == 1
+        finally:
+            server_manager.stop_server()
+
+        server_manager.config["tls"] = {"enabled": True, "certfile": ""}
+        assert any("certfile" in e for e in server_manager.config_manager.validate_config())
+        start_result, error_msg = server_manager.start_server()
+        assert start_result is False
+        assert "certfile" in error_msg
+
+    def test_transfer_config(self, server_manager):
+        """测试传输调优配置的默认值和验证"""
+        transfer = server_manager.config_manager.get_transfer_config()
+        assert transfer["use_sendfile"] is True
+        assert transfer["write_size"] == 65536
+        
+        server_manager.config["transfer"] = {"read_size": 100, "so_sndbuf": -1}
+        errors = server_manager.config_manager.validate_config()
+        assert any("read_size" in e for e in errors)
+        assert any("so_sndbuf" in e for e in errors)
+        
+    def test_socket_buffers_before_connect(self, server_manager, temp_dir):
+        """测试套接字缓冲区在被动监听listen()之前设置，主动模式的传输同样正常"""
+        import time
+        import socket
+        import ftplib
+        with open(os.path.join(temp_dir, 'ftp_files', 'test_user', 'data.bin'), 'wb') as f:
+            f.write(b'x' * 100000)
+        server_manager.config["transfer"] = {"so_rcvbuf": 262144, "so_sndbuf": 262144}
+        start_result, _ = server_manager.start_server()
+        assert start_result is True
+        ftp = ftplib.FTP()
+        try:
+            ftp.connect("127.0.0.1", 2121)
+            ftp.login("test_user", "password123")
+            ftp.makepasv()
+            session = server_manager.sessions.sessions()[0]
+            # 227回复在被动监听创建完成之前就已发出
+            deadline = time.time() + 2
+            while time.time() < deadline and session._dtp_acceptor is None:
+                time.sleep(0.01)
+            listener = session._dtp_acceptor.socket
+            # Linux返回设置值的两倍
+            assert listener.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) >= 262144
+            assert listener.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF) >= 262144
+            ftp.set_pasv(False)
+            chunks = []
+            ftp.retrbinary("RETR data.bin", chunks.append)
+            assert sum(map(len, chunks)) == 100000
+            ftp.quit()
+        finally:
+            ftp.close()
+            server_manager.stop_server()
+
+    def test_login_does_not_block_io_loop(self, server_manager, monkeypatch):
+        """测试密码在线程池中校验: 校验较慢时其他会话照常响应，紧跟PASS的命令在校验后处理"""
+        import time
+        import socket
+        import ftplib
+        import threading
+        import authorizer as authorizer_module
+        original = authorizer_module.verify_password
+
+        def slow_verify(password, stored):
+            if password == "slow":
+                time.sleep(1)
+            return original(password, stored)
+
+        monkeypatch.setattr(authorizer_module, "verify_password", slow_verify)
+        start_result, _ = server_manager.start_server()
+        assert start_result is True
+        server_manager.server.handler.auth_failed_timeout = 0
+        active, slow = ftplib.FTP(), ftplib.FTP()
+        try:
+            active.connect("127.0.0.1", 2121)
+            active.login("test_user", "password123")
+            slow.connect("127.0.0.1", 2121)
+            errors = []
+            login = threading.Thread(target=lambda: errors.append(
+                pytest.raises(ftplib.error_perm, slow.login, "test_user", "slow")))
+            login.start()
+            time.sleep(0.2)
+            started = time.time()
+            active.voidcmd("NOOP")
+            assert time.time() - started < 0.5
+            login.join(5)
+            assert len(errors) == 1
+
+            # 同一次发送的PASS和PWD: PWD等到登录成功后才处理
+            with socket.create_connection(("127.0.0.1", 2121), timeout=5) as sock:
+                stream = sock.makefile("rb")
+                assert stream.readline().startswith(b"220")
+                sock.sendall(b"USER test_user\r\nPASS password123\r\nPWD\r\n")
+                replies = [stream.readline()[:3] for _ in range(3)]
+                assert replies == [b"331", b"230", b"257"]
+        finally:
+            active.close()
+            slow.close()
+            server_manager.stop_server()
+
+    def test_live_user_changes(self, server_manager, temp_dir):
+        """测试服务器运行期间用户的增删改会同步到认证器"""
+        start_result, _ = server_manager.start_server()
+        assert start_result is True
+        try:
+            authorizer = server_manager.authorizer
+            user_dir = os.path.join(temp_dir, 'ftp_files', 'live_user')
+            result, _ = server_manager.add_user("live_user", "pw", user_dir, "elr")
+            assert result is True
+            assert authorizer.has_user("live_user")
+            
+            assert server_manager.update_user("live_user", new_permissions="elrw") is True
+            assert authorizer.get_perms("live_user") == "elrw"
+            
+            assert server_manager.remove_user("live_user") is True
+            assert not authorizer.has_user("live_user")
+        finally:
+            server_manager.stop_server()
+
+    def test_sqlite_user_store(self, server_manager, temp_dir):
+        """测试sqlite用户存储：从users.json迁移，登录时按需读取，运行期间的修改立即生效"""
+        import ftplib
+        server_manager.config["user_store"] = {"backend": "sqlite", "path": ""}
+        server_manager.open_user_store()
+        assert os.path.exists(os.path.join(temp_dir, 'config', 'users.db'))
+        assert server_manager.count_users() == 1
+        assert server_manager.get_user("test_user")["permissions"] == "elr"
+
+        start_result, _ = server_manager.start_server()
+        assert start_result is True
+        try:
+            ftp = ftplib.FTP()
+            ftp.connect("127.0.0.1", 2121)
+            ftp.login("test_user", "password123")
+            ftp.quit()
+
+            user_dir = os.path.join(temp_dir, 'ftp_files', 'sql_user')
+            result, _ = server_manager.add_user("sql_user", "pw", user_dir, "elr")
+            assert result is True
+            assert server_manager.authorizer.has_user("sql_user")
+            assert [u["username"] for u in server_manager.get_users_page(0, 10)] == ["sql_user", "test_user"]
+
+            assert server_manager.remove_user("sql_user") is True
+            assert not server_manager.authorizer.has_user("sql_user")
+        finally:
+            server_manager.stop_server()
+            server_manager.user_store.close()
+
+    def test_config_hot_reload(self, server_manager):
+        """测试运行期间重新加载配置文件"""
+        start_result, _ = server_manager.start_server()
+        assert start_result is True
+        try:
+            config_path = server_manager.config_manager.config_path
+            with open(config_path) as f:
+                settings = json.load(f)
+            settings["max_conn_per_ip"] = 2
+            settings["passive_ports"] = "61000-61009"
+            with open(config_path, 'w') as f:
+                json.dump(settings, f)
+                
+            server_manager.load_config()
+            assert server_manager.server.max_cons_per_ip == 2
+            assert list(server_manager.server.handler.passive_ports) == list(range(61000, 61010))
+        finally:
+            server_manager.stop_server()
+        
+    def test_unknown_engine(self, server_manager):
+        """测试未知服务引擎时启动失败"""
+        server_manager.config["engine"] = "bogus"
+        start_result, error_msg = server_manager.start_server()
+        assert start_result is False
+        assert "bogus" in error_msg
+        assert server_manager.running is False
+
+
+def test_headless_entry_does_not_import_tkinter():
+    """测试无界面入口不会导入tkinter和gui模块"""
+    import subprocess
+    code = "import sys, ftpserver, cli; print('tkinter' in sys.modules or 'gui' in sys.modules)"
+    project_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    out = subprocess.run([sys.executable, "-c", code], cwd=project_dir,
+                         capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "False"
 
 
 if __name__ == "__main__":
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import socket
+import tempfile
+import threading
+import pytest
+
+# 添加项目根目录到路径，以便引入模块
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import handover
+from handover import HandoverError, HandoverListener, confirm, request_listeners
+from listeners import create_listener
+
+pytestmark = pytest.mark.skipif(not handover.is_supported(), reason="平台不支持传递文件描述符")
+
+
+class TestHandover:
+    """监听套接字交接测试类"""
+
+    @pytest.fixture
+    def path(self):
+        temp_path = tempfile.mkdtemp()
+        yield os.path.join(temp_path, "ftp.sock")
+        for name in os.listdir(temp_path):
+            os.unlink(os.path.join(temp_path, name))
+        os.rmdir(temp_path)
+
+    def test_handover(self, path):
+        """测试收到的套接字与原套接字监听同一个端口，新进程确认后才回调"""
+        original = create_listener("127.0.0.1", 0)
+        handed = []
+        called = threading.Event()
+        listener = HandoverListener(path, lambda: [original],
+                                    lambda pid: (handed.append(pid), called.set()), timeout=5)
+        listener.start()
+        try:
+            assert oct(os.stat(path).st_mode & 0o777) == "0o600"
+            # 新进程启动失败时旧进程继续等待下一次交接
+            conn, sockets, pid = request_listeners(path, timeout=5)
+            assert pid == os.getpid()
+            for sock in sockets:
+                sock.close()
+            confirm(conn, False)
+
+            conn, sockets, _ = request_listeners(path, timeout=5)
+            assert len(sockets) == 1
+            assert sockets[0].getsockname() == original.getsockname()
+            assert sockets[0].fileno() != original.fileno()
+            assert not called.is_set()
+            confirm(conn, True)
+            assert called.wait(5)
+            assert handed == [os.getpid()]
+            # 原套接字关闭后收到的套接字仍在监听
+            original.close()
+            with socket.create_connection(sockets[0].getsockname(), timeout=2):
+                pass
+            sockets[0].close()
+        finally:
+            original.close()
+            listener.stop()
+        assert not os.path.exists(path)
+
+    def test_nothing_to_hand_over(self, path):
+        """测试服务器不能交接时新进程收到错误"""
+        listener = HandoverListener(path, lambda: [], lambda pid: None, timeout=5)
+        listener.start()
+        try:
+            with pytest.raises(HandoverError):
+                request_listeners(path, timeout=5)
+        finally:
+            listener.stop()
+
+    def test_stop_keeps_successor_socket(self, path):
+        """测试停止时不删除接手的进程在同一路径上创建的套接字文件"""
+        first = HandoverListener(path, lambda: [], lambda pid: None)
+        first.start()
+        second = HandoverListener(path, lambda: [], lambda pid: None)
+        second.start()
+        first.stop()
+        assert os.path.exists(path)
+        second.stop()
+        assert not os.path.exists(path)
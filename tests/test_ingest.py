@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import gzip
+import time
+import hashlib
+import threading
+import pytest
+
+# 添加项目根目录到路径，以便引入模块
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import ingest
+from ingest import UploadPipeline, run_stages
+
+
+def _upload(tmp_path, name="data.bin", content=b"hello world"):
+    path = tmp_path / name
+    path.write_bytes(content)
+    return str(path)
+
+
+def _wait_idle(pipeline):
+    for _ in range(100):
+        if pipeline.pending == 0:
+            return
+        time.sleep(0.02)
+    raise AssertionError("上传处理管线没有在预期时间内完成")
+
+
+class TestStages:
+    """上传处理阶段测试类"""
+
+    def _job(self, tmp_path, path):
+        return {"path": path, "user": "u", "root": str(tmp_path), "sidecars": []}
+
+    def test_checksum_sidecar(self, tmp_path):
+        """测试SHA-256旁路文件的内容"""
+        path = _upload(tmp_path)
+        job = run_stages(self._job(tmp_path, path), ["checksum"], {})
+        expected = hashlib.sha256(b"hello world").hexdigest()
+        assert job["sha256"] == expected
+        with open(path + ".sha256") as f:
+            assert f.read() == f"{expected}  data.bin\n"
+
+    def test_all_stages(self, tmp_path):
+        """测试校验和、分片移动和压缩依次执行"""
+        path = _upload(tmp_path)
+        options = {"shard_dir": "store", "shard_depth": 2}
+        job = run_stages(self._job(tmp_path, path), ["checksum", "shard", "compress"], options)
+        digest = hashlib.sha256(b"hello world").hexdigest()
+        shard = os.path.join(str(tmp_path), "store", digest[:2], digest[2:4])
+        assert job["path"] == os.path.join(shard, "data.bin.gz")
+        assert not os.path.exists(path)
+        assert os.path.exists(os.path.join(shard, "data.bin.sha256"))
+        with gzip.open(job["path"]) as f:
+            assert f.read() == b"hello world"
+
+
+class TestUploadPipeline:
+    """上传处理管线测试类"""
+
+    def test_unknown_stage(self):
+        """测试未知阶段名称时创建失败"""
+        with pytest.raises(ValueError):
+            UploadPipeline(["bogus"])
+
+    def test_submit_and_stats(self, tmp_path):
+        """测试提交的文件在池中处理，统计完成和失败的数量"""
+        pipeline = UploadPipeline(["checksum"], workers=2)
+        try:
+            pipeline.submit(_upload(tmp_path, "a"), "u", str(tmp_path))
+            pipeline.submit(str(tmp_path / "missing"), "u", str(tmp_path))
+            _wait_idle(pipeline)
+            stats = pipeline.stats()
+            assert stats["completed"] == 1 and stats["failed"] == 1
+            assert os.path.exists(str(tmp_path / "a.sha256"))
+        finally:
+            pipeline.close()
+
+    def test_saturation(self, tmp_path, monkeypatch):
+        """测试待处理文件达到上限时饱和，处理完成后恢复"""
+        release = threading.Event()
+
+        def slow_stage(job, options):
+            release.wait(5)
+            return job
+
+        monkeypatch.setitem(ingest.STAGES, "slow", slow_stage)
+        pipeline = UploadPipeline(["slow"], workers=1, max_pending=2)
+        try:
+            pipeline.submit(_upload(tmp_path, "a"), "u", str(tmp_path))
+            assert not pipeline.saturated
+            pipeline.submit(_upload(tmp_path, "b"), "u", str(tmp_path))
+            assert pipeline.saturated
+            # 已经完成的上传在饱和时仍然被接受
+            pipeline.submit(_upload(tmp_path, "c"), "u", str(tmp_path))
+            assert pipeline.pending == 3
+            release.set()
+            _wait_idle(pipeline)
+            assert not pipeline.saturated
+            assert pipeline.stats()["completed"] == 3
+        finally:
+            release.set()
+            pipeline.close()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import socket
+import pytest
+
+# 添加项目根目录到路径，以便引入模块
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from listeners import (ListenerGroup, bind_addresses, create_listener, has_reuse_port,
+                       open_listeners, split_port_range)
+from handlers import ManagedFTPHandler
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class TestListeners:
+    """监听套接字测试类"""
+
+    def test_bind_addresses(self):
+        """测试监听地址去重并去掉IPv6地址的方括号"""
+        assert bind_addresses("0.0.0.0", ["[::]", "0.0.0.0", " ::1 "]) == ["0.0.0.0", "::", "::1"]
+        assert bind_addresses("127.0.0.1") == ["127.0.0.1"]
+
+    def test_split_port_range(self):
+        """测试被动端口范围按进程平分为互不重叠的连续区间"""
+        slices = split_port_range(range(60000, 60011), 3)
+        assert [len(s) for s in slices] == [4, 4, 3]
+        assert [p for s in slices for p in s] == list(range(60000, 60011))
+        assert split_port_range(None, 2) == [None, None]
+        with pytest.raises(ValueError):
+            split_port_range(range(60000, 60002), 3)
+
+    @pytest.mark.skipif(not socket.has_ipv6, reason="系统不支持IPv6")
+    def test_dual_stack_listener(self):
+        """测试 "::" 以双栈方式监听，IPv4客户端也可以连接"""
+        try:
+            sock = create_listener("::", 0)
+        except OSError:
+            pytest.skip("无法绑定IPv6地址")
+        try:
+            port = sock.getsockname()[1]
+            with socket.create_connection(("127.0.0.1", port), timeout=2):
+                pass
+            with socket.create_connection(("::1", port), timeout=2):
+                pass
+        finally:
+            sock.close()
+
+    @pytest.mark.skipif(not has_reuse_port(), reason="平台不支持SO_REUSEPORT")
+    def test_reuse_port(self):
+        """测试设置了SO_REUSEPORT的套接字可以绑定同一个端口，未设置时不行"""
+        port = _free_port()
+        first = create_listener("127.0.0.1", port, reuse_port=True)
+        second = create_listener("127.0.0.1", port, reuse_port=True)
+        try:
+            with pytest.raises(OSError):
+                create_listener("127.0.0.1", port)
+        finally:
+            first.close()
+            second.close()
+
+    def test_open_listeners_cleans_up(self):
+        """测试某个地址绑定失败时已创建的套接字被关闭"""
+        port = _free_port()
+        blocker = create_listener("127.0.0.1", port)
+        try:
+            with pytest.raises(OSError):
+                open_listeners(["127.0.0.2", "127.0.0.1"], port)
+            # 127.0.0.2 上的套接字已经关闭，可以再次绑定
+            create_listener("127.0.0.2", port).close()
+        finally:
+            blocker.close()
+
+    def test_listener_group(self):
+        """测试多个监听套接字共用一个IO循环"""
+        handler = type("FTPHandler", (ManagedFTPHandler,), {})
+        group = ListenerGroup(open_listeners(["127.0.0.1", "127.0.0.2"], 0), handler)
+        try:
+            assert len(group.servers) == 2
+            assert all(server.ioloop is group.ioloop for server in group.servers)
+            assert [address[0] for address in group.addresses] == ["127.0.0.1", "127.0.0.2"]
+            group.max_cons = 10
+            group.max_cons_per_ip = 2
+            assert [server.max_cons for server in group.servers] == [10, 10]
+            assert group.max_cons_per_ip == 2
+            assert group.handler is handler
+        finally:
+            group.close_all()
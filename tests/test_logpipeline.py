@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import queue
+import logging
+import pytest
+import tempfile
+import shutil
+
+# 添加项目根目录到路径，以便引入模块
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from logpipeline import BatchingQueueListener, DroppingQueueHandler, RotatingLogFileHandler
+
+
+class TestLogPipeline:
+    """非阻塞日志管线测试类"""
+
+    @pytest.fixture
+    def temp_dir(self):
+        """创建临时目录"""
+        temp_path = tempfile.mkdtemp()
+        yield temp_path
+        shutil.rmtree(temp_path)
+
+    def _record(self, msg):
+        return logging.LogRecord("test", logging.INFO, __file__, 0, msg, None, None)
+
+    def test_queue_overflow_is_counted(self):
+        """测试队列已满时丢弃记录并计数，而不是阻塞"""
+        handler = DroppingQueueHandler(queue.Queue(maxsize=2))
+        for i in range(5):
+            handler.emit(self._record(f"line {i}"))
+        assert handler.queue.qsize() == 2
+        assert handler.dropped == 3
+
+    def test_listener_writes_batches(self, temp_dir):
+        """测试后台线程写入所有记录并在停止前清空队列"""
+        log_file = os.path.join(temp_dir, "test.log")
+        file_handler = RotatingLogFileHandler(log_file)
+        file_handler.setFormatter(logging.Formatter("%(message)s"))
+        log_queue = queue.Queue()
+        listener = BatchingQueueListener(log_queue, [file_handler], batch_size=10)
+        listener.start()
+        for i in range(100):
+            log_queue.put(self._record(f"line {i}"))
+        listener.stop()
+        file_handler.close()
+        with open(log_file, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        assert lines == [f"line {i}" for i in range(100)]
+
+    def test_size_and_time_rotation(self, temp_dir):
+        """测试按大小和按时间轮转"""
+        log_file = os.path.join(temp_dir, "test.log")
+        handler = RotatingLogFileHandler(log_file, max_bytes=100, backup_count=2,
+                                         rotate_interval=3600)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        for i in range(10):
+            handler.handle(self._record("x" * 40))
+        assert os.path.exists(log_file + ".1")
+        assert os.path.exists(log_file + ".2")
+        assert not os.path.exists(log_file + ".3")
+
+        # 模拟到达轮转时间
+        os.remove(log_file + ".2")
+        handler.rollover_at = 0
+        handler.handle(self._record("y"))
+        assert os.path.exists(log_file + ".2")
+        with open(log_file, encoding="utf-8") as f:
+            assert f.read() == "y\n"
+        handler.close()
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import pytest
+
+# 添加项目根目录到路径，以便引入模块
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from logtail import make_entry
+from logsearch import LogIndex, highlight_segments, parse_time_bound, time_key
+
+
+def entry(n, message, level="INFO", minute=0):
+    return make_entry(f"2024-01-01 12:{minute:02d}:{n % 60:02d},000", "FTPServer.Test", level, message)
+
+
+def texts(page):
+    return [text.split(" - ", 3)[3].strip() for _, _, text in page.entries]
+
+
+class TestLogIndex:
+    """日志搜索索引测试类"""
+
+    @pytest.fixture
+    def index(self):
+        index = LogIndex()
+        index.add([
+            entry(1, "用户 alice 登录成功"),
+            entry(2, "Connection refused from 10.0.0.5", "ERROR"),
+            entry(3, "用户 bob 登录失败", "WARNING", minute=5),
+            entry(4, "uploadfile done: report.csv", minute=10),
+        ])
+        return index
+
+    def test_substring_search(self, index):
+        """测试不区分大小写的子串搜索，查询两端可以是词的一部分"""
+        assert texts(index.search("alice")) == ["用户 alice 登录成功"]
+        assert texts(index.search("CONNECTION REF")) == ["Connection refused from 10.0.0.5"]
+        assert texts(index.search("load")) == ["uploadfile done: report.csv"]
+        assert texts(index.search("登录")) == ["用户 alice 登录成功", "用户 bob 登录失败"]
+        assert texts(index.search("0.0.5")) == ["Connection refused from 10.0.0.5"]
+        # 每个词都存在，但不是连续的子串
+        assert texts(index.search("alice 失败")) == []
+        assert len(index.search().entries) == 4
+
+    def test_level_and_time_filters(self, index):
+        """测试按级别和时间范围过滤"""
+        assert texts(index.search(level="ERROR")) == ["Connection refused from 10.0.0.5"]
+        assert texts(index.search("登录", level="WARNING")) == ["用户 bob 登录失败"]
+        since = parse_time_bound("2024-01-01 12:05")
+        until = parse_time_bound("2024-01-01 12:05", end=True)
+        assert texts(index.search(since=since, until=until)) == ["用户 bob 登录失败"]
+        assert texts(index.search(since=since)) == ["用户 bob 登录失败", "uploadfile done: report.csv"]
+
+    def test_paging(self):
+        """测试从新到旧分页，翻页不受单页条数限制"""
+        index = LogIndex()
+        index.add([entry(i, f"transfer {i}") for i in range(1200)])
+        pages = []
+        before = None
+        while True:
+            page = index.search("transfer", before=before, limit=500)
+            pages.append(len(page.entries))
+            if not page.has_more:
+                break
+            before = page.older
+        assert pages == [500, 500, 200]
+        first = index.search("transfer", limit=500)
+        assert texts(first)[-1] == "transfer 1199"
+        # 只取某个编号之后的新日志
+        assert texts(index.search("transfer", after=1197)) == ["transfer 1198", "transfer 1199"]
+
+    def test_eviction(self):
+        """测试超出容量时丢弃最旧的日志"""
+        index = LogIndex(max_entries=100)
+        index.add([entry(i, f"old{i}") for i in range(100)])
+        index.add([entry(i, f"new{i}") for i in range(30)])
+        assert len(index) == 100
+        assert texts(index.search("old0")) == []
+        assert texts(index.search("old99")) == ["old99"]
+        assert len(index.search("new").entries) == 30
+
+    def test_continuation_lines(self):
+        """测试之后追加到上一条日志的续行（异常堆栈）也能被搜索到"""
+        index = LogIndex()
+        last = entry(1, "Traceback (most recent call last):", "ERROR")
+        index.add([last])
+        last["message"] += "\nValueError: broken"
+        last["text"] += "ValueError: broken\n"
+        index.add([entry(2, "next")])
+        assert len(index.search("ValueError").entries) == 1
+
+    def test_large_index(self):
+        """测试大量日志时常见词和罕见词的搜索都很快"""
+        index = LogIndex()
+        batch = []
+        for i in range(200000):
+            batch.append(entry(i, f"user{i % 5000} downloaded file{i}.bin", "ERROR" if i % 10000 == 0 else "INFO"))
+        index.add(batch)
+        started = time.perf_counter()
+        for query, level in (("downloaded", "ALL"), ("file123456.bin", "ALL"), ("", "ERROR"), ("user42 ", "ALL")):
+            index.search(query, level)
+        assert time.perf_counter() - started < 0.5
+        assert texts(index.search("file123456.bin")) == ["user3456 downloaded file123456.bin"]
+        assert len(index.search(level="ERROR").entries) == 20
+
+
+def test_highlight_segments():
+    """测试按匹配位置切分文本（不区分大小写，保留原文大小写）"""
+    assert highlight_segments("Error: error!", "ERROR") == [("Error", True), (": ", False), ("error", True),
+                                                          ("!", False)]
+    assert highlight_segments("abc", "") == [("abc", False)]
+
+
+def test_parse_time_bound():
+    """测试时间条件的解析"""
+    assert parse_time_bound("") is None
+    assert parse_time_bound("2024-01-01") == time_key("2024-01-01 00:00:00,000")
+    assert parse_time_bound("2024-01-01", end=True) == time_key("2024-01-01 23:59:59,999")
+    today = time.strptime("2024-02-03", "%Y-%m-%d")
+    assert parse_time_bound("08:30", end=True, today=today) == time_key("2024-02-03 08:30:59,999")
+    with pytest.raises(ValueError):
+        parse_time_bound("yesterday")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import pytest
+import tempfile
+import shutil
+
+# 添加项目根目录到路径，以便引入模块
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from logtail import LogTailer
+
+
+def log_line(n, level="INFO"):
+    return f"2024-01-01 12:00:{n % 60:02d},000 - FTPServer.Config - {level} - message {n}\n"
+
+
+class TestLogTailer:
+    """增量日志读取器测试类"""
+
+    @pytest.fixture
+    def log_file(self):
+        """创建临时日志文件路径"""
+        temp_path = tempfile.mkdtemp()
+        yield os.path.join(temp_path, "ftp_server.log")
+        shutil.rmtree(temp_path)
+
+    def _append(self, path, text):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(text)
+
+    def test_reads_only_appended_lines(self, log_file):
+        """测试每次只解析新追加的日志"""
+        self._append(log_file, log_line(1) + log_line(2))
+        tailer = LogTailer(log_file)
+        entries, reset = tailer.poll()
+        assert [e["message"] for e in entries] == ["message 1", "message 2"]
+        assert reset is False
+        assert entries[0]["logger"] == "FTPServer.Config"
+
+        assert tailer.poll() == ([], False)
+
+        self._append(log_file, log_line(3, "ERROR"))
+        entries, _ = tailer.poll()
+        assert [(e["level"], e["message"]) for e in entries] == [("ERROR", "message 3")]
+
+    def test_partial_and_continuation_lines(self, log_file):
+        """测试未写完的行和多行日志（异常堆栈）"""
+        line = log_line(1)
+        self._append(log_file, line[:20])
+        tailer = LogTailer(log_file)
+        assert tailer.poll() == ([], False)
+
+        self._append(log_file, line[20:] + "Traceback (most recent call last):\n")
+        entries, _ = tailer.poll()
+        assert len(entries) == 1
+        assert entries[0]["message"] == "message 1\nTraceback (most recent call last):"
+
+    def test_truncation_and_rotation(self, log_file):
+        """测试日志文件被截断或轮转后重新从头读取"""
+        self._append(log_file, log_line(1) + log_line(2))
+        tailer = LogTailer(log_file)
+        tailer.poll()
+
+        # 截断
+        with open(log_file, "w", encoding="utf-8") as f:
+            f.write(log_line(3))
+        entries, reset = tailer.poll()
+        assert reset is True
+        assert [e["message"] for e in entries] == ["message 3"]
+
+        # 轮转: 旧文件中未读取的内容也不会丢失
+        self._append(log_file, log_line(4))
+        os.rename(log_file, log_file + ".1")
+        self._append(log_file, log_line(5))
+        entries, reset = tailer.poll()
+        assert reset is True
+        assert [e["message"] for e in entries] == ["message 4", "message 5"]
+
+    def test_ring_buffer_and_initial_tail(self, log_file):
+        """测试环形缓冲区容量限制，以及首次打开时只读取文件末尾"""
+        self._append(log_file, "".join(log_line(i) for i in range(1000)))
+        tailer = LogTailer(log_file, max_entries=50, initial_bytes=2000)
+        entries, _ = tailer.poll()
+        assert entries[-1]["message"] == "message 999"
+        assert len(entries) < 1000
+        assert len(tailer.entries) <= 50
+        # 从文件中间开始读取时，第一行不完整，应当被跳过
+        assert all(e["message"].startswith("message ") for e in entries)
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import pytest
+import urllib.request
+
+# 添加项目根目录到路径，以便引入模块
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from metrics import Histogram, Metrics, MetricsHTTPServer
+
+
+class TestMetrics:
+    """服务器指标测试类"""
+
+    def test_histogram_buckets(self):
+        """测试直方图按桶上限计数"""
+        histogram = Histogram((1, 10))
+        for value in (0.5, 1, 5, 100):
+            histogram.observe(value)
+        assert histogram.counts == [2, 1, 1]
+        assert histogram.count == 4
+        assert histogram.total == pytest.approx(106.5)
+
+    def test_collect_and_render(self):
+        """测试Python接口和Prometheus文本格式"""
+        metrics = Metrics()
+        metrics.login(True)
+        metrics.login(False)
+        metrics.login(False)
+        metrics.command("RETR")
+        metrics.command("RETR")
+        metrics.data_transferred(sent=1000, received=10)
+        metrics.transfer(upload=False, completed=True, elapsed=0.2)
+        metrics.gauges.append(lambda: {"ftp_active_sessions": 3})
+
+        data = metrics.collect()
+        assert data["logins"] == {"success": 1, "failure": 2}
+        assert data["commands"] == {"RETR": 2}
+        assert data["transfers"] == {("download", "completed"): 1}
+        assert data["ftp_active_sessions"] == 3
+
+        text = metrics.render()
+        assert 'ftp_logins_total{result="failure"} 2' in text
+        assert 'ftp_commands_total{verb="RETR"} 2' in text
+        assert "ftp_bytes_sent_total 1000" in text
+        assert 'ftp_transfer_duration_seconds_bucket{direction="download",le="0.5"} 1' in text
+        assert 'ftp_transfer_duration_seconds_bucket{direction="download",le="0.1"} 0' in text
+        assert "ftp_active_sessions 3" in text
+
+    def test_drain_and_merge(self):
+        """测试工作进程的计数器增量被取出清零，并累加到主进程的指标中"""
+        worker = Metrics()
+        worker.login(True)
+        worker.command("STOR")
+        worker.data_transferred(sent=0, received=500)
+        worker.transfer(upload=True, completed=True, elapsed=0.2)
+        worker.tls_handshake("data", True)
+
+        parent = Metrics()
+        parent.command("STOR")
+        parent.merge(worker.drain())
+        parent.merge(worker.drain())  # 第二次取出的增量为0
+
+        data = parent.collect()
+        assert data["logins"] == {"success": 1, "failure": 0}
+        assert data["commands"] == {"STOR": 2}
+        assert data["bytes_received"] == 500
+        assert data["transfers"] == {("upload", "completed"): 1}
+        assert data["transfer_durations"]["upload"].count == 1
+        assert data["tls_handshakes"] == {("data", "resumed"): 1}
+        assert worker.collect()["commands"] == {}
+
+    def test_forward_to_parent(self):
+        """测试子进程按间隔发送增量，不会把fork前已有的累计值再发回主进程"""
+        import queue
+        child = Metrics()
+        child.login(True)  # fork()之前主进程中已有的累计值
+        channel = queue.Queue()
+        child.forward_to(channel, interval=3600)
+        child.command("LIST")
+        assert channel.empty()  # 还没到发送间隔
+        child.flush()
+
+        collected = Metrics()
+        channel.put(None)
+        collected.collect_from(channel).join(5)
+        data = collected.collect()
+        assert data["logins"] == {"success": 0, "failure": 0}
+        assert data["commands"] == {"LIST": 1}
+
+    def test_http_endpoint(self):
+        """测试本地HTTP指标端点"""
+        metrics = Metrics()
+        metrics.command("LIST")
+        endpoint = MetricsHTTPServer(metrics, "127.0.0.1", 0)
+        endpoint.start()
+        try:
+            url = f"http://127.0.0.1:{endpoint.port}/metrics"
+            with urllib.request.urlopen(url, timeout=5) as response:
+                assert response.headers["Content-Type"].startswith("text/plain")
+                assert 'ftp_commands_total{verb="LIST"} 1' in response.read().decode("utf-8")
+        finally:
+            endpoint.stop()
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
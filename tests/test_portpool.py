@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+# 添加项目根目录到路径，以便引入模块
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from portpool import PassivePortPool
+
+
+class TestPassivePortPool:
+    """被动端口池测试类"""
+
+    def test_acquire_release(self):
+        """测试端口依次分配，归还的端口排到队尾"""
+        pool = PassivePortPool(range(60000, 60003))
+        assert [pool.acquire() for _ in range(3)] == [60000, 60001, 60002]
+        assert pool.acquire() is None
+        assert pool.release(60001) is True
+        assert pool.release(60001) is False  # 重复归还被忽略
+        assert pool.release(12345) is False  # 范围外的端口被忽略
+        assert pool.acquire() == 60001
+
+    def test_stats(self):
+        """测试占用数、峰值和端口用完的次数"""
+        pool = PassivePortPool(range(60000, 60002))
+        first = pool.acquire()
+        pool.acquire()
+        pool.acquire()
+        pool.release(first)
+        assert pool.stats() == {"size": 2, "in_use": 1, "peak": 2, "exhausted": 1}
+        assert pool.available == 1
+
+    def test_resize_keeps_used_ports(self):
+        """测试更换范围后，仍在使用且在新范围内的端口继续记为占用"""
+        pool = PassivePortPool(range(60000, 60004))
+        held = [pool.acquire() for _ in range(3)]
+        assert held == [60000, 60001, 60002]
+        pool.resize(range(60001, 60006))
+        assert pool.in_use == 2
+        assert sorted(pool.acquire() for _ in range(3)) == [60003, 60004, 60005]
+        assert pool.acquire() is None
+        # 旧范围中的端口归还时被忽略，新范围中的端口正常归还
+        assert pool.release(60000) is False
+        assert pool.release(60002) is True
+        assert pool.acquire() == 60002
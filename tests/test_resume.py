@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import zlib
+
+# 添加项目根目录到路径，以便引入模块
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from resume import ResumeIndex, ResumeJanitor
+
+
+def _interrupted_upload(index, path, data, user="u"):
+    """模拟一次中断的上传: 写入data后以未完成状态结束"""
+    state = index.begin(user, path, os.path.getsize(path) if os.path.exists(path) else 0)
+    with open(path, "ab") as f:
+        f.write(data)
+    state.update(data)
+    state.finish(False)
+    return state
+
+
+class TestResumeIndex:
+    """断点续传索引测试类"""
+
+    def test_resume_continues_checksum(self, tmp_path):
+        """测试从记录的大小续传时CRC32从记录值继续计算"""
+        index = ResumeIndex(str(tmp_path / "index.jsonl"))
+        path = str(tmp_path / "big.bin")
+        _interrupted_upload(index, path, b"a" * 1000)
+        entry = index.get("u", path)
+        assert entry["size"] == 1000
+        assert entry["crc"] == zlib.crc32(b"a" * 1000)
+
+        state = index.begin("u", path, 1000)
+        assert state.crc == entry["crc"]
+        with open(path, "ab") as f:
+            f.write(b"b" * 500)
+        state.update(b"b" * 500)
+        assert state.crc == zlib.crc32(b"a" * 1000 + b"b" * 500)
+        state.finish(True)
+        assert index.get("u", path) is None
+
+    def test_unknown_prefix(self, tmp_path):
+        """测试没有记录或偏移与记录不符时已有数据的校验和未知"""
+        index = ResumeIndex(str(tmp_path / "index.jsonl"))
+        path = str(tmp_path / "f.bin")
+        _interrupted_upload(index, path, b"x" * 10)
+        assert index.begin("u", path, 5).crc is None
+        assert index.begin("other", path, 10).crc is None
+        assert index.begin("u", path, 0).crc == 0
+
+    def test_persisted_and_shared(self, tmp_path):
+        """测试索引保存到磁盘，另一个实例（进程）能读到新追加的记录"""
+        index_path = str(tmp_path / "index.jsonl")
+        first = ResumeIndex(index_path)
+        second = ResumeIndex(index_path)
+        path = str(tmp_path / "f.bin")
+        _interrupted_upload(first, path, b"x" * 10)
+        assert second.get("u", path)["size"] == 10
+        _interrupted_upload(second, path, b"y" * 10)
+        assert first.get("u", path)["size"] == 20
+        assert ResumeIndex(index_path).get("u", path)["crc"] == zlib.crc32(b"x" * 10 + b"y" * 10)
+
+    def test_compact(self, tmp_path):
+        """测试压缩后只保留有效记录，其他实例重新读取"""
+        index_path = str(tmp_path / "index.jsonl")
+        index = ResumeIndex(index_path)
+        other = ResumeIndex(index_path)
+        path = str(tmp_path / "f.bin")
+        for _ in range(5):
+            _interrupted_upload(index, path, b"x")
+        index.discard("u", path)
+        _interrupted_upload(index, str(tmp_path / "g.bin"), b"z")
+        assert other.get("u", str(tmp_path / "g.bin"))["size"] == 1
+        assert index.compact(force=True) is True
+        with open(index_path) as f:
+            assert len(f.readlines()) == 1
+        assert len(other.entries()) == 1
+
+
+class TestResumeJanitor:
+    """部分上传文件清理测试类"""
+
+    def test_sweep(self, tmp_path):
+        """测试清理超时未续传的部分文件，被修改过的文件只移除记录"""
+        index = ResumeIndex(str(tmp_path / "index.jsonl"))
+        abandoned = str(tmp_path / "abandoned.bin")
+        changed = str(tmp_path / "changed.bin")
+        fresh = str(tmp_path / "fresh.bin")
+        for path in (abandoned, changed, fresh):
+            _interrupted_upload(index, path, b"x" * 10)
+        with open(changed, "ab") as f:
+            f.write(b"more")
+
+        janitor = ResumeJanitor(index, max_age=60)
+        later = time.time() + 120
+        # fresh.bin 在清理前刚刚续传过
+        state = index.begin("u", fresh, 10)
+        state.finish(False)
+        index._entries[("u", fresh)]["updated"] = later
+
+        assert janitor.sweep(now=later) == [abandoned]
+        assert not os.path.exists(abandoned)
+        assert os.path.exists(changed)
+        assert [key[1] for key, _ in index.entries()] == [fresh]
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import pytest
+
+# 添加项目根目录到路径，以便引入模块
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from throttle import TokenBucket, BandwidthLimiter, consume_all, lowest_rate
+
+
+class TestTokenBucket:
+    """令牌桶测试类"""
+
+    def test_unlimited(self):
+        """测试速率为0时从不需要暂停"""
+        bucket = TokenBucket(0)
+        assert bucket.consume(10 ** 9) == 0
+
+    def test_debt_is_shared_between_consumers(self):
+        """测试透支由后来的使用者分担，使并发会话轮流获得带宽"""
+        bucket = TokenBucket(1000, capacity=0)
+        first = bucket.consume(500)
+        second = bucket.consume(500)
+        assert first == pytest.approx(0.5, abs=0.05)
+        assert second == pytest.approx(1.0, abs=0.05)
+
+    def test_set_rate(self):
+        """测试修改速率后立即按新速率计算"""
+        bucket = TokenBucket(1000, capacity=0)
+        bucket.set_rate(0)
+        assert bucket.consume(10000) == 0
+        bucket.set_rate(10000, capacity=0)
+        assert bucket.consume(1000) == pytest.approx(0.1, abs=0.05)
+
+
+class TestBandwidthLimiter:
+    """全局和用户限速测试类"""
+
+    def test_user_and_global_buckets(self):
+        """测试会话同时受全局限速和用户限速约束"""
+        limiter = BandwidthLimiter(read_limit=0, write_limit=50000)
+        limiter.set_user_limits("alice", read_limit=1000, write_limit=0)
+        read_buckets, write_buckets = limiter.buckets_for("alice")
+        assert lowest_rate(read_buckets) == 1000
+        assert lowest_rate(write_buckets) == 50000
+        assert consume_all(read_buckets, 2000) > consume_all(write_buckets, 0)
+        assert limiter.get_user_limits("alice") == (1000, 0)
+
+    def test_runtime_changes_reach_existing_buckets(self):
+        """测试热加载的限速对已经取得令牌桶的传输立即生效"""
+        limiter = BandwidthLimiter()
+        read_buckets, write_buckets = limiter.buckets_for("bob")
+        assert lowest_rate(write_buckets) == 0
+
+        limiter.set_user_limits("bob", write_limit=2048)
+        limiter.configure(read_limit=4096)
+        assert lowest_rate(write_buckets) == 2048
+        assert lowest_rate(read_buckets) == 4096
+
+        limiter.remove_user("bob")
+        assert lowest_rate(write_buckets) == 0
+        assert limiter.get_user_limits("bob") == (0, 0)
+
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import pytest
+
+# 添加项目根目录到路径，以便引入模块
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from userindex import UserIndex
+
+
+def _user(name, directory):
+    return {"username": name, "directory": directory, "permissions": "elr"}
+
+
+class TestUserIndex:
+    """用户列表索引测试类"""
+
+    @pytest.fixture
+    def index(self):
+        return UserIndex([
+            _user("bob", "/srv/b"),
+            _user("Alice", "/srv/z"),
+            _user("alan", "/home/alan"),
+            _user("carol", "/srv/a"),
+        ])
+
+    def _names(self, query):
+        return [row[0] for row in query.rows(0, len(query))]
+
+    def test_sort_and_prefix(self, index):
+        """测试按列排序、降序以及不区分大小写的前缀过滤"""
+        assert self._names(index.query()) == ["alan", "Alice", "bob", "carol"]
+        assert self._names(index.query(descending=True)) == ["carol", "bob", "Alice", "alan"]
+        assert self._names(index.query("AL")) == ["alan", "Alice"]
+        assert self._names(index.query(sort="directory")) == ["alan", "carol", "bob", "Alice"]
+        assert self._names(index.query("/srv/", field="directory", sort="directory")) == ["carol", "bob", "Alice"]
+        # 按目录过滤、按用户名排序
+        assert self._names(index.query("/srv/", field="directory", sort="username",
+                                       descending=True)) == ["carol", "bob", "Alice"]
+        assert len(index.query("zzz")) == 0
+
+    def test_incremental_updates(self, index):
+        """测试增删改只更新对应的索引项"""
+        index.put(_user("bob", "/home/bob"))
+        index.put(_user("dave", "/srv/d"))
+        assert index.remove("alan") is True
+        assert index.remove("alan") is False
+        assert self._names(index.query()) == ["Alice", "bob", "carol", "dave"]
+        assert self._names(index.query("/home", field="directory")) == ["bob"]
+        assert index.get("bob") == ("bob", "/home/bob", "elr")
+
+    def test_rows_window(self, index):
+        """测试只取出可见区间的行，越界时截断"""
+        query = index.query()
+        assert [row[0] for row in query.rows(1, 2)] == ["Alice", "bob"]
+        assert [row[0] for row in query.rows(3, 10)] == ["carol"]
+        assert query[-1][0] == "carol"
+        with pytest.raises(IndexError):
+            query[4]
+
+    def test_large_index(self):
+        """测试10万个用户时的前缀查询不需要扫描全部用户"""
+        index = UserIndex(_user(f"user{i:06d}", f"/data/{i % 100:02d}/user{i:06d}") for i in range(100000))
+        started = time.perf_counter()
+        for _ in range(100):
+            query = index.query("user0999")
+        assert time.perf_counter() - started < 0.5
+        assert len(query) == 100
+        assert len(index.query("/data/07/", field="directory")) == 1000
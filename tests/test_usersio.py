@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import sys
+import json
+
+# 添加项目根目录到路径，以便引入模块
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import usersio
+from cli import main
+from server import FTPServerManager
+from authorizer import is_password_hash, verify_password
+
+
+def _manager(tmp_path, backend="json"):
+    config_dir = tmp_path / "config"
+    config_dir.mkdir(parents=True, exist_ok=True)
+    settings = {"port": 2121, "address": "127.0.0.1", "user_store": {"backend": backend, "path": ""}}
+    (config_dir / "settings.json").write_text(json.dumps(settings))
+    if not (config_dir / "users.json").exists():
+        (config_dir / "users.json").write_text("[]")
+    return FTPServerManager(str(config_dir / "settings.json"), str(config_dir / "users.json"))
+
+
+CSV_INPUT = """username,password,directory,permissions,read_limit,write_limit
+alice,secret,,elr,100,
+bob,hunter2,{bob_dir},,,
+,nopass,,,,
+carol,pw,,elrX,,
+dave,pw,,,-5,
+alice,again,,,,
+"""
+
+
+class TestImportUsers:
+    """批量导入用户测试类"""
+
+    def test_csv_import_validates_and_reports(self, tmp_path):
+        """测试CSV导入: 有效行分批写入，无效行带行号报告"""
+        manager = _manager(tmp_path)
+        home = tmp_path / "homes"
+        data = CSV_INPUT.format(bob_dir=tmp_path / "bob")
+        batches = []
+        report = usersio.import_users(manager, io.StringIO(data), "csv", home_root=str(home),
+                                      batch_size=1, workers=2, progress=lambda r: batches.append(r.rows))
+        assert report.rows == 6
+        assert report.imported == 2 and report.failed == 4
+        assert [line for line, _ in report.errors] == [4, 5, 6, 7]
+        assert len(batches) == 2
+        assert report.rate > 0
+
+        alice = manager.get_user("alice")
+        assert alice["directory"] == str(home / "alice")
+        assert alice["read_limit"] == 100 and alice["permissions"] == "elr"
+        assert verify_password("secret", alice["password"])
+        assert os.path.isdir(str(home / "alice")) and os.path.isdir(str(tmp_path / "bob"))
+        with open(manager.config_manager.users_path) as f:
+            assert len(json.load(f)) == 2
+
+    def test_existing_users_and_dry_run(self, tmp_path):
+        """测试已存在的用户默认跳过、--update时替换，dry_run不写入任何内容"""
+        manager = _manager(tmp_path)
+        home = str(tmp_path / "homes")
+        usersio.import_users(manager, io.StringIO('{"username": "a", "password": "x"}\n'), "jsonl",
+                             home_root=home)
+        data = '{"username": "a", "password": "y"}\n{"username": "b", "password": "y"}\nnot json\n'
+
+        report = usersio.import_users(manager, io.StringIO(data), "jsonl", home_root=home, dry_run=True)
+        assert (report.skipped, report.imported, report.failed) == (1, 0, 1)
+        assert manager.get_user("b") is None
+        assert not os.path.exists(os.path.join(home, "b"))
+
+        report = usersio.import_users(manager, io.StringIO(data), "jsonl", home_root=home, update=True)
+        assert (report.updated, report.imported) == (1, 1)
+        assert verify_password("y", manager.get_user("a")["password"])
+
+    def test_export_import_round_trip(self, tmp_path):
+        """测试导出的文件（密码为哈希）可以原样导入到sqlite用户存储"""
+        source = _manager(tmp_path / "src")
+        usersio.import_users(source, io.StringIO("username,password\nu1,p1\nu2,p2\n"), "csv",
+                             home_root=str(tmp_path / "homes"))
+        exported = io.StringIO()
+        assert usersio.export_users(source, exported, "jsonl") == 2
+
+        target = _manager(tmp_path / "dst", backend="sqlite")
+        try:
+            report = usersio.import_users(target, io.StringIO(exported.getvalue()), "jsonl")
+            assert report.imported == 2
+            assert target.get_user("u1")["password"] == source.get_user("u1")["password"]
+            assert is_password_hash(target.get_user("u2")["password"])
+        finally:
+            target.user_store.close()
+
+    def test_malformed_hash_and_iterations(self, tmp_path):
+        """测试格式错误的密码哈希作为无效行报告，明文密码使用指定的迭代次数"""
+        manager = _manager(tmp_path)
+        data = ("username,password\n"
+                "a,pbkdf2_sha256$\n"
+                "b,pbkdf2_sha256$many$c2FsdA==$ZGlnZXN0\n"
+                "c,scrypt$3$8$1$c2FsdA==$ZGlnZXN0\n"
+                "d,pbkdf2_sha256$1000$$ZGlnZXN0\n"
+                "e,plain\n")
+        report = usersio.import_users(manager, io.StringIO(data), "csv", home_root=str(tmp_path / "homes"),
+                                      iterations=1000)
+        assert report.imported == 1
+        assert [line for line, _ in report.errors] == [2, 3, 4, 5]
+        assert all("密码哈希格式无效" in message for _, message in report.errors)
+        stored = manager.get_user("e")["password"]
+        assert stored.startswith("pbkdf2_sha256$1000$")
+        assert verify_password("plain", stored)
+
+
+class TestCli:
+    """命令行导入导出测试类"""
+
+    def test_import_and_export_commands(self, tmp_path, capsys):
+        """测试import-users输出统计信息，有无效行时返回1；export-users写出CSV"""
+        manager = _manager(tmp_path)
+        args = ["--config", manager.config_manager.config_path, "--users", manager.config_manager.users_path]
+        source = tmp_path / "users.csv"
+        source.write_text("username,password\nx,1\ny,\n", encoding="utf-8")
+
+        assert main(["import-users", str(source), "--home-root", str(tmp_path / "homes")] + args) == 1
+        summary = json.loads(capsys.readouterr().out)
+        assert summary["imported"] == 1 and summary["failed"] == 1
+        assert "rows_per_sec" in summary
+
+        target = tmp_path / "out.csv"
+        assert main(["export-users", str(target)] + args) == 0
+        lines = target.read_text(encoding="utf-8").splitlines()
+        assert lines[0] == ",".join(usersio.FIELDS)
+        assert lines[1].startswith("x,pbkdf2_sha256$")
+
+    def test_unknown_format(self, tmp_path):
+        """测试无法判断格式时返回2"""
+        assert main(["import-users", str(tmp_path / "users.txt")]) == 2
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import pytest
+
+# 添加项目根目录到路径，以便引入模块
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from userstore import SqliteUserStore, UserListView, migrate_from_json
+from authorizer import LazyUserTable
+
+
+def _user(name, **extra):
+    user = {"username": name, "password": "pw", "directory": "/tmp", "permissions": "elr"}
+    user.update(extra)
+    return user
+
+
+class TestSqliteUserStore:
+    """SQLite用户存储测试类"""
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        store = SqliteUserStore(str(tmp_path / "users.db"))
+        yield store
+        store.close()
+
+    def test_crud(self, store):
+        """测试增删改查以及额外字段的保存"""
+        store.put(_user("alice", read_limit=100, quota=5))
+        user = store.get("alice")
+        assert user["read_limit"] == 100 and user["write_limit"] == 0
+        assert user["quota"] == 5
+        store.put(dict(user, permissions="elrw"))
+        assert store.get("alice")["permissions"] == "elrw"
+        assert store.count() == 1
+        assert store.delete("alice") is True
+        assert store.delete("alice") is False
+        assert store.get("alice") is None
+
+    def test_paging_and_iteration(self, store):
+        """测试按用户名排序的分页查询和分批迭代"""
+        with store.batch():
+            for i in range(2500):
+                store.put(_user(f"user{i:05d}", write_limit=1 if i == 7 else 0))
+        assert [u["username"] for u in store.page(10, 3)] == ["user00010", "user00011", "user00012"]
+        assert sum(1 for _ in store) == 2500
+        assert [u["username"] for u in store.limited_users()] == ["user00007"]
+
+        view = UserListView(store)
+        assert len(view) == 2500
+        assert view[-1]["username"] == "user02499"
+        assert [u["username"] for u in view[0:2]] == ["user00000", "user00001"]
+
+    def test_batch_rollback(self, store):
+        """测试批量修改出错时回滚，批量修改的线程能读到未提交的数据"""
+        store.put(_user("keep"))
+        with pytest.raises(RuntimeError):
+            with store.batch():
+                store.put(_user("temp"))
+                assert store.get("temp") is not None
+                store.delete("keep")
+                raise RuntimeError("中途失败")
+        assert store.get("temp") is None
+        assert store.get("keep") is not None
+
+    def test_migrate_from_json(self, store, tmp_path):
+        """测试从users.json迁移用户"""
+        users_path = tmp_path / "users.json"
+        users_path.write_text(json.dumps([_user("a"), _user("b", read_limit=5)]))
+        assert migrate_from_json(str(users_path), store) == 2
+        assert store.get("b")["read_limit"] == 5
+
+
+class TestLazyUserTable:
+    """按需读取的认证器用户表测试类"""
+
+    def test_loads_on_demand_and_invalidates(self):
+        """测试第一次访问时读取用户并缓存，失效后重新读取"""
+        users = {"alice": _user("alice")}
+        calls = []
+
+        def loader(username):
+            calls.append(username)
+            return users.get(username)
+
+        table = LazyUserTable(loader, cache_size=2)
+        assert "alice" in table
+        assert table["alice"]["perm"] == "elr"
+        assert calls == ["alice"]
+        assert "bob" not in table
+        assert table.get("bob") is None
+
+        users["alice"] = _user("alice", permissions="elrw")
+        assert table["alice"]["perm"] == "elr"
+        table.invalidate("alice")
+        assert table["alice"]["perm"] == "elrw"
+
+    def test_ttl(self):
+        """测试缓存超过ttl后重新读取（多进程引擎下其他进程的修改）"""
+        table = LazyUserTable(lambda username: _user(username), ttl=0)
+        table["x"]
+        table["x"]
+        assert len(table) == 1
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+带宽限制
+全局限速和按用户限速各使用一个令牌桶，同一个桶被所有相关会话共享。
+令牌允许透支: 每次收发数据后按透支的字节数计算需要暂停的时间，
+后来的会话需要等待之前所有会话的透支还清，因此并发会话之间按数据块轮流获得带宽。
+"""
+
+import time
+import threading
+
+
+class TokenBucket:
+    """线程安全的令牌桶
+
+    rate 为每秒补充的字节数，0表示不限速。
+    capacity 为最多可以积攒的字节数（允许的突发量），默认等于一秒的配额。
+    """
+
+    def __init__(self, rate=0, capacity=None):
+        self._lock = threading.Lock()
+        self.rate = 0
+        self.capacity = 0
+        self.tokens = 0.0
+        self.last = time.monotonic()
+        self.set_rate(rate, capacity)
+
+    def set_rate(self, rate, capacity=None):
+        """修改速率，正在进行的传输在下一个数据块时就会按新速率限速"""
+        with self._lock:
+            self.rate = max(0, int(rate or 0))
+            self.capacity = capacity if capacity is not None else self.rate
+            self.tokens = min(self.tokens, self.capacity)
+            self.last = time.monotonic()
+
+    def consume(self, amount):
+        """取出amount个令牌
+
+        返回:
+            float: 需要暂停的秒数，0表示不需要暂停
+        """
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            rate = self.rate
+            if not rate:
+                return 0.0
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * rate)
+            self.last = now
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / rate
+
+
+class BandwidthLimiter:
+    """管理全局和每个用户的上传/下载令牌桶
+
+    read 表示服务器接收数据（客户端上传），write 表示服务器发送数据（客户端下载），
+    与pyftpdlib ThrottledDTPHandler 的 read_limit / write_limit 含义一致。
+    桶对象在限速修改时原地更新，因此热加载的限速对正在进行的传输立即生效。
+    """
+
+    def __init__(self, read_limit=0, write_limit=0):
+        self._lock = threading.Lock()
+        self.global_read = TokenBucket(read_limit)
+        self.global_write = TokenBucket(write_limit)
+        self._users = {}
+
+    def configure(self, read_limit=0, write_limit=0):
+        """设置全局限速（字节/秒，0表示不限速）"""
+        self.global_read.set_rate(read_limit)
+        self.global_write.set_rate(write_limit)
+
+    def set_user_limits(self, username, read_limit=0, write_limit=0):
+        """设置用户限速（字节/秒，0表示不限速），同一用户的所有会话共享这个限额"""
+        read_bucket, write_bucket = self._user_buckets(username)
+        read_bucket.set_rate(read_limit)
+        write_bucket.set_rate(write_limit)
+
+    def remove_user(self, username):
+        """移除用户限速，正在进行的传输不再受该用户限额约束"""
+        with self._lock:
+            buckets = self._users.pop(username, None)
+        if buckets is not None:
+            for bucket in buckets:
+                bucket.set_rate(0)
+
+    def get_user_limits(self, username):
+        """返回用户当前的 (read_limit, write_limit)"""
+        with self._lock:
+            buckets = self._users.get(username)
+        if buckets is None:
+            return 0, 0
+        return buckets[0].rate, buckets[1].rate
+
+    def buckets_for(self, username):
+        """返回会话需要经过的 (接收令牌桶列表, 发送令牌桶列表)"""
+        read_bucket, write_bucket = self._user_buckets(username)
+        return [self.global_read, read_bucket], [self.global_write, write_bucket]
+
+    def _user_buckets(self, username):
+        with self._lock:
+            buckets = self._users.get(username)
+            if buckets is None:
+                buckets = self._users[username] = (TokenBucket(), TokenBucket())
+            return buckets
+
+
+def consume_all(buckets, amount):
+    """从多个令牌桶中取出令牌，返回需要暂停的最长时间"""
+    delay = 0.0
+    for bucket in buckets:
+        delay = max(delay, bucket.consume(amount))
+    return delay
+
+
+def lowest_rate(buckets):
+    """返回多个令牌桶中最低的非零速率，都不限速时返回0"""
+    rates = [bucket.rate for bucket in buckets if bucket.rate]
+    return min(rates) if rates else 0
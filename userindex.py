@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+用户列表索引
+为界面的用户列表维护按用户名和按主目录排序的两个有序数组，按前缀过滤时用二分查找定位
+匹配的区间，不需要扫描全部用户；过滤字段和排序字段相同时结果就是数组中的一段，
+不复制任何数据。增删改用户时用二分插入/删除单个元素，不重建索引。
+
+比较时不区分大小写，相同时再按原始字符串排序，保证顺序稳定。
+"""
+
+from bisect import bisect_left
+
+# 可以过滤和排序的字段
+FIELDS = ("username", "directory")
+# 比任何实际出现的字符都大，用于计算前缀区间的上界
+_MAX_CHAR = "\U0010ffff"
+
+
+def _key(value):
+    return value.casefold()
+
+
+class UserIndex:
+    """用户列表的内存索引，只保存界面显示需要的字段"""
+
+    def __init__(self, users=()):
+        self.rebuild(users)
+
+    def rebuild(self, users):
+        """用 users（可迭代的用户字典）重建索引"""
+        self._rows = {}
+        for user in users:
+            self._rows[user["username"]] = _row(user)
+        self._sorted = {}
+        for position, field in enumerate(FIELDS):
+            self._sorted[field] = sorted((_key(row[position]), row[0]) for row in self._rows.values())
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, username):
+        return username in self._rows
+
+    def get(self, username):
+        """返回 (用户名, 主目录, 权限)，不存在时返回None"""
+        return self._rows.get(username)
+
+    def put(self, user):
+        """添加用户或更新同名用户"""
+        username = user["username"]
+        if username in self._rows:
+            self.remove(username)
+        row = _row(user)
+        self._rows[username] = row
+        for position, field in enumerate(FIELDS):
+            keys = self._sorted[field]
+            entry = (_key(row[position]), username)
+            keys.insert(bisect_left(keys, entry), entry)
+
+    def remove(self, username):
+        """删除用户，返回是否存在"""
+        row = self._rows.pop(username, None)
+        if row is None:
+            return False
+        for position, field in enumerate(FIELDS):
+            keys = self._sorted[field]
+            entry = (_key(row[position]), username)
+            i = bisect_left(keys, entry)
+            if i < len(keys) and keys[i] == entry:
+                del keys[i]
+        return True
+
+    def query(self, prefix="", field="username", sort="username", descending=False):
+        """返回 field 以 prefix 开头（不区分大小写）、按 sort 排序的用户
+
+        结果是 UserQuery，只在访问时取出对应的行；索引修改后需要重新查询。
+        """
+        if field not in FIELDS or sort not in FIELDS:
+            raise ValueError(f"未知的用户字段: {field if field not in FIELDS else sort}")
+        if not prefix:
+            field = sort
+        keys = self._sorted[field]
+        if prefix:
+            prefix = _key(prefix)
+            lo = bisect_left(keys, (prefix,))
+            hi = bisect_left(keys, (prefix + _MAX_CHAR,))
+        else:
+            lo, hi = 0, len(keys)
+        if field == sort:
+            return UserQuery(self._rows, keys, lo, hi, descending)
+        # 按另一个字段排序: 只对匹配的用户排序
+        position = FIELDS.index(sort)
+        matched = sorted((_key(self._rows[username][position]), username) for _, username in keys[lo:hi])
+        return UserQuery(self._rows, matched, 0, len(matched), descending)
+
+
+class UserQuery:
+    """一次查询的结果，支持len()、下标和按区间取出行"""
+
+    def __init__(self, rows, keys, lo, hi, descending):
+        self._rows = rows
+        self._keys = keys
+        self._lo = lo
+        self._hi = hi
+        self._descending = descending
+
+    def __len__(self):
+        return self._hi - self._lo
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("查询结果下标超出范围")
+        if self._descending:
+            position = self._hi - 1 - index
+        else:
+            position = self._lo + index
+        return self._rows[self._keys[position][1]]
+
+    def rows(self, start, count):
+        """返回从 start 开始的最多 count 行"""
+        start = max(0, start)
+        stop = min(len(self), start + count)
+        return [self[i] for i in range(start, stop)]
+
+
+def _row(user):
+    return (user["username"], user["directory"], user.get("permissions", "elradfmwMT"))
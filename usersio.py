@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+批量导入/导出用户
+输入按行流式读取（CSV或JSON Lines），不会把整个文件读入内存；每一行在读取时完成校验，
+有效的行攒够 batch_size 个后，在线程池中并行创建用户目录、计算密码哈希，
+再在一次 batch_users() 中写入用户存储（users.json只保存一次 / SQLite一个事务）。
+
+CSV文件的第一行是列名，JSON Lines文件每行一个用户对象，可用的字段:
+  username, password, directory, permissions, read_limit, write_limit
+
+password 已经是本服务器生成的哈希（例如导出的文件）时校验格式后原样保存，否则视为明文并计算哈希。
+明文密码按 iterations 次pbkdf2计算哈希，默认10万次时每个密码约需几十毫秒CPU时间，
+大量明文用户（例如5万个、8个线程）的导入需要数分钟；可以临时降低迭代次数，之后让用户修改密码。
+directory 为空时使用 home_root/用户名。
+"""
+
+import os
+import csv
+import json
+import time
+import logging
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+from authorizer import PBKDF2_ITERATIONS, hash_password, is_password_hash, parse_password_hash
+
+FIELDS = ("username", "password", "directory", "permissions", "read_limit", "write_limit")
+FORMATS = ("csv", "jsonl")
+DEFAULT_PERMISSIONS = "elradfmwMT"
+VALID_PERMISSIONS = frozenset(DEFAULT_PERMISSIONS)
+# 报告中最多保留的错误行数
+MAX_REPORTED_ERRORS = 1000
+
+
+def detect_format(path, fmt=None):
+    """根据参数或文件扩展名确定格式"""
+    if fmt:
+        if fmt not in FORMATS:
+            raise ValueError(f"不支持的格式: {fmt}（可选: {', '.join(FORMATS)}）")
+        return fmt
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        return "csv"
+    if ext in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    raise ValueError(f"无法从文件名判断格式，请指定 --format: {path}")
+
+
+def read_rows(stream, fmt):
+    """逐行读取用户记录，生成 (行号, 字典)；无法解析的行生成 (行号, 错误信息字符串)"""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        if reader.fieldnames is None:
+            return
+        if "username" not in reader.fieldnames:
+            raise ValueError("CSV文件缺少 username 列")
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_no, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_no, f"JSON解析失败: {str(e)}"
+            continue
+        if not isinstance(row, dict):
+            yield line_no, "每行必须是一个JSON对象"
+            continue
+        yield line_no, row
+
+
+def _parse_limit(value, name):
+    if value is None or value == "":
+        return 0
+    if isinstance(value, str):
+        value = value.strip()
+        if not value.isdigit():
+            raise ValueError(f"{name} 必须是非负整数")
+        return int(value)
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        raise ValueError(f"{name} 必须是非负整数")
+    return value
+
+
+def validate_row(row, home_root=None):
+    """校验一行并返回规范化的用户字典，无效时抛出ValueError"""
+    username = str(row.get("username") or "").strip()
+    if not username:
+        raise ValueError("用户名不能为空")
+    if username == "anonymous" or "/" in username or "\\" in username:
+        raise ValueError(f"无效的用户名: {username}")
+    password = row.get("password")
+    if not password:
+        raise ValueError("密码不能为空")
+    if is_password_hash(password):
+        # 格式错误的哈希原样保存后任何密码都无法登录
+        try:
+            parse_password_hash(password)
+        except ValueError as e:
+            raise ValueError(f"密码哈希格式无效: {str(e)}")
+    directory = str(row.get("directory") or "").strip()
+    if not directory:
+        if not home_root:
+            raise ValueError("用户目录不能为空（或指定 home_root）")
+        directory = os.path.join(home_root, username)
+    permissions = str(row.get("permissions") or "").strip() or DEFAULT_PERMISSIONS
+    invalid = set(permissions) - VALID_PERMISSIONS
+    if invalid:
+        raise ValueError(f"无效的权限: {''.join(sorted(invalid))}")
+    return {
+        "username": username,
+        "password": str(password),
+        "directory": os.path.abspath(directory),
+        "permissions": permissions,
+        "read_limit": _parse_limit(row.get("read_limit"), "read_limit"),
+        "write_limit": _parse_limit(row.get("write_limit"), "write_limit"),
+    }
+
+
+def _prepare(user, iterations=PBKDF2_ITERATIONS):
+    """在线程池中执行: 创建用户目录，计算密码哈希（pbkdf2计算时会释放GIL）"""
+    os.makedirs(user["directory"], exist_ok=True)
+    if not is_password_hash(user["password"]):
+        user["password"] = hash_password(user["password"], iterations=iterations)
+    return user
+
+
+def _capture(func):
+    """让线程池中的异常作为结果返回，单个用户失败不影响同一批的其他用户"""
+    def wrapper(arg):
+        try:
+            return func(arg)
+        except Exception as e:
+            return e
+    return wrapper
+
+
+class ImportReport:
+    """导入结果统计"""
+
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.updated = 0
+        self.skipped = 0
+        self.failed = 0
+        self.errors = []  # [(行号, 错误信息)]，最多 MAX_REPORTED_ERRORS 条
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def error(self, line_no, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line_no, message))
+
+    @property
+    def rate(self):
+        """每秒处理的行数"""
+        return self.rows / self.elapsed if self.elapsed > 0 else 0.0
+
+    def to_dict(self):
+        return {"rows": self.rows, "imported": self.imported, "updated": self.updated,
+                "skipped": self.skipped, "failed": self.failed,
+                "elapsed": round(self.elapsed, 3), "rows_per_sec": round(self.rate, 1)}
+
+
+def import_users(manager, stream, fmt, home_root=None, update=False, dry_run=False,
+                 batch_size=1000, workers=8, iterations=PBKDF2_ITERATIONS, progress=None):
+    """从流中批量导入用户到 manager 的用户存储
+
+    参数:
+        manager: FTPServerManager
+        update: 为True时替换已存在的同名用户，否则跳过
+        dry_run: 只校验，不创建目录、不写入用户
+        batch_size: 每次提交到用户存储的用户数
+        workers: 创建目录和计算密码哈希的线程数
+        iterations: 明文密码的pbkdf2迭代次数
+        progress: 每提交一批后调用 progress(report)
+
+    返回:
+        ImportReport
+    """
+    logger = logging.getLogger("FTPServer.UsersIO")
+    report = ImportReport()
+    seen = set()
+    pending = []
+
+    def flush(pool):
+        batch = []
+        for (line_no, user), result in zip(pending, pool.map(_capture(partial(_prepare, iterations=iterations)), [u for _, u in pending])):
+            if isinstance(result, Exception):
+                report.error(line_no, f"{user['username']}: {str(result)}")
+            else:
+                batch.append((line_no, result))
+        pending.clear()
+        with manager.batch_users():
+            for line_no, user in batch:
+                existed = manager.get_user(user["username"]) is not None
+                if not manager.put_user(user):
+                    report.error(line_no, f"{user['username']}: 保存用户失败")
+                elif existed:
+                    report.updated += 1
+                else:
+                    report.imported += 1
+        report.elapsed = time.perf_counter() - report.started
+        if progress is not None:
+            progress(report)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="user-import") as pool:
+        for line_no, row in read_rows(stream, fmt):
+            report.rows += 1
+            if isinstance(row, str):
+                report.error(line_no, row)
+                continue
+            try:
+                user = validate_row(row, home_root)
+            except ValueError as e:
+                report.error(line_no, str(e))
+                continue
+            if user["username"] in seen:
+                report.error(line_no, f"重复的用户名: {user['username']}")
+                continue
+            seen.add(user["username"])
+            if not update and manager.get_user(user["username"]) is not None:
+                report.skipped += 1
+                continue
+            if dry_run:
+                continue
+            pending.append((line_no, user))
+            if len(pending) >= batch_size:
+                flush(pool)
+        if pending:
+            flush(pool)
+
+    report.elapsed = time.perf_counter() - report.started
+    logger.info(f"批量导入用户: 共 {report.rows} 行，新增 {report.imported}，更新 {report.updated}，"
+                f"跳过 {report.skipped}，失败 {report.failed}，{report.rate:.0f} 行/秒")
+    return report
+
+
+def export_users(manager, stream, fmt):
+    """把用户存储中的用户逐个写入流（密码为哈希），返回导出的用户数"""
+    count = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(stream, fieldnames=FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for user in manager.user_store:
+            writer.writerow({field: user.get(field, "") for field in FIELDS})
+            count += 1
+        return count
+    for user in manager.user_store:
+        stream.write(json.dumps(user, ensure_ascii=False) + "\n")
+        count += 1
+    return count
@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+用户存储后端
+FTPServerManager 通过 UserStore 接口增删改查用户，具体保存方式由 settings.json 中的
+"user_store" 决定:
+
+  json    用户保存在 users.json 中，启动时全部读入内存（默认，与之前的版本相同）
+  sqlite  用户保存在SQLite数据库中，按用户名主键索引查找，界面分页查询；
+          认证器在用户登录时才按需读取，启动时不加载全部用户
+
+第一次使用sqlite后端且数据库为空时，会自动从 users.json 迁移用户。
+"""
+
+import os
+import json
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+
+# 数据库中单独成列的用户字段，其他字段以JSON保存在 extra 列中
+USER_COLUMNS = ("username", "password", "directory", "permissions", "read_limit", "write_limit")
+DEFAULT_PERMISSIONS = "elradfmwMT"
+
+
+class UserStoreError(Exception):
+    """用户存储读写失败"""
+
+
+class UserStore:
+    """用户存储后端接口
+
+    用户以字典表示，至少包含 username、password、directory、permissions。
+    lazy 为True的后端不把全部用户读入内存，认证器按需查询。
+    """
+
+    lazy = False
+
+    def get(self, username):
+        """按用户名查找用户，不存在时返回None"""
+        raise NotImplementedError
+
+    def put(self, user):
+        """添加用户或替换同名用户，返回保存的用户字典"""
+        raise NotImplementedError
+
+    def delete(self, username):
+        """删除用户，返回是否存在"""
+        raise NotImplementedError
+
+    def count(self):
+        """返回用户总数"""
+        raise NotImplementedError
+
+    def page(self, offset, limit):
+        """返回从offset开始的最多limit个用户"""
+        raise NotImplementedError
+
+    def limited_users(self):
+        """返回设置了上传或下载限速的用户"""
+        return [user for user in self if user.get("read_limit") or user.get("write_limit")]
+
+    def __iter__(self):
+        raise NotImplementedError
+
+    def save(self):
+        """把修改写入磁盘，返回是否成功"""
+        return True
+
+    @contextmanager
+    def batch(self):
+        """批量修改，退出时统一保存，异常时回滚"""
+        yield self
+
+    def close(self):
+        pass
+
+
+class JsonUserStore(UserStore):
+    """保存在users.json中的用户，通过ConfigManager读写"""
+
+    def __init__(self, config_manager):
+        self.config_manager = config_manager
+
+    def get(self, username):
+        return self.config_manager.get_user(username)
+
+    def put(self, user):
+        return self.config_manager.put_user(user)
+
+    def delete(self, username):
+        return self.config_manager.delete_user(username) is not None
+
+    def count(self):
+        return len(self.config_manager.users)
+
+    def page(self, offset, limit):
+        return self.config_manager.users[offset:offset + limit]
+
+    def __iter__(self):
+        return iter(self.config_manager.users)
+
+    def save(self):
+        return self.config_manager.save_users()
+
+    def batch(self):
+        return self.config_manager.batch()
+
+
+class SqliteUserStore(UserStore):
+    """保存在SQLite数据库中的用户（线程安全）
+
+    用户名是主键，查找、增删改都走索引；分页按用户名排序。
+    读取和写入使用两个连接（WAL模式），批量导入期间其他线程的登录查询不会被阻塞；
+    批量修改的线程自己读取时使用写连接，能看到尚未提交的修改。
+    多进程引擎的子进程会重新打开自己的数据库连接。
+    """
+
+    lazy = True
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            password TEXT NOT NULL,
+            directory TEXT NOT NULL,
+            permissions TEXT NOT NULL,
+            read_limit INTEGER NOT NULL DEFAULT 0,
+            write_limit INTEGER NOT NULL DEFAULT 0,
+            extra TEXT
+        ) WITHOUT ROWID
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.logger = logging.getLogger("FTPServer.UserStore")
+        self._write_lock = threading.RLock()
+        self._read_lock = threading.Lock()
+        self._connections = {}
+        self._pid = None
+        self._batch_thread = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._write_lock:
+            self._write(self.SCHEMA)
+
+    def _connection(self, kind):
+        if self._pid != os.getpid():
+            self._connections = {}
+            self._pid = os.getpid()
+        conn = self._connections.get(kind)
+        if conn is None:
+            # 自动提交模式，批量修改时显式开启事务
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._connections[kind] = conn
+        return conn
+
+    def _write(self, sql, params=()):
+        """在持有写锁的情况下执行SQL"""
+        try:
+            return self._connection("write").execute(sql, params)
+        except sqlite3.Error as e:
+            raise UserStoreError(f"用户数据库操作失败: {str(e)}") from e
+
+    def _read(self, sql, params=()):
+        """执行查询并返回全部结果"""
+        if self._batch_thread == threading.get_ident():
+            with self._write_lock:
+                return self._write(sql, params).fetchall()
+        with self._read_lock:
+            try:
+                return self._connection("read").execute(sql, params).fetchall()
+            except sqlite3.Error as e:
+                raise UserStoreError(f"用户数据库查询失败: {str(e)}") from e
+
+    def get(self, username):
+        rows = self._read("SELECT * FROM users WHERE username = ?", (username,))
+        return _row_to_user(rows[0]) if rows else None
+
+    def put(self, user):
+        user = dict(user)
+        extra = {k: v for k, v in user.items() if k not in USER_COLUMNS}
+        params = (user["username"], user["password"], user["directory"],
+                  user.get("permissions", DEFAULT_PERMISSIONS), user.get("read_limit", 0),
+                  user.get("write_limit", 0), json.dumps(extra) if extra else None)
+        with self._write_lock:
+            self._write("INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?, ?, ?, ?)", params)
+        return user
+
+    def delete(self, username):
+        with self._write_lock:
+            cursor = self._write("DELETE FROM users WHERE username = ?", (username,))
+        return cursor.rowcount > 0
+
+    def count(self):
+        return self._read("SELECT COUNT(*) FROM users")[0][0]
+
+    def page(self, offset, limit):
+        rows = self._read("SELECT * FROM users ORDER BY username LIMIT ? OFFSET ?", (limit, offset))
+        return [_row_to_user(row) for row in rows]
+
+    def limited_users(self):
+        rows = self._read("SELECT * FROM users WHERE read_limit > 0 OR write_limit > 0")
+        return [_row_to_user(row) for row in rows]
+
+    def __iter__(self):
+        # 按用户名分批读取，不一次性把全部用户读入内存
+        rows = self._read("SELECT * FROM users ORDER BY username LIMIT 1000")
+        while rows:
+            for row in rows:
+                yield _row_to_user(row)
+            rows = self._read("SELECT * FROM users WHERE username > ? ORDER BY username LIMIT 1000",
+                              (rows[-1][0],))
+
+    @contextmanager
+    def batch(self):
+        with self._write_lock:
+            if self._batch_thread is not None:
+                yield self
+                return
+            self._write("BEGIN")
+            self._batch_thread = threading.get_ident()
+            try:
+                yield self
+            except BaseException:
+                self._batch_thread = None
+                self._write("ROLLBACK")
+                raise
+            self._batch_thread = None
+            self._write("COMMIT")
+
+    def close(self):
+        with self._write_lock, self._read_lock:
+            if self._pid == os.getpid():
+                for conn in self._connections.values():
+                    conn.close()
+            self._connections = {}
+
+
+def _row_to_user(row):
+    user = dict(zip(USER_COLUMNS, row[:len(USER_COLUMNS)]))
+    if row[len(USER_COLUMNS)]:
+        user.update(json.loads(row[len(USER_COLUMNS)]))
+    return user
+
+
+def migrate_from_json(users_path, store):
+    """把users.json中的用户导入到store中，返回导入的用户数"""
+    with open(users_path, 'rb') as f:
+        users = json.loads(f.read())
+    if not isinstance(users, list):
+        raise ValueError("用户文件的内容必须是列表")
+    with store.batch():
+        for user in users:
+            store.put(user)
+    return len(users)
+
+
+class UserListView:
+    """按需从用户存储读取的只读用户序列，支持len()、下标、切片和迭代"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def __len__(self):
+        return self.store.count()
+
+    def __iter__(self):
+        return iter(self.store)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return self.store.page(start, max(0, stop - start))[::step]
+            return self.store.page(start, max(0, stop - start))
+        if index < 0:
+            index += len(self)
+        users = self.store.page(index, 1)
+        if not users:
+            raise IndexError("用户下标超出范围")
+        return users[0]
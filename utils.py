@@ -65,3 +65,11 @@ def debounce(wait):
                 
         return debounced
     return decorator
+
+
+def format_bytes(num):
+    """把字节数格式化为便于阅读的字符串，例如 1.5 MB"""
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(num) < 1024 or unit == "GB":
+            return f"{num:.0f} {unit}" if unit == "B" else f"{num:.1f} {unit}"
+        num /= 1024.0
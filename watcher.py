@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import logging
+import threading
+
+
+class ConfigWatcher:
+    """配置文件监视器
+
+    在后台线程中定期检查文件的修改时间和大小，文件被外部编辑后
+    调用对应的回调函数。使用轮询而不是inotify，因此在Windows上同样可用。
+    """
+
+    def __init__(self, callbacks, interval=2.0):
+        """初始化监视器
+
+        参数:
+            callbacks: {文件路径: 回调函数} 字典，回调不带参数
+            interval: 轮询间隔（秒）
+        """
+        self.callbacks = dict(callbacks)
+        self.interval = interval
+        self.logger = logging.getLogger("FTPServer.Watcher")
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._signatures = {path: self._signature(path) for path in self.callbacks}
+
+    @staticmethod
+    def _signature(path):
+        """返回文件的 (修改时间, 大小)，文件不存在时返回None"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def start(self):
+        """启动后台轮询线程"""
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="config-watcher")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """停止后台轮询线程"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+    def refresh(self, path=None):
+        """重新记录文件状态，用于忽略程序自身保存引起的变化"""
+        for p in ([path] if path else list(self.callbacks)):
+            self._signatures[p] = self._signature(p)
+
+    def check(self):
+        """检查一次所有文件，返回发生变化的文件路径列表"""
+        changed = []
+        for path, callback in self.callbacks.items():
+            signature = self._signature(path)
+            if signature is None or signature == self._signatures.get(path):
+                continue
+            self._signatures[path] = signature
+            changed.append(path)
+            try:
+                callback()
+            except Exception as e:
+                self.logger.error(f"处理配置文件变化失败 ({path}): {str(e)}")
+        return changed
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.check()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+SO_REUSEPORT工作进程
+服务引擎 "reuseport" 下，主进程不接受连接，只启动 workers 个工作进程并监督它们:
+
+- 每个工作进程都是一个完整的 FTPServerManager（单线程异步引擎），在每个监听地址上各自
+  创建一个设置了 SO_REUSEPORT 的套接字，由内核把新连接分配到各个进程，各进程有独立的
+  IO循环，不共享任何锁
+- 被动端口范围按进程平均分段，每个进程只使用自己的一段，不会争用同一个端口；
+  最大连接数也按进程平分
+- 工作进程用spawn方式启动（不继承主进程的线程和锁），日志记录、连接快照和指标增量
+  通过同一个进程间队列发送给主进程：日志写入主进程的日志管线，快照合并后发布，
+  指标累加到主进程的 Metrics 中
+- 主进程修改配置或用户后向工作进程发送 SIGHUP / SIGUSR1，工作进程重新读取配置和用户；
+  排空停止时发送 SIGUSR2，工作进程等正在进行的传输结束（最多 drain_timeout 秒）后退出；
+  立即停止时发送 SIGTERM；工作进程意外退出时自动重新启动
+"""
+
+import os
+import sys
+import time
+import queue
+import signal
+import logging
+import threading
+import multiprocessing
+from collections import namedtuple
+from logging.handlers import QueueHandler
+
+from snapshot import SnapshotPublisher
+
+# 工作进程的身份: 序号、进程总数和发送消息的队列
+WorkerInfo = namedtuple("WorkerInfo", ["index", "count", "channel"])
+
+# 等待工作进程启动的最长时间（秒）
+START_TIMEOUT = 30
+# 工作进程意外退出后至少间隔这么多秒才重新启动
+RESPAWN_DELAY = 1.0
+
+
+def _worker_main(config_path, users_path, index, count, channel, parent_pid):
+    """工作进程入口: 启动服务器，定期向主进程报告状态，直到收到SIGTERM或主进程退出"""
+    from server import FTPServerManager
+
+    # 先安装信号处理函数，启动期间收到的重新加载信号不会终止进程
+    # 信号处理函数只设置标志并唤醒主循环，由主循环执行对应的操作
+    wake = threading.Event()
+    stop_event = threading.Event()
+    reload_config = threading.Event()
+    reload_users = threading.Event()
+    drain = threading.Event()
+
+    def on_signal(event):
+        def handler(signum, frame):
+            event.set()
+            wake.set()
+        return handler
+
+    signal.signal(signal.SIGTERM, on_signal(stop_event))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C由主进程处理
+    signal.signal(signal.SIGHUP, on_signal(reload_config))
+    signal.signal(signal.SIGUSR1, on_signal(reload_users))
+    signal.signal(signal.SIGUSR2, on_signal(drain))
+
+    manager = FTPServerManager(config_path, users_path,
+                               worker=WorkerInfo(index, count, channel))
+    ok, error_msg = manager.start_server()
+    if not ok:
+        channel.put(("error", index, error_msg))
+        return 1
+    channel.put(("ready", index, os.getpid()))
+
+    def report():
+        gauges = {}
+        for gauge in manager.metrics.gauges:
+            gauges.update(gauge())
+        channel.put(("status", index, manager.get_snapshot().connections,
+                     manager.metrics.drain(), gauges))
+
+    interval = manager.config.get("snapshot_interval", 1.0)
+    while True:
+        wake.wait(interval)
+        wake.clear()
+        if stop_event.is_set():
+            break
+        if reload_config.is_set():
+            reload_config.clear()
+            manager.load_config()
+            reload_users.set()
+        if reload_users.is_set():
+            reload_users.clear()
+            manager.reload_users()
+        if drain.is_set() and not manager.draining and manager.running:
+            # 排空结束、服务器停止后退出
+            manager.drain_server(done=lambda result: on_signal(stop_event)(None, None))
+        if os.getppid() != parent_pid or not manager.server_thread.is_alive():
+            break
+        report()
+    if manager.running:
+        manager.stop_server()
+    report()
+    manager.user_store.close()
+    return 0
+
+
+def _run_worker(*args):
+    sys.exit(_worker_main(*args))
+
+
+class WorkerPool:
+    """主进程中的工作进程监督者"""
+
+    def __init__(self, config_path, users_path, count, metrics, interval=1.0):
+        self.config_path = os.path.abspath(config_path)
+        self.users_path = os.path.abspath(users_path)
+        self.count = count
+        self.metrics = metrics
+        self.logger = logging.getLogger("FTPServer.Workers")
+        self.snapshots = SnapshotPublisher(self._merged_connections, interval)
+        self._context = multiprocessing.get_context("spawn")
+        self._channel = self._context.Queue()
+        self._processes = [None] * count
+        self._spawned_at = [0.0] * count
+        self._connections = {}   # 序号 -> 该进程最近一次报告的连接
+        self._gauges = {}        # 序号 -> 该进程最近一次报告的瞬时指标
+        self._ready = {}         # 启动期间: 序号 -> (是否成功, 错误信息)
+        self._ready_changed = threading.Condition()
+        self._stopping = False
+        self.thread = threading.Thread(target=self._run, name="worker-supervisor", daemon=True)
+
+    @property
+    def pids(self):
+        return [p.pid for p in self._processes if p is not None and p.is_alive()]
+
+    def gauge(self, name):
+        """所有工作进程最近一次报告的某个瞬时指标之和"""
+        return sum(gauges.get(name, 0) for gauges in list(self._gauges.values()))
+
+    def start(self, timeout=START_TIMEOUT):
+        """启动所有工作进程并等待它们开始监听，返回 (成功, 错误信息)"""
+        self.thread.start()
+        for index in range(self.count):
+            self._spawn(index)
+        deadline = time.monotonic() + timeout
+        with self._ready_changed:
+            while len(self._ready) < self.count:
+                remaining = deadline - time.monotonic()
+                failed = [message for ok, message in self._ready.values() if not ok]
+                failed += self._exited_before_ready()
+                if failed or remaining <= 0:
+                    break
+                self._ready_changed.wait(min(remaining, 0.5))
+            failed = [message for ok, message in self._ready.values() if not ok]
+            failed += self._exited_before_ready()
+            ready = len(self._ready)
+        if failed or ready < self.count:
+            self.stop()
+            return False, failed[0] if failed else "等待工作进程启动超时"
+        self.logger.info(f"已启动 {self.count} 个工作进程: {', '.join(map(str, self.pids))}")
+        return True, None
+
+    def _exited_before_ready(self):
+        """启动期间没有报告就退出的工作进程（例如无法导入模块）"""
+        return [f"工作进程 {index} 启动时退出，退出码 {process.exitcode}"
+                for index, process in enumerate(self._processes)
+                if index not in self._ready and process is not None and not process.is_alive()]
+
+    def _spawn(self, index):
+        process = self._context.Process(
+            target=_run_worker, name=f"ftp-worker-{index}",
+            args=(self.config_path, self.users_path, index, self.count, self._channel, os.getpid()))
+        process.daemon = True
+        process.start()
+        self._processes[index] = process
+        self._spawned_at[index] = time.monotonic()
+
+    def signal_all(self, signum):
+        """向所有存活的工作进程发送信号"""
+        for process in self._processes:
+            if process is not None and process.is_alive():
+                try:
+                    os.kill(process.pid, signum)
+                except OSError:
+                    pass
+
+    def reload_config(self):
+        """让工作进程重新读取配置文件和用户"""
+        self.signal_all(signal.SIGHUP)
+
+    def reload_users(self):
+        """让工作进程重新读取用户"""
+        self.signal_all(signal.SIGUSR1)
+
+    def drain(self):
+        """让工作进程停止接受新连接，等正在进行的传输结束后退出"""
+        self._stopping = True
+        self.signal_all(signal.SIGUSR2)
+
+    def stop(self, timeout=10):
+        """停止所有工作进程，等待它们关闭连接并发送最后的指标"""
+        self._stopping = True
+        self.signal_all(signal.SIGTERM)
+        deadline = time.monotonic() + timeout
+        for process in self._processes:
+            if process is None:
+                continue
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                self.logger.warning(f"工作进程 {process.pid} 没有及时退出，强制结束")
+                process.kill()
+                process.join(1)
+        # 收完工作进程退出前发送的消息后再停止监督线程
+        self._channel.put(None)
+        self.thread.join(timeout=5)
+        self._channel.close()
+        self.snapshots.stop()
+
+    def _merged_connections(self):
+        connections = []
+        for index, items in sorted(self._connections.items()):
+            # 会话编号只在进程内唯一，加上进程序号作为前缀
+            connections.extend(c._replace(id=f"{index}-{c.id}") for c in items)
+        return connections
+
+    def _run(self):
+        """监督线程: 处理工作进程的消息，重新启动意外退出的进程"""
+        while True:
+            try:
+                message = self._channel.get(timeout=0.5)
+            except queue.Empty:
+                message = ()
+            except (OSError, ValueError, EOFError):
+                return
+            if message is None:
+                return
+            if isinstance(message, logging.LogRecord):
+                logging.getLogger(message.name).handle(message)
+            elif message:
+                self._handle(message)
+            if not self._stopping:
+                self._check_processes()
+
+    def _handle(self, message):
+        kind, index = message[0], message[1]
+        if kind == "status":
+            _, _, connections, counters, gauges = message
+            self.metrics.merge(counters)
+            self._gauges[index] = gauges
+            # 排空期间也要更新，主进程据此判断传输是否都已结束
+            self._connections[index] = connections
+            self.snapshots.publish()
+        elif kind in ("ready", "error"):
+            with self._ready_changed:
+                self._ready[index] = (kind == "ready", message[2] if kind == "error" else None)
+                self._ready_changed.notify_all()
+            if kind == "error":
+                self.logger.error(f"工作进程 {index} 启动失败: {message[2]}")
+
+    def _check_processes(self):
+        for index, process in enumerate(self._processes):
+            if process is None or process.is_alive() or not self._ready.get(index, (False,))[0]:
+                continue
+            if time.monotonic() - self._spawned_at[index] < RESPAWN_DELAY:
+                continue
+            self.logger.error(f"工作进程 {index}（{process.pid}）意外退出，退出码 {process.exitcode}，正在重新启动")
+            self._connections.pop(index, None)
+            self._gauges.pop(index, None)
+            self._spawn(index)
+
+
+def install_worker_logging(channel, level="INFO"):
+    """工作进程中把所有日志记录发送给主进程，由主进程的日志管线统一写入"""
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(channel))
+    root.setLevel(getattr(logging, str(level).upper(), logging.INFO))